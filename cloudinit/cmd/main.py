@@ -21,7 +21,6 @@ from cloudinit import patcher
 patcher.patch()  # noqa
 
 from cloudinit import log as logging
-from cloudinit import netinfo
 from cloudinit import signal_handler
 from cloudinit import sources
 from cloudinit import stages
@@ -33,6 +32,7 @@ from cloudinit import warnings
 
 from cloudinit import reporting
 from cloudinit.reporting import events
+from cloudinit.reporting import journal
 
 from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
                                 CLOUD_CONFIG)
@@ -49,6 +49,9 @@ WELCOME_MSG_TPL = ("Cloud-init v. ${version} running '${action}' at "
 # Module section template
 MOD_SECTION_TPL = "cloud_%s_modules"
 
+# DMI snapshot shared by the stages of one boot (under the run dir)
+DMI_CACHE_FN = "dmi.json"
+
 # Things u can query on
 QUERY_DATA_TYPES = [
     'data',
@@ -250,6 +253,7 @@ def main_init(name, args):
     init = stages.Init(ds_deps=deps, reporter=args.reporter)
     # Stage 1
     init.read_cfg(extract_fns(args))
+    util.set_dmi_cache_file(os.path.join(init.paths.run_dir, DMI_CACHE_FN))
     # Stage 2
     outfmt = None
     errfmt = None
@@ -289,8 +293,19 @@ def main_init(name, args):
     mode = sources.DSMODE_LOCAL if args.local else sources.DSMODE_NETWORK
 
     if mode == sources.DSMODE_NETWORK:
+        # netinfo (and prettytable) is only needed here, import it late
+        from cloudinit import netinfo
         existing = "trust"
-        sys.stderr.write("%s\n" % (netinfo.debug_info()))
+        if util.get_cfg_option_str(init.cfg, 'netinfo_format',
+                                   'table') == 'json':
+            netinfo_path = os.path.join(path_helper.run_dir, 'netinfo.json')
+            try:
+                netinfo.write_json_info(netinfo_path)
+            except Exception:
+                util.logexc(LOG, "Failed writing network info to %s",
+                            netinfo_path)
+        else:
+            sys.stderr.write("%s\n" % (netinfo.debug_info()))
         LOG.debug(("Checking to see if files that we need already"
                    " exist from a previous run that would allow us"
                    " to stop early."))
@@ -473,6 +488,7 @@ def main_modules(action_name, args):
     init = stages.Init(ds_deps=[], reporter=args.reporter)
     # Stage 1
     init.read_cfg(extract_fns(args))
+    util.set_dmi_cache_file(os.path.join(init.paths.run_dir, DMI_CACHE_FN))
     # Stage 2
     try:
         init.fetch(existing="trust")
@@ -681,6 +697,34 @@ def status_wrapper(name, args, data_d=None, link_d=None):
     return len(v1[mode]['errors'])
 
 
+def main_analyze(name, args):
+    """Report boot timings recorded by the 'journal' reporting handler."""
+    journals = journal.list_journals(args.journal_dir)
+    if args.boot:
+        path = journal.journal_path(args.journal_dir, args.boot)
+        if path not in journals:
+            sys.stderr.write("No event journal for boot '%s' in %s\n" %
+                             (args.boot, args.journal_dir))
+            return 1
+    elif journals:
+        path = journals[-1]
+    else:
+        sys.stderr.write("No event journals found in %s\n" %
+                         args.journal_dir)
+        return 1
+
+    previous = None
+    index = journals.index(path)
+    if index > 0:
+        previous = journal.summarize(journal.load_journal(journals[index - 1]))
+        sys.stdout.write("Compared to boot %s\n" % os.path.basename(
+            journals[index - 1])[:-len(journal.JOURNAL_SUFFIX)])
+    summary = journal.summarize(journal.load_journal(path))
+    sys.stdout.write(journal.format_summary(summary, previous=previous,
+                                            top=args.top))
+    return 0
+
+
 def main_features(name, args):
     sys.stdout.write('\n'.join(sorted(version.FEATURES)) + '\n')
 
@@ -775,6 +819,22 @@ def main(sysv_args=None):
                                        ' upon'))
     parser_dhclient.set_defaults(action=('dhclient_hook', dhclient_hook))
 
+    parser_analyze = subparsers.add_parser(
+        'analyze', help=('show boot timings recorded by the journal'
+                         ' reporting handler'))
+    parser_analyze.add_argument("--journal-dir", action="store",
+                                help=("directory holding event journals"
+                                      " (default: %(default)s)"),
+                                default=journal.DEFAULT_JOURNAL_DIR)
+    parser_analyze.add_argument("--boot", action="store",
+                                help=("boot id to report on"
+                                      " (default: the most recent boot)"))
+    parser_analyze.add_argument("--top", action="store", type=int,
+                                help=("number of slowest modules to show"
+                                      " (default: %(default)s)"),
+                                default=10)
+    parser_analyze.set_defaults(action=('analyze', main_analyze))
+
     parser_features = subparsers.add_parser('features',
                                             help=('list defined features'))
     parser_features.set_defaults(action=('features', main_features))
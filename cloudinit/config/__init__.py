@@ -42,6 +42,10 @@ def fixup_module(mod, def_freq=PER_INSTANCE):
         setattr(mod, 'distros', [])
     if not hasattr(mod, 'osfamilies'):
         setattr(mod, 'osfamilies', [])
+    if not hasattr(mod, 'resources'):
+        setattr(mod, 'resources', None)
+    if not hasattr(mod, 'depends'):
+        setattr(mod, 'depends', [])
     return mod
 
 # vi: ts=4 expandtab
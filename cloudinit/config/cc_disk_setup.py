@@ -102,6 +102,7 @@ from cloudinit import util
 import logging
 import os
 import shlex
+import stat
 
 frequency = PER_INSTANCE
 
@@ -110,9 +111,9 @@ UDEVADM_CMD = util.which('udevadm')
 SFDISK_CMD = util.which("sfdisk")
 SGDISK_CMD = util.which("sgdisk")
 LSBLK_CMD = util.which("lsblk")
-BLKID_CMD = util.which("blkid")
 BLKDEV_CMD = util.which("blockdev")
 WIPEFS_CMD = util.which("wipefs")
+UDEV_DATA_DIR = "/run/udev/data"
 
 LANG_C_ENV = {'LANG': 'C'}
 
@@ -124,6 +125,8 @@ def handle(_name, cfg, cloud, log, _args):
     See doc/examples/cloud-config-disk-setup.txt for documentation on the
     format.
     """
+    # Devices may have changed since the index was built (bootcmd, ...)
+    util.invalidate_blkid_devices()
     disk_setup = cfg.get("disk_setup")
     if isinstance(disk_setup, dict):
         update_disk_setup_devices(disk_setup, cloud.device_name_to_device)
@@ -301,30 +304,23 @@ def check_fs(device):
     """
     Check if the device has a filesystem on it
 
-    Output of blkid is generally something like:
-    /dev/sda: LABEL="Backup500G" UUID="..." TYPE="ext4"
+    The answer comes from the blkid device index, which is invalidated
+    whenever this module changes partitions or filesystems.  A device that
+    is not in the index (it may have appeared since) is probed directly.
 
-    Return values are device, label, type, uuid
+    Return values are label, type, uuid
     """
-    out, label, fs_type, uuid = None, None, None, None
-
-    blkid_cmd = [BLKID_CMD, '-c', '/dev/null', device]
     try:
-        out, _err = util.subp(blkid_cmd, rcs=[0, 2])
+        devices = util.blkid_devices()
+        tags = devices.get(device)
+        if tags is None:
+            tags = devices.get(os.path.realpath(device))
+        if tags is None:
+            tags = util.blkid_probe(device)
     except Exception as e:
         raise Exception("Failed during disk check for %s\n%s" % (device, e))
 
-    if out:
-        if len(out.splitlines()) == 1:
-            for key, value in value_splitter(out, start=1):
-                if key.lower() == 'label':
-                    label = value
-                elif key.lower() == 'type':
-                    fs_type = value
-                elif key.lower() == 'uuid':
-                    uuid = value
-
-    return label, fs_type, uuid
+    return tags.get('LABEL'), tags.get('TYPE'), tags.get('UUID')
 
 
 def is_filesystem(device):
@@ -687,6 +683,7 @@ def read_parttbl(device):
         util.logexc(LOG, "Failed reading the partition table %s" % e)
 
     udevadm_settle()
+    util.invalidate_blkid_devices()
 
 
 def exec_mkpart_mbr(device, layout):
@@ -737,17 +734,43 @@ def exec_mkpart(table_type, device, layout):
     return get_dyn_func("exec_mkpart_%s", table_type, device, layout)
 
 
-def udevadm_settle():
-    util.subp(['udevadm', 'settle'])
+def udevadm_settle(exists=None):
+    """Wait for udev to handle the events it has queued.
+
+    If exists is given, stop waiting as soon as that path exists instead of
+    waiting on events for unrelated devices too.
+    """
+    settle_cmd = ['udevadm', 'settle']
+    if exists:
+        settle_cmd.append('--exit-if-exists=%s' % exists)
+    util.subp(settle_cmd)
+
+
+def udev_db_path(device):
+    """Return the path udev writes once it has processed device."""
+    try:
+        st = os.stat(device)
+    except OSError:
+        return None
+    if not stat.S_ISBLK(st.st_mode):
+        return None
+    return os.path.join(UDEV_DATA_DIR, 'b%d:%d' % (os.major(st.st_rdev),
+                                                   os.minor(st.st_rdev)))
 
 
 def assert_and_settle_device(device):
     """Assert that device exists and settle so it is fully recognized."""
     if not os.path.exists(device):
-        udevadm_settle()
+        udevadm_settle(exists=device)
         if not os.path.exists(device):
             raise RuntimeError("Device %s did not exist and was not created "
                                "with a udevamd settle." % device)
+        # The device has only just appeared, once udev has written its
+        # database entry the add event is done and lsblk will see it.
+        db_path = udev_db_path(device)
+        if db_path:
+            udevadm_settle(exists=db_path)
+            return
 
     # Whether or not the device existed above, it is possible that udev
     # events that would populate udev database (for reading by lsdname) have
@@ -996,5 +1019,7 @@ def mkfs(fs_cfg):
         util.subp(fs_cmd, shell=shell)
     except Exception as e:
         raise Exception("Failed to exec of '%s':\n%s" % (fs_cmd, e))
+    finally:
+        util.invalidate_blkid_devices()
 
 # vi: ts=4 expandtab
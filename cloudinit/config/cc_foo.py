@@ -46,6 +46,13 @@ from cloudinit.settings import PER_INSTANCE
 #    a warning out if a module is being ran on a untested distribution for
 #    informational purposes. If non existent all distros are assumed and
 #    no warning occurs.
+# 4. A optional 'resources' array/set/tuple naming what the module touches
+#    (for example 'timezone' or 'packages'). When 'module_workers' is more
+#    than 1, consecutive modules that declare resources may run concurrently
+#    with each other, except those sharing a resource, which keep their
+#    configured order. Modules without 'resources' always run on their own.
+# 5. A optional 'depends' array/set/tuple of module names that, when listed
+#    earlier in the same section, must finish before this module starts.
 
 frequency = PER_INSTANCE
 
@@ -28,6 +28,8 @@ specified by the datasource.
 
 from cloudinit import util
 
+resources = ["locale"]
+
 
 def handle(name, cfg, cloud, log, args):
     if len(args) != 0:
@@ -52,6 +52,7 @@ frequency = PER_INSTANCE
 NTP_CONF = '/etc/ntp.conf'
 NR_POOL_SERVERS = 4
 distros = ['centos', 'debian', 'fedora', 'opensuse', 'ubuntu']
+resources = ['ntp', 'packages']
 
 
 # The schema definition for each cloud-config module is a strict contract for
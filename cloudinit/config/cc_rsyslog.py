@@ -185,6 +185,8 @@ import six
 from cloudinit import log as logging
 from cloudinit import util
 
+resources = ["rsyslog"]
+
 DEF_FILENAME = "20-cloud-config.conf"
 DEF_DIR = "/etc/rsyslog.d"
 DEF_RELOAD = "auto"
@@ -34,6 +34,9 @@ from cloudinit.distros import ug_util
 from cloudinit import ssh_util
 from cloudinit import util
 
+# only writes its fingerprint table to the console
+resources = ["console"]
+
 
 def _split_hash(bin_hash):
     split_up = []
@@ -79,7 +79,9 @@ class Distro(object):
         LOG.debug("Selected renderer '%s' from priority list: %s",
                   name, priority)
         renderer = render_cls(config=self.renderer_configs.get(name))
-        renderer.render_network_config(network_config=network_config)
+        changed = renderer.render_network_config(network_config=network_config)
+        LOG.debug("Network config files changed by '%s' renderer: %s",
+                  name, changed)
         return []
 
     def _find_tz_file(self, tz):
@@ -6,6 +6,8 @@
 
 import functools
 import json
+import threading
+import time
 
 from cloudinit import log as logging
 from cloudinit import url_helper
@@ -14,6 +16,9 @@ from cloudinit import util
 LOG = logging.getLogger(__name__)
 SKIP_USERDATA_CODES = frozenset([url_helper.NOT_FOUND])
 
+# Maximum number of metadata urls fetched at the same time while crawling.
+CRAWL_MAX_WORKERS = 8
+
 
 class MetadataLeafDecoder(object):
     """Decodes a leaf blob into something meaningful."""
@@ -48,7 +53,8 @@ class MetadataLeafDecoder(object):
 # See: http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/
 #         ec2-instance-metadata.html
 class MetadataMaterializer(object):
-    def __init__(self, blob, base_url, caller, leaf_decoder=None):
+    def __init__(self, blob, base_url, caller, leaf_decoder=None,
+                 max_workers=1):
         self._blob = blob
         self._md = None
         self._base_url = base_url
@@ -57,6 +63,10 @@ class MetadataMaterializer(object):
             self._leaf_decoder = MetadataLeafDecoder()
         else:
             self._leaf_decoder = leaf_decoder
+        self._max_workers = max(1, max_workers or 1)
+        self._timings_lock = threading.Lock()
+        # List of (url, seconds) for every request made while crawling.
+        self.timings = []
 
     def _parse(self, blob):
         leaves = {}
@@ -104,31 +114,58 @@ class MetadataMaterializer(object):
     def materialize(self):
         if self._md is not None:
             return self._md
+        start_time = time.time()
         self._md = self._materialize(self._blob, self._base_url)
+        if self.timings:
+            (slowest_url, slowest) = max(self.timings, key=lambda t: t[1])
+            LOG.debug("Crawled %s urls under %s with %s workers in %.3f"
+                      " seconds (slowest %.3f seconds: %s)",
+                      len(self.timings), self._base_url, self._max_workers,
+                      time.time() - start_time, slowest, slowest_url)
         return self._md
 
+    def _timed_call(self, url):
+        start_time = time.time()
+        try:
+            return self._caller(url)
+        finally:
+            elapsed = time.time() - start_time
+            with self._timings_lock:
+                self.timings.append((url, elapsed))
+            LOG.debug("Fetched %s in %.3f seconds", url, elapsed)
+
     def _materialize(self, blob, base_url):
-        (leaves, children) = self._parse(blob)
-        child_contents = {}
-        for c in children:
-            child_url = url_helper.combine_url(base_url, c)
-            if not child_url.endswith("/"):
-                child_url += "/"
-            child_blob = self._caller(child_url)
-            child_contents[c] = self._materialize(child_blob, child_url)
-        leaf_contents = {}
-        for (field, resource) in leaves.items():
-            leaf_url = url_helper.combine_url(base_url, resource)
-            leaf_blob = self._caller(leaf_url)
-            leaf_contents[field] = self._leaf_decoder(field, leaf_blob)
+        # Crawl the tree one level at a time, fetching every child listing
+        # and leaf of that level concurrently; the resulting dict is the same
+        # as that of a depth-first walk.
         joined = {}
-        joined.update(child_contents)
-        for field in leaf_contents.keys():
-            if field in joined:
-                LOG.warning("Duplicate key found in results from %s",
-                            base_url)
-            else:
-                joined[field] = leaf_contents[field]
+        pending = [(blob, base_url, joined)]
+        while pending:
+            fetches = []
+            for (dir_blob, dir_url, contents) in pending:
+                (leaves, children) = self._parse(dir_blob)
+                for c in children:
+                    child_url = url_helper.combine_url(dir_url, c)
+                    if not child_url.endswith("/"):
+                        child_url += "/"
+                    contents[c] = {}
+                    fetches.append((c, child_url, dir_url, contents, True))
+                for (field, resource) in leaves.items():
+                    leaf_url = url_helper.combine_url(dir_url, resource)
+                    fetches.append((field, leaf_url, dir_url, contents, False))
+            blobs = util.map_threaded(self._timed_call,
+                                      [fetch[1] for fetch in fetches],
+                                      max_workers=self._max_workers)
+            pending = []
+            for (fetch, fetched) in zip(fetches, blobs):
+                (name, url, dir_url, contents, is_child) = fetch
+                if is_child:
+                    pending.append((fetched, url, contents[name]))
+                elif name in contents:
+                    LOG.warning("Duplicate key found in results from %s",
+                                dir_url)
+                else:
+                    contents[name] = self._leaf_decoder(name, fetched)
         return joined
 
 
@@ -167,7 +204,7 @@ def get_instance_userdata(api_version='latest',
 def get_instance_metadata(api_version='latest',
                           metadata_address='http://169.254.169.254',
                           ssl_details=None, timeout=5, retries=5,
-                          leaf_decoder=None):
+                          leaf_decoder=None, max_workers=CRAWL_MAX_WORKERS):
     md_url = url_helper.combine_url(metadata_address, api_version)
     # Note, 'meta-data' explicitly has trailing /.
     # this is required for CloudStack (LP: #1356855)
@@ -183,7 +220,8 @@ def get_instance_metadata(api_version='latest',
         response = caller(md_url)
         materializer = MetadataMaterializer(response.contents,
                                             md_url, mcaller,
-                                            leaf_decoder=leaf_decoder)
+                                            leaf_decoder=leaf_decoder,
+                                            max_workers=max_workers)
         md = materializer.materialize()
         if not isinstance(md, (dict)):
             md = {}
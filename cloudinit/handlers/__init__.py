@@ -41,6 +41,13 @@ PART_HANDLER_FN_TMPL = 'part-handler-%03d'
 # For parts without filenames
 PART_FN_TPL = 'part-%03d'
 
+# Large part payloads are kept in a file rather than in the message itself,
+# this header of the (then empty) part names that file.
+PAYLOAD_FILE_HEADER = 'X-Cloud-Init-Payload-File'
+
+# How much of a payload is looked at to find its content type
+TYPE_SNIFF_SIZE = 64
+
 # Different file beginnings to there content type
 INCLUSION_TYPES_MAP = {
     '#include': 'text/x-include-url',
@@ -213,9 +220,14 @@ def walker_callback(data, filename, payload, headers):
         LOG.debug("Empty payload of type %s", content_type)
 
 
+def payload_dir(paths):
+    """Return the directory that large part payloads are kept in."""
+    return os.path.join(paths.get_ipath_cur('data'), 'parts')
+
+
 # Callback is a function that will be called with
 # (data, content_type, filename, payload)
-def walk(msg, callback, data):
+def walk(msg, callback, data, parts_dir=None):
     partnum = 0
     for part in msg.walk():
         # multipart/* are just containers
@@ -233,7 +245,7 @@ def walk(msg, callback, data):
         headers = dict(part)
         LOG.debug(headers)
         headers['Content-Type'] = ctype
-        payload = util.fully_decoded_payload(part)
+        payload = part_payload(part, parts_dir)
         callback(data, filename, payload, headers)
         partnum = partnum + 1
 
@@ -250,11 +262,39 @@ def fixup_handler(mod, def_freq=PER_INSTANCE):
     return mod
 
 
+def part_payload(part, parts_dir=None):
+    """Return the decoded payload of a part, reading it from its payload
+    file if it was too large to be kept in the message.
+
+    Only payload files directly inside parts_dir are read, anything else
+    was not written by the user-data processor and is ignored.
+    """
+    path = part.get(PAYLOAD_FILE_HEADER)
+    if not path:
+        return util.fully_decoded_payload(part)
+    if (not parts_dir or os.path.dirname(os.path.realpath(path)) !=
+            os.path.realpath(parts_dir)):
+        LOG.warning("Ignoring payload file %s not in %s", path, parts_dir)
+        return util.fully_decoded_payload(part)
+    blob = util.load_file(path, decode=False)
+    if six.PY3 and part.get_content_maintype() == 'text':
+        return blob.decode('utf-8', 'surrogateescape')
+    return blob
+
+
 def type_from_starts_with(payload, default=None):
+    # Only the start of the payload matters, so avoid decoding (and
+    # lowercasing) a copy of what might be a very large payload.
+    head = payload[:TYPE_SNIFF_SIZE]
+    if head[:1].isspace():
+        head = payload.lstrip()[:TYPE_SNIFF_SIZE]
     try:
-        payload_lc = util.decode_binary(payload).lower()
-    except UnicodeDecodeError:
-        return default
+        payload_lc = util.decode_binary(head).lower()
+    except UnicodeDecodeError as e:
+        # A multi-byte character may have been cut off at the end
+        if len(head) < TYPE_SNIFF_SIZE or e.start < len(head) - 3:
+            return default
+        payload_lc = util.decode_binary(head[:e.start]).lower()
     payload_lc = payload_lc.lstrip()
     for text in INCLUSION_SRCH:
         if payload_lc.startswith(text):
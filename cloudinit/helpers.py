@@ -333,6 +333,7 @@ class Paths(object):
             "userdata_raw": "user-data.txt",
             "userdata": "user-data.txt.i",
             "obj_pkl": "obj.pkl",
+            "obj_json": "obj.json",
             "cloud_config": "cloud-config.txt",
             "vendor_cloud_config": "vendor-cloud-config.txt",
             "data": "data",
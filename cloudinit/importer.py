@@ -8,6 +8,7 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import pkgutil
 import sys
 
 
@@ -16,6 +17,20 @@ def import_module(module_name):
     return sys.modules[module_name]
 
 
+def module_exists(module_name):
+    """Return whether module_name can be found, without importing it.
+
+    Only its parent packages get imported, so find_module does not pay for
+    a full import attempt of every candidate location.
+    """
+    if module_name in sys.modules:
+        return True
+    try:
+        return pkgutil.find_loader(module_name) is not None
+    except ImportError:
+        return False
+
+
 def find_module(base_name, search_paths, required_attrs=None):
     if not required_attrs:
         required_attrs = []
@@ -30,6 +45,8 @@ def find_module(base_name, search_paths, required_attrs=None):
         lookup_paths.append(full_path)
     found_paths = []
     for full_path in lookup_paths:
+        if not module_exists(full_path):
+            continue
         mod = None
         try:
             mod = import_module(full_path)
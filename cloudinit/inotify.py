@@ -0,0 +1,156 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Wait for files and devices to appear.
+
+The directories that would hold the missing paths are watched with
+inotify, so a wait ends as soon as the kernel or udev creates them rather
+than on the next tick of a polling loop.  Paths are still checked every
+'naplen' seconds, which covers filesystems that do not generate inotify
+events (such as sysfs) and systems without inotify at all.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import time
+
+from cloudinit import log as logging
+
+LOG = logging.getLogger(__name__)
+
+IN_CREATE = 0x00000100
+IN_MOVED_TO = 0x00000080
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+_READ_SIZE = 4096
+
+_LIBC = None
+
+
+class InotifyError(Exception):
+    """Raised when inotify is not available or a watch cannot be added."""
+
+
+def _libc():
+    global _LIBC
+    if _LIBC is None:
+        name = ctypes.util.find_library('c') or 'libc.so.6'
+        try:
+            libc = ctypes.CDLL(name, use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise InotifyError("inotify is not available: %s" % e)
+        _LIBC = libc
+    return _LIBC
+
+
+class Inotify(object):
+    """A non-blocking inotify instance that only reports that something
+    changed in one of the watched directories."""
+
+    def __init__(self):
+        self._libc = _libc()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyError(
+                "inotify_init1 failed: %s" % os.strerror(ctypes.get_errno()))
+        self.watched = set()
+
+    def watch(self, path):
+        if path in self.watched:
+            return
+        wd = self._libc.inotify_add_watch(
+            self.fd, path.encode('utf-8'), WATCH_MASK)
+        if wd < 0:
+            raise InotifyError("Unable to watch %s: %s" % (
+                path, os.strerror(ctypes.get_errno())))
+        self.watched.add(path)
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for an event, return True if any."""
+        try:
+            (ready, _w, _x) = select.select([self.fd], [], [], timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return False
+            raise
+        if not ready:
+            return False
+        # the events themselves do not matter, the paths are checked again
+        try:
+            while os.read(self.fd, _READ_SIZE):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return True
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _nearest_dir(path):
+    """Return the closest existing directory that path would be under."""
+    parent = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(parent):
+        parent = os.path.dirname(parent)
+    return parent
+
+
+def wait_for_paths(paths, maxwait=60, naplen=.5):
+    """Wait up to maxwait seconds for all of paths to exist.
+
+    Returns a tuple of (the set of paths still missing, seconds waited).
+    """
+    need = set(paths)
+    start = time.time()
+    inotify = None
+    try:
+        inotify = Inotify()
+    except InotifyError as e:
+        LOG.debug("Falling back to polling for %s: %s", sorted(need), e)
+    try:
+        while True:
+            need = set([p for p in need if not os.path.exists(p)])
+            if not need:
+                break
+            if inotify is not None:
+                try:
+                    for path in need:
+                        inotify.watch(_nearest_dir(path))
+                except InotifyError as e:
+                    LOG.debug("Falling back to polling: %s", e)
+                    inotify.close()
+                    inotify = None
+                # anything created while the watches were being added has
+                # not generated an event, so look again before waiting
+                need = set([p for p in need if not os.path.exists(p)])
+                if not need:
+                    break
+            remaining = maxwait - (time.time() - start)
+            if remaining <= 0:
+                break
+            if inotify is not None:
+                inotify.wait(min(naplen, remaining))
+            else:
+                time.sleep(min(naplen, remaining))
+    finally:
+        if inotify is not None:
+            inotify.close()
+    return (need, time.time() - start)
+
+# vi: ts=4 expandtab
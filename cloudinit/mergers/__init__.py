@@ -19,6 +19,10 @@ DEF_MERGE_TYPE = "list()+dict()+str()"
 MERGER_PREFIX = 'm_'
 MERGER_ATTR = 'Merger'
 
+# merge_how strings already parsed and mergers already built, see construct()
+_PARSED = {}
+_PLANS = {}
+
 
 class UnknownMerger(object):
     # Named differently so auto-method finding
@@ -27,6 +31,27 @@ class UnknownMerger(object):
     def _handle_unknown(self, _meth_wanted, value, _merge_with):
         return value
 
+    def _find_method(self, source):
+        # Looking up the '_on_X' method of a type is done once per type
+        # and remembered, merging config visits the same few types a lot.
+        try:
+            dispatch = self._dispatch
+        except AttributeError:
+            dispatch = self._dispatch = {}
+        cls = None
+        if not isinstance(source, six.class_types):
+            # classes are named after themselves, not their metaclass
+            cls = getattr(source, '__class__', None)
+        if cls in dispatch:
+            return dispatch[cls]
+        type_name = type_utils.obj_name(source)
+        type_name = type_name.lower()
+        method_name = "_on_%s" % (type_name)
+        found = (getattr(self, method_name, None), method_name)
+        if cls is not None:
+            dispatch[cls] = found
+        return found
+
     # This merging will attempt to look for a '_on_X' method
     # in our own object for a given object Y with type X,
     # if found it will be called to perform the merge of a source
@@ -35,17 +60,10 @@ class UnknownMerger(object):
     # If not found the merge will be given to a '_handle_unknown'
     # function which can decide what to do wit the 2 values.
     def merge(self, source, merge_with):
-        type_name = type_utils.obj_name(source)
-        type_name = type_name.lower()
-        method_name = "_on_%s" % (type_name)
-        meth = None
-        args = [source, merge_with]
-        if hasattr(self, method_name):
-            meth = getattr(self, method_name)
+        (meth, method_name) = self._find_method(source)
         if not meth:
-            meth = self._handle_unknown
-            args.insert(0, method_name)
-        return meth(*args)
+            return self._handle_unknown(method_name, source, merge_with)
+        return meth(source, merge_with)
 
 
 class LookupMerger(UnknownMerger):
@@ -55,6 +73,7 @@ class LookupMerger(UnknownMerger):
             self._lookups = []
         else:
             self._lookups = lookups
+        self._found = {}
 
     def __str__(self):
         return 'LookupMerger: (%s)' % (len(self._lookups))
@@ -65,13 +84,17 @@ class LookupMerger(UnknownMerger):
     # any of the contained objects have the needed method, they
     # will be called to perform the merge.
     def _handle_unknown(self, meth_wanted, value, merge_with):
-        meth = None
-        for merger in self._lookups:
-            if hasattr(merger, meth_wanted):
-                # First one that has that method/attr gets to be
-                # the one that will be called
-                meth = getattr(merger, meth_wanted)
-                break
+        try:
+            meth = self._found[meth_wanted]
+        except KeyError:
+            meth = None
+            for merger in self._lookups:
+                if hasattr(merger, meth_wanted):
+                    # First one that has that method/attr gets to be
+                    # the one that will be called
+                    meth = getattr(merger, meth_wanted)
+                    break
+            self._found[meth_wanted] = meth
         if not meth:
             return UnknownMerger._handle_unknown(self, meth_wanted,
                                                  value, merge_with)
@@ -104,6 +127,16 @@ def dict_extract_mergers(config):
 
 
 def string_extract_mergers(merge_how):
+    try:
+        return list(_PARSED[merge_how])
+    except KeyError:
+        pass
+    parsed_mergers = _string_extract_mergers(merge_how)
+    _PARSED[merge_how] = tuple(parsed_mergers)
+    return parsed_mergers
+
+
+def _string_extract_mergers(merge_how):
     parsed_mergers = []
     for m_name in merge_how.split("+"):
         # Canonicalize the name (so that it can be found
@@ -128,7 +161,31 @@ def default_mergers():
     return tuple(string_extract_mergers(DEF_MERGE_TYPE))
 
 
+def _plan_key(parsed_mergers):
+    try:
+        key = tuple((m_name, tuple(m_ops))
+                    for (m_name, m_ops) in parsed_mergers)
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 def construct(parsed_mergers):
+    """Return the merger for parsed_mergers ([(name, options), ...]).
+
+    Mergers keep no state between merges, so the merger built for a list
+    of mergers is remembered and handed out again for the same list."""
+    key = _plan_key(parsed_mergers)
+    if key is not None and key in _PLANS:
+        return _PLANS[key]
+    root = _construct(parsed_mergers)
+    if key is not None:
+        _PLANS[key] = root
+    return root
+
+
+def _construct(parsed_mergers):
     mergers_to_be = []
     for (m_name, m_ops) in parsed_mergers:
         if not m_name.startswith(MERGER_PREFIX):
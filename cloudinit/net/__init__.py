@@ -5,15 +5,20 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import binascii
 import errno
 import logging
 import os
 import re
+import socket
+import struct
 
+from cloudinit.net import netlink
 from cloudinit import util
 
 LOG = logging.getLogger(__name__)
 SYS_CLASS_NET = "/sys/class/net/"
+PROC_NET = "/proc/net/"
 DEFAULT_PRIMARY_INTERFACE = 'eth0'
 
 
@@ -128,6 +133,232 @@ def get_devicelist():
     return os.listdir(SYS_CLASS_NET)
 
 
+def _read_ip_addresses():
+    """Return {name: [address, ...]} as listed by 'ip -o addr show'.
+
+    The addresses are dictionaries like those of netlink.dump_addresses.
+    """
+    (out, _err) = util.subp(['ip', '-o', 'addr', 'show'], capture=True)
+    found = {}
+    for line in out.splitlines():
+        toks = line.split()
+        if len(toks) < 4 or toks[2] not in ('inet', 'inet6'):
+            continue
+        name = toks[1].split('@', 1)[0]
+        (address, _sep, prefixlen) = toks[3].partition('/')
+        entry = {'family': toks[2], 'address': address,
+                 'prefixlen': int(prefixlen or 0), 'broadcast': None,
+                 'scope': 'global', 'permanent': 'dynamic' not in toks,
+                 'label': None}
+        if 'brd' in toks:
+            entry['broadcast'] = toks[toks.index('brd') + 1]
+        if 'scope' in toks:
+            entry['scope'] = toks[toks.index('scope') + 1]
+        found.setdefault(name, []).append(entry)
+    return found
+
+
+def _read_sys_flags(name):
+    flags = read_sys_net_safe(name, 'flags')
+    try:
+        return int(flags, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+# How to read each field of an Inventory device from sysfs.
+_SYSFS_FIELDS = {
+    'address': lambda name: read_sys_net_safe(name, 'address'),
+    'mac': lambda name: get_interface_mac(name),
+    'flags': _read_sys_flags,
+    'up': lambda name: is_up(name),
+    'operstate': lambda name: read_sys_net_safe(name, 'operstate'),
+    'carrier': lambda name: read_sys_net_int(name, 'carrier'),
+    'dormant': lambda name: read_sys_net_int(name, 'dormant'),
+    'bridge': lambda name: is_bridge(name),
+    'vlan': lambda name: is_vlan(name),
+    'wireless': lambda name: is_wireless(name),
+    'physical': lambda name: is_physical(name),
+    'own_mac': lambda name: interface_has_own_mac(name),
+}
+
+
+class Inventory(object):
+    """A snapshot of the network devices present on the system.
+
+    Devices are listed once when the inventory is taken.  With netlink
+    most fields of every device, and all addresses, come from one dump
+    each.  Fields netlink does not provide (or all of them, when it is
+    unavailable) are read from sysfs the first time they are asked for.
+    Either way each field is read at most once, so a single inventory can
+    answer repeated queries by renaming, fallback generation and netinfo.
+    """
+
+    def __init__(self, devices, addresses=None):
+        # devices: {name: {field: value}}, addresses: {name: [address]}
+        self._devices = devices
+        self._addresses = addresses
+
+    @classmethod
+    def from_netlink(cls):
+        links = netlink.dump_links()
+        addrs = netlink.dump_addresses()
+        devices = {}
+        names = {}
+        for link in links:
+            operstate = link['operstate']
+            dev = {
+                'index': link['index'],
+                'address': link['address'],
+                'flags': link['flags'],
+                'up': operstate in ('up', 'unknown'),
+                'operstate': operstate,
+                'carrier': link['carrier'],
+                'dormant': int(operstate == 'dormant'),
+                'bridge': link['kind'] == 'bridge',
+                'vlan': link['kind'] == 'vlan',
+            }
+            if link['slave_kind'] != 'bond':
+                dev['mac'] = link['address']
+            elif link['perm_address']:
+                dev['mac'] = link['perm_address']
+            devices[link['name']] = dev
+            names[link['index']] = link['name']
+        addresses = {}
+        for addr in addrs:
+            name = names.get(addr.pop('index'))
+            if name is not None:
+                addresses.setdefault(name, []).append(addr)
+        return cls(devices, addresses)
+
+    @classmethod
+    def from_sysfs(cls):
+        try:
+            devs = get_devicelist()
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                devs = []
+            else:
+                raise
+        return cls(dict((name, {}) for name in devs))
+
+    def names(self):
+        return list(self._devices.keys())
+
+    def __contains__(self, name):
+        return name in self._devices
+
+    def get(self, name, field):
+        dev = self._devices[name]
+        if field not in dev:
+            dev[field] = _SYSFS_FIELDS[field](name)
+        return dev[field]
+
+    def is_up(self, name):
+        return self.get(name, 'up')
+
+    def is_bridge(self, name):
+        return self.get(name, 'bridge')
+
+    def is_vlan(self, name):
+        return self.get(name, 'vlan')
+
+    def addresses(self, name):
+        """Return the addresses of device name, see _read_ip_addresses."""
+        if self._addresses is None:
+            self._addresses = _read_ip_addresses()
+        return self._addresses.get(name, [])
+
+    def by_mac(self):
+        """Build a dictionary of tuples {mac: name}.
+
+        Bridges and any devices that have a 'stolen' mac are excluded."""
+        ret = {}
+        empty_mac = '00:00:00:00:00:00'
+        for name in self.names():
+            if not self.get(name, 'own_mac'):
+                continue
+            if self.is_bridge(name):
+                continue
+            if self.is_vlan(name):
+                continue
+            mac = self.get(name, 'mac')
+            # some devices may not have a mac (tun0)
+            if not mac:
+                continue
+            if mac == empty_mac and name != 'lo':
+                continue
+            if mac in ret:
+                raise RuntimeError(
+                    "duplicate mac found! both '%s' and '%s' have mac '%s'" %
+                    (name, ret[mac], mac))
+            ret[mac] = name
+        return ret
+
+
+def get_inventory():
+    """Take an Inventory of the network devices, over netlink if possible."""
+    try:
+        return Inventory.from_netlink()
+    except netlink.NetlinkError as e:
+        LOG.debug("Reading network devices from sysfs: %s", e)
+        return Inventory.from_sysfs()
+
+
+def _read_proc_routes_v4():
+    routes = []
+    lines = util.load_file(PROC_NET + 'route').splitlines()
+    # Iface Destination Gateway Flags RefCnt Use Metric Mask MTU Window IRTT
+    for line in lines[1:]:
+        toks = line.split()
+        if len(toks) < 8:
+            continue
+        (dest, gateway, mask) = [
+            socket.inet_ntoa(struct.pack('=L', int(tok, 16)))
+            for tok in (toks[1], toks[2], toks[7])]
+        routes.append({
+            'destination': dest, 'gateway': gateway, 'genmask': mask,
+            'prefixlen': bin(int(toks[7], 16)).count('1'),
+            'flags': int(toks[3], 16), 'ref': int(toks[4]),
+            'use': int(toks[5]), 'metric': int(toks[6]), 'iface': toks[0]})
+    return routes
+
+
+def _read_proc_routes_v6():
+    def addr(tok):
+        return socket.inet_ntop(socket.AF_INET6, binascii.unhexlify(tok))
+
+    try:
+        content = util.load_file(PROC_NET + 'ipv6_route')
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            raise
+        # no ipv6 in this kernel
+        return []
+    routes = []
+    # dest dest_plen src src_plen next_hop metric refcnt use flags iface
+    for line in content.splitlines():
+        toks = line.split()
+        if len(toks) < 10:
+            continue
+        routes.append({
+            'destination': addr(toks[0]), 'prefixlen': int(toks[1], 16),
+            'gateway': addr(toks[4]), 'metric': int(toks[5], 16),
+            'ref': int(toks[6], 16), 'use': int(toks[7], 16),
+            'flags': int(toks[8], 16), 'iface': toks[9]})
+    return routes
+
+
+def read_routes():
+    """Return {'ipv4': [route, ...], 'ipv6': [route, ...]} from /proc/net.
+
+    Routes are dictionaries with the keys destination, prefixlen, gateway,
+    flags (the kernel's RTF_* bits), metric, ref, use and iface; ipv4
+    routes also have the genmask.  Raises IOError or OSError if
+    /proc/net/route cannot be read."""
+    return {'ipv4': _read_proc_routes_v4(), 'ipv6': _read_proc_routes_v6()}
+
+
 class ParserError(Exception):
     """Raised when a parser has issue parsing a file/content."""
 
@@ -138,12 +369,14 @@ def is_disabled_cfg(cfg):
     return cfg.get('config') == "disabled"
 
 
-def generate_fallback_config():
+def generate_fallback_config(inventory=None):
     """Determine which attached net dev is most likely to have a connection and
        generate network state to run dhcp on that interface"""
+    if inventory is None:
+        inventory = get_inventory()
     # get list of interfaces that could have connections
     invalid_interfaces = set(['lo'])
-    potential_interfaces = set(get_devicelist())
+    potential_interfaces = set(inventory.names())
     potential_interfaces = potential_interfaces.difference(invalid_interfaces)
     # sort into interfaces with carrier, interfaces which could have carrier,
     # and ignore interfaces that are definitely disconnected
@@ -152,21 +385,21 @@ def generate_fallback_config():
     for interface in potential_interfaces:
         if interface.startswith("veth"):
             continue
-        if is_bridge(interface):
+        if inventory.is_bridge(interface):
             # skip any bridges
             continue
-        carrier = read_sys_net_int(interface, 'carrier')
+        carrier = inventory.get(interface, 'carrier')
         if carrier:
             connected.append(interface)
             continue
         # check if nic is dormant or down, as this may make a nick appear to
         # not have a carrier even though it could acquire one when brought
         # online by dhclient
-        dormant = read_sys_net_int(interface, 'dormant')
+        dormant = inventory.get(interface, 'dormant')
         if dormant:
             possibly_connected.append(interface)
             continue
-        operstate = read_sys_net_safe(interface, 'operstate')
+        operstate = inventory.get(interface, 'operstate')
         if operstate in ['dormant', 'down', 'lowerlayerdown', 'unknown']:
             possibly_connected.append(interface)
             continue
@@ -187,7 +420,7 @@ def generate_fallback_config():
     target_name = None
     target_mac = None
     for name in names:
-        mac = read_sys_net_safe(name, 'address')
+        mac = inventory.get(name, 'address')
         if mac:
             target_name = name
             target_mac = mac
@@ -241,7 +474,7 @@ def interface_has_own_mac(ifname, strict=False):
     return assign_type in (0, 1, 3)
 
 
-def _get_current_rename_info(check_downable=True):
+def _get_current_rename_info(check_downable=True, inventory=None):
     """Collect information necessary for rename_interfaces.
 
     returns a dictionary by mac address like:
@@ -251,33 +484,93 @@ def _get_current_rename_info(check_downable=True):
           'downable': None or boolean indicating that the
                       device has only automatically assigned ip addrs.}}
     """
+    if inventory is None:
+        inventory = get_inventory()
     bymac = {}
-    for mac, name in get_interfaces_by_mac().items():
-        bymac[mac] = {'name': name, 'up': is_up(name), 'downable': None}
+    for mac, name in inventory.by_mac().items():
+        bymac[mac] = {'name': name, 'up': inventory.is_up(name),
+                      'downable': None}
 
     if check_downable:
-        nmatch = re.compile(r"[0-9]+:\s+(\w+)[@:]")
-        ipv6, _err = util.subp(['ip', '-6', 'addr', 'show', 'permanent',
-                                'scope', 'global'], capture=True)
-        ipv4, _err = util.subp(['ip', '-4', 'addr', 'show'], capture=True)
-
-        nics_with_addresses = set()
-        for bytes_out in (ipv6, ipv4):
-            nics_with_addresses.update(nmatch.findall(bytes_out))
+        # permanent global ipv6 and any ipv4 addresses are configured ones
+        def configured(addr):
+            if addr['family'] == 'inet':
+                return True
+            return addr['permanent'] and addr['scope'] == 'global'
 
         for d in bymac.values():
-            d['downable'] = (d['up'] is False or
-                             d['name'] not in nics_with_addresses)
+            has_addresses = any(
+                configured(a) for a in inventory.addresses(d['name']))
+            d['downable'] = (d['up'] is False or not has_addresses)
 
     return bymac
 
 
+def _link_op_args(op, params):
+    if op == 'rename':
+        (cur, new) = params
+        return ['set', 'dev', cur, 'name', new]
+    return ['set', 'dev', params[0], op]
+
+
+def _batch_failures(stderr):
+    """Return {line number: error} for the failed commands of an 'ip -batch'
+    run, as reported in its stderr."""
+    failures = {}
+    msg = []
+    for line in stderr.splitlines():
+        match = re.search(r"Command failed -:(\d+)", line)
+        if match:
+            failures[int(match.group(1))] = ' '.join(msg)
+            msg = []
+        elif line.strip():
+            msg.append(line.strip())
+    return failures
+
+
+def _run_link_ops(ops):
+    """Run the (op, mac, new_name, params) entries of ops in one 'ip -batch'.
+
+    Returns a list of (entry, error) for the entries that failed.  If the
+    failed commands can not be told from the output (an ip without batch
+    support), each entry is run on its own instead."""
+    batch = ''.join(
+        'link %s\n' % ' '.join(_link_op_args(op, params))
+        for (op, _mac, _new_name, params) in ops)
+    try:
+        util.subp(['ip', '-force', '-batch', '-'], data=batch, capture=True)
+        return []
+    except util.ProcessExecutionError as e:
+        failures = _batch_failures(e.stderr)
+        if failures:
+            return [(ops[num - 1], msg) for (num, msg) in sorted(
+                failures.items()) if 0 < num <= len(ops)]
+        LOG.debug("ip -batch failed, running link operations one at a"
+                  " time: %s", e)
+
+    errors = []
+    for entry in ops:
+        (op, _mac, _new_name, params) = entry
+        try:
+            util.subp(['ip', 'link'] + _link_op_args(op, params),
+                      capture=True)
+        except Exception as e:
+            errors.append((entry, e))
+    return errors
+
+
 def _rename_interfaces(renames, strict_present=True, strict_busy=True,
-                       current_info=None):
+                       current_info=None, dry_run=False):
+    """Rename the interfaces of the [mac, new_name] pairs in renames.
+
+    Busy interfaces are brought down (and up again afterwards) where that
+    is safe.  All the needed link operations run as one 'ip -batch'.
+    With dry_run nothing is run and the list of planned
+    (op, mac, new_name, params) operations is returned instead."""
 
     if not len(renames):
         LOG.debug("no interfaces to rename")
-        return
+        return [] if dry_run else None
 
     if current_info is None:
         current_info = _get_current_rename_info()
@@ -292,15 +585,6 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
         return dict((data['name'], data)
                     for data in bymac.values())
 
-    def rename(cur, new):
-        util.subp(["ip", "link", "set", cur, "name", new], capture=True)
-
-    def down(name):
-        util.subp(["ip", "link", "set", name, "down"], capture=True)
-
-    def up(name):
-        util.subp(["ip", "link", "set", name, "up"], capture=True)
-
     ops = []
     errors = []
     ups = []
@@ -360,27 +644,27 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
         cur_byname = update_byname(cur_bymac)
         ops += cur_ops
 
-    opmap = {'rename': rename, 'down': down, 'up': up}
-
     if len(ops) + len(ups) == 0:
         if len(errors):
             LOG.debug("unable to do any work for renaming of %s", renames)
         else:
             LOG.debug("no work necessary for renaming of %s", renames)
+    elif dry_run:
+        LOG.debug("renaming of %s would need ops %s", renames, ops + ups)
     else:
         LOG.debug("achieving renaming of %s with ops %s", renames, ops + ups)
 
-        for op, mac, new_name, params in ops + ups:
-            try:
-                opmap.get(op)(*params)
-            except Exception as e:
-                errors.append(
-                    "[unknown] Error performing %s%s for %s, %s: %s" %
-                    (op, params, mac, new_name, e))
+        for (op, mac, new_name, params), e in _run_link_ops(ops + ups):
+            errors.append(
+                "[unknown] Error performing %s%s for %s, %s: %s" %
+                (op, params, mac, new_name, e))
 
     if len(errors):
         raise Exception('\n'.join(errors))
 
+    if dry_run:
+        return ops + ups
+
 
 def get_interface_mac(ifname):
     """Returns the string value of an interface's MAC Address"""
@@ -392,38 +676,13 @@ def get_interface_mac(ifname):
     return read_sys_net_safe(ifname, path)
 
 
-def get_interfaces_by_mac():
+def get_interfaces_by_mac(inventory=None):
     """Build a dictionary of tuples {mac: name}.
 
     Bridges and any devices that have a 'stolen' mac are excluded."""
-    try:
-        devs = get_devicelist()
-    except OSError as e:
-        if e.errno == errno.ENOENT:
-            devs = []
-        else:
-            raise
-    ret = {}
-    empty_mac = '00:00:00:00:00:00'
-    for name in devs:
-        if not interface_has_own_mac(name):
-            continue
-        if is_bridge(name):
-            continue
-        if is_vlan(name):
-            continue
-        mac = get_interface_mac(name)
-        # some devices may not have a mac (tun0)
-        if not mac:
-            continue
-        if mac == empty_mac and name != 'lo':
-            continue
-        if mac in ret:
-            raise RuntimeError(
-                "duplicate mac found! both '%s' and '%s' have mac '%s'" %
-                (name, ret[mac], mac))
-        ret[mac] = name
-    return ret
+    if inventory is None:
+        inventory = get_inventory()
+    return inventory.by_mac()
 
 
 class RendererNotFoundError(RuntimeError):
@@ -364,6 +364,8 @@ class Renderer(renderer.Renderer):
         return content
 
     def _render_iface(self, iface, render_hwaddress=False):
+        # the network state is read-only, the entries below are per subnet
+        iface = dict(iface)
         sections = []
         subnets = iface.get('subnets', {})
         if subnets:
@@ -411,9 +413,9 @@ class Renderer(renderer.Renderer):
         # there (as that is the only interface that will be always up).
         lo = {'name': 'lo', 'type': 'physical', 'inet': 'inet',
               'subnets': [{'type': 'loopback', 'control': 'auto'}]}
-        for iface in network_state.iter_interfaces():
-            if iface.get('name') == "lo":
-                lo = copy.deepcopy(iface)
+        iface = network_state.get_interface('lo')
+        if iface is not None:
+            lo = copy.deepcopy(dict(iface))
 
         nameservers = network_state.dns_nameservers
         if nameservers:
@@ -452,15 +454,13 @@ class Renderer(renderer.Renderer):
 
     def render_network_state(self, network_state, target=None):
         fpeni = util.target_path(target, self.eni_path)
-        util.ensure_dir(os.path.dirname(fpeni))
         header = self.eni_header if self.eni_header else ""
-        util.write_file(fpeni, header + self._render_interfaces(network_state))
+        files = {fpeni: header + self._render_interfaces(network_state)}
 
         if self.netrules_path:
             netrules = util.target_path(target, self.netrules_path)
-            util.ensure_dir(os.path.dirname(netrules))
-            util.write_file(netrules,
-                            self._render_persistent_net(network_state))
+            files[netrules] = self._render_persistent_net(network_state)
+        return self._write_changed(files)
 
 
 def network_state_to_eni(network_state, header=None, render_hwaddress=False):
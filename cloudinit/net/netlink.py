@@ -0,0 +1,235 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Minimal rtnetlink client.
+
+Dumps the kernel's list of links and addresses with one request each,
+which is much cheaper than reading several sysfs files per device or
+forking 'ip' when there are many devices.
+"""
+
+import os
+import socket
+import struct
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_LINK = 5
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+IFLA_CARRIER = 33
+
+IFLA_INFO_KIND = 1
+IFLA_INFO_SLAVE_KIND = 4
+IFLA_INFO_SLAVE_DATA = 5
+IFLA_BOND_SLAVE_PERM_HWADDR = 4
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+IFA_FLAGS = 8
+IFA_F_PERMANENT = 0x80
+
+IFF_UP = 0x1
+
+# Values of IFLA_OPERSTATE as named in /sys/class/net/<dev>/operstate
+OPERSTATES = {0: 'unknown', 1: 'notpresent', 2: 'down', 3: 'lowerlayerdown',
+              4: 'testing', 5: 'dormant', 6: 'up'}
+SCOPES = {0: 'global', 200: 'site', 253: 'link', 254: 'host', 255: 'nowhere'}
+
+_NLMSGHDR = struct.Struct('=LHHLL')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_IFADDRMSG = struct.Struct('=BBBBI')
+_RTATTR = struct.Struct('=HH')
+_RECV_SIZE = 65536
+
+
+class NetlinkError(Exception):
+    """Raised when the kernel could not be asked over netlink."""
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _parse_attrs(data, offset=0):
+    """Return {type: bytes} for the rtattrs in data starting at offset."""
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        (length, atype) = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        # strip NLA_F_NESTED and NLA_F_NET_BYTEORDER
+        attrs[atype & 0x3fff] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _cstr(data):
+    return data.split(b'\0', 1)[0].decode('utf-8', 'replace')
+
+
+def _mac(data):
+    return ':'.join('%02x' % b for b in bytearray(data))
+
+
+def _u32(data):
+    return struct.unpack('=I', data[:4])[0]
+
+
+def _dump(msg_type, payload, want_type):
+    """Send a dump request and return the payloads of all the replies."""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                             NETLINK_ROUTE)
+    except (AttributeError, socket.error) as e:
+        raise NetlinkError("Unable to open netlink socket: %s" % e)
+    replies = []
+    try:
+        sock.bind((0, 0))
+        seq = 1
+        hdr = _NLMSGHDR.pack(_NLMSGHDR.size + len(payload), msg_type,
+                             NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+        sock.sendall(hdr + payload)
+        while True:
+            data = sock.recv(_RECV_SIZE)
+            if not data:
+                raise NetlinkError("Netlink socket closed during dump")
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                (length, rtype, _flags, rseq, _pid) = _NLMSGHDR.unpack_from(
+                    data, offset)
+                if length < _NLMSGHDR.size:
+                    raise NetlinkError("Malformed netlink message")
+                body = data[offset + _NLMSGHDR.size:offset + length]
+                offset += _align(length)
+                if rseq != seq:
+                    continue
+                if rtype == NLMSG_DONE:
+                    return replies
+                if rtype == NLMSG_ERROR:
+                    code = -struct.unpack('=i', body[:4])[0]
+                    raise NetlinkError(
+                        "Netlink dump failed: %s" % os.strerror(code))
+                if rtype == want_type:
+                    replies.append(body)
+    except socket.error as e:
+        raise NetlinkError("Netlink dump failed: %s" % e)
+    finally:
+        sock.close()
+
+
+def _parse_linkinfo(data):
+    info = _parse_attrs(data)
+    kind = slave_kind = perm_mac = None
+    if IFLA_INFO_KIND in info:
+        kind = _cstr(info[IFLA_INFO_KIND])
+    if IFLA_INFO_SLAVE_KIND in info:
+        slave_kind = _cstr(info[IFLA_INFO_SLAVE_KIND])
+        if slave_kind == 'bond' and IFLA_INFO_SLAVE_DATA in info:
+            slave = _parse_attrs(info[IFLA_INFO_SLAVE_DATA])
+            if IFLA_BOND_SLAVE_PERM_HWADDR in slave:
+                perm_mac = _mac(slave[IFLA_BOND_SLAVE_PERM_HWADDR])
+    return (kind, slave_kind, perm_mac)
+
+
+def dump_links():
+    """Return a list of dictionaries, one per link, with the keys:
+
+    index, name, flags, address (None if the link has none), mtu,
+    operstate, carrier (None if unknown), link (parent index or None),
+    master (index or None), kind, slave_kind and perm_address (the
+    permanent address of a bond slave, None if not known).
+    """
+    links = []
+    for body in _dump(RTM_GETLINK, _IFINFOMSG.pack(0, 0, 0, 0, 0),
+                      RTM_NEWLINK):
+        (_family, _type, index, flags, _change) = _IFINFOMSG.unpack_from(
+            body)
+        attrs = _parse_attrs(body, _IFINFOMSG.size)
+        if IFLA_IFNAME not in attrs:
+            continue
+        link = {
+            'index': index,
+            'name': _cstr(attrs[IFLA_IFNAME]),
+            'flags': flags,
+            'address': None,
+            'mtu': None,
+            'operstate': 'unknown',
+            'carrier': None,
+            'link': None,
+            'master': None,
+            'kind': None,
+            'slave_kind': None,
+            'perm_address': None,
+        }
+        if IFLA_ADDRESS in attrs:
+            link['address'] = _mac(attrs[IFLA_ADDRESS])
+        if IFLA_MTU in attrs:
+            link['mtu'] = _u32(attrs[IFLA_MTU])
+        if IFLA_OPERSTATE in attrs:
+            link['operstate'] = OPERSTATES.get(
+                bytearray(attrs[IFLA_OPERSTATE])[0], 'unknown')
+        if IFLA_CARRIER in attrs:
+            link['carrier'] = bytearray(attrs[IFLA_CARRIER])[0]
+        if IFLA_LINK in attrs:
+            link['link'] = _u32(attrs[IFLA_LINK])
+        if IFLA_MASTER in attrs:
+            link['master'] = _u32(attrs[IFLA_MASTER])
+        if IFLA_LINKINFO in attrs:
+            (link['kind'], link['slave_kind'],
+             link['perm_address']) = _parse_linkinfo(attrs[IFLA_LINKINFO])
+        links.append(link)
+    return links
+
+
+def dump_addresses():
+    """Return a list of dictionaries, one per address, with the keys:
+
+    index, family ('inet' or 'inet6'), address, prefixlen, broadcast (None
+    if not set), scope ('global', 'link', 'host', ...), permanent and label.
+    """
+    addresses = []
+    for body in _dump(RTM_GETADDR, _IFADDRMSG.pack(0, 0, 0, 0, 0),
+                      RTM_NEWADDR):
+        (family, prefixlen, flags, scope, index) = _IFADDRMSG.unpack_from(
+            body)
+        if family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+        attrs = _parse_attrs(body, _IFADDRMSG.size)
+        raw = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        if raw is None:
+            continue
+        if IFA_FLAGS in attrs:
+            flags = _u32(attrs[IFA_FLAGS])
+        broadcast = None
+        if IFA_BROADCAST in attrs:
+            broadcast = socket.inet_ntop(family, attrs[IFA_BROADCAST])
+        addresses.append({
+            'index': index,
+            'family': 'inet' if family == socket.AF_INET else 'inet6',
+            'address': socket.inet_ntop(family, raw),
+            'prefixlen': prefixlen,
+            'broadcast': broadcast,
+            'scope': SCOPES.get(scope, str(scope)),
+            'permanent': bool(flags & IFA_F_PERMANENT),
+            'label': _cstr(attrs[IFA_LABEL]) if IFA_LABEL in attrs else None,
+        })
+    return addresses
+
+
+# vi: ts=4 expandtab
@@ -164,9 +164,10 @@ def _extract_addresses(config, entry):
         entry.update({'nameservers': ns})
 
 
-def _extract_bond_slaves_by_name(interfaces, entry, bond_master):
-    bond_slave_names = sorted([name for (name, cfg) in interfaces.items()
-                               if cfg.get('bond-master', None) == bond_master])
+def _extract_bond_slaves_by_name(network_state, entry, bond_master):
+    bond_slave_names = sorted(
+        [cfg['name'] for cfg in
+         network_state.iter_linked(bond_master, 'bond-master')])
     if len(bond_slave_names) > 0:
         entry.update({'interfaces': bond_slave_names})
 
@@ -174,12 +175,13 @@ def _extract_bond_slaves_by_name(interfaces, entry, bond_master):
 def _clean_default(target=None):
     # clean out any known default files and derived files in target
     # LP: #1675576
+    # returns the list of removed files
     tpath = util.target_path(target, "etc/netplan/00-snapd-config.yaml")
     if not os.path.isfile(tpath):
-        return
+        return []
     content = util.load_file(tpath, decode=False)
     if content != KNOWN_SNAPD_CONFIG:
-        return
+        return []
 
     derived = [util.target_path(target, f) for f in (
                'run/systemd/network/10-netplan-all-en.network',
@@ -191,6 +193,7 @@ def _clean_default(target=None):
 
     for f in [tpath] + existing:
         os.unlink(f)
+    return [tpath] + existing
 
 
 class Renderer(renderer.Renderer):
@@ -212,7 +215,6 @@ class Renderer(renderer.Renderer):
         # if v2, then extract network_state.config
         # else render_v2_from_state
         fpnplan = os.path.join(target, self.netplan_path)
-        util.ensure_dir(os.path.dirname(fpnplan))
         header = self.netplan_header if self.netplan_header else ""
 
         # render from state
@@ -220,12 +222,16 @@ class Renderer(renderer.Renderer):
 
         if not header.endswith("\n"):
             header += "\n"
-        util.write_file(fpnplan, header + content)
+        changed = self._write_changed({fpnplan: header + content})
 
         if self.clean_default:
-            _clean_default(target=target)
+            changed.extend(_clean_default(target=target))
+        if not changed:
+            LOG.debug("netplan config unchanged, skipping postcmds")
+            return changed
         self._netplan_generate(run=self._postcmds)
         self._net_setup_link(run=self._postcmds)
+        return changed
 
     def _netplan_generate(self, run=False):
         if not run:
@@ -255,8 +261,6 @@ class Renderer(renderer.Renderer):
         vlans = {}
         content = []
 
-        interfaces = network_state._network_state.get('interfaces', [])
-
         nameservers = network_state.dns_nameservers
         searchdomains = network_state.dns_searchdomains
 
@@ -305,7 +309,7 @@ class Renderer(renderer.Renderer):
                     bond.update({'parameters': bond_config})
                 slave_interfaces = ifcfg.get('bond-slaves')
                 if slave_interfaces == 'none':
-                    _extract_bond_slaves_by_name(interfaces, bond, ifname)
+                    _extract_bond_slaves_by_name(network_state, bond, ifname)
                 _extract_addresses(ifcfg, bond)
                 bonds.update({ifname: bond})
 
@@ -12,6 +12,11 @@ import six
 
 from cloudinit import util
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 LOG = logging.getLogger(__name__)
 
 NETWORK_STATE_VERSION = 1
@@ -112,19 +117,112 @@ class CommandHandlerMeta(type):
                                                       parents, dct)
 
 
+class ReadOnlyDict(Mapping):
+    """Read-only view of a dictionary, without copying it."""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    # the Mapping mixins would go through __getitem__, delegate instead
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return self._data.items()
+
+    def values(self):
+        return self._data.values()
+
+    def __eq__(self, other):
+        if isinstance(other, ReadOnlyDict):
+            other = other._data
+        return self._data == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._data)
+
+
+# Interface keys that name another interface ('bridge_ports' lists them)
+LINK_KEYS = ('bond-master', 'vlan-raw-device', 'bridge_ports')
+
+
 class NetworkState(object):
+    """Parsed network state, indexed for lookups by the renderers.
+
+    Interfaces and routes are handed out as ReadOnlyDict views: a renderer
+    that needs to change an interface works on a copy of it.
+    """
 
     def __init__(self, network_state, version=NETWORK_STATE_VERSION):
-        self._network_state = copy.deepcopy(network_state)
         self._version = version
         self.use_ipv6 = network_state.get('use_ipv6', False)
+        # Only the top level is copied, so that an interpreter that keeps
+        # parsing cannot get the indexes out of step.
+        dns = network_state.get('dns', {})
+        self._network_state = {
+            'interfaces': dict(
+                (name, dict(iface)) for (name, iface) in
+                six.iteritems(network_state.get('interfaces', {}))),
+            'routes': [dict(r) for r in network_state.get('routes', [])],
+            'dns': dict((k, list(v)) for (k, v) in dns.items()),
+            'use_ipv6': self.use_ipv6,
+        }
+        self._interfaces = []
+        self._by_name = {}
+        self._by_mac = {}
+        self._by_type = {}
+        self._linked = {}
+        for iface in six.itervalues(self._network_state['interfaces']):
+            view = ReadOnlyDict(iface)
+            self._interfaces.append(view)
+            self._by_name[iface.get('name')] = view
+            mac = iface.get('mac_address')
+            if mac:
+                self._by_mac.setdefault(mac.lower(), view)
+            self._by_type.setdefault(iface.get('type'), []).append(view)
+        for view in self._interfaces:
+            for key in LINK_KEYS:
+                parents = view.get(key)
+                if not parents:
+                    continue
+                if key == 'bridge_ports':
+                    # the bridge is the parent of its ports
+                    for port in parents:
+                        self._linked.setdefault(port, []).append(
+                            (key, view))
+                    continue
+                self._linked.setdefault(parents, []).append((key, view))
+        self._routes = [ReadOnlyDict(r)
+                        for r in self._network_state['routes']]
 
     @property
     def version(self):
         return self._version
 
     def iter_routes(self, filter_func=None):
-        for route in self._network_state.get('routes', []):
+        for route in self._routes:
             if filter_func is not None:
                 if filter_func(route):
                     yield route
@@ -146,14 +244,38 @@ class NetworkState(object):
             return []
 
     def iter_interfaces(self, filter_func=None):
-        ifaces = self._network_state.get('interfaces', {})
-        for iface in six.itervalues(ifaces):
+        for iface in self._interfaces:
             if filter_func is None:
                 yield iface
             else:
                 if filter_func(iface):
                     yield iface
 
+    def iter_interfaces_by_type(self, iface_type):
+        """Yield the interfaces of iface_type ('physical', 'bond', ...)."""
+        for iface in self._by_type.get(iface_type, []):
+            yield iface
+
+    def get_interface(self, name):
+        """Return the interface called name, or None."""
+        return self._by_name.get(name)
+
+    def get_interface_by_mac(self, mac_address):
+        """Return the first interface with mac_address, or None."""
+        if not mac_address:
+            return None
+        return self._by_mac.get(mac_address.lower())
+
+    def iter_linked(self, name, link_key=None):
+        """Yield the interfaces linked to the interface called name.
+
+        These are the bond slaves ('bond-master'), vlans ('vlan-raw-device')
+        on top of it and the bridge ('bridge_ports') it is a port of, or
+        only those of link_key if given."""
+        for (key, iface) in self._linked.get(name, []):
+            if link_key is None or key == link_key:
+                yield iface
+
 
 @six.add_metaclass(CommandHandlerMeta)
 class NetworkStateInterpreter(object):
@@ -315,7 +437,6 @@ class NetworkStateInterpreter(object):
             'subnets': subnets,
         })
         self._network_state['interfaces'].update({command.get('name'): iface})
-        self.dump_network_state()
 
     @ensure_command_keys(['name', 'vlan_id', 'vlan_link'])
     def handle_vlan(self, command):
@@ -669,7 +790,7 @@ class NetworkStateInterpreter(object):
                 route_addr = route.get('to')
                 if "/" in route_addr:
                     route_addr, route_cidr = route_addr.split("/")
-                route_netmask = cidr2mask(route_cidr)
+                route_netmask = cidr2mask(int(route_cidr))
                 subnet_route = {
                     'address': route_addr,
                     'netmask': route_netmask,
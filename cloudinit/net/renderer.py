@@ -6,11 +6,17 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import abc
+import os
 import six
 
+from cloudinit import log as logging
+from cloudinit import util
+
 from .network_state import parse_net_config_data
 from .udev import generate_udev_rule
 
+LOG = logging.getLogger(__name__)
+
 
 def filter_by_type(match_type):
     return lambda iface: match_type == iface['type']
@@ -31,16 +37,42 @@ class Renderer(object):
         # TODO(harlowja): this seems shared between eni renderer and
         # this, so move it to a shared location.
         content = six.StringIO()
-        for iface in network_state.iter_interfaces(filter_by_physical):
+        for iface in network_state.iter_interfaces_by_type('physical'):
             # for physical interfaces write out a persist net udev rule
             if 'name' in iface and iface.get('mac_address'):
                 content.write(generate_udev_rule(iface['name'],
                                                  iface['mac_address']))
         return content.getvalue()
 
+    @staticmethod
+    def _write_changed(files, mode=0o644):
+        """Write the {path: content} of files whose content on disk differs.
+
+        Rendering the same network state again should not touch /etc (or
+        wake up anything watching it), so only files that are missing or
+        have other content are written.  Returns the sorted list of written
+        paths."""
+        changed = []
+        for path in sorted(files):
+            content = files[path]
+            try:
+                current = util.load_file(path, decode=False)
+                if current == util.encode_text(content):
+                    continue
+            except (IOError, OSError):
+                pass
+            util.ensure_dir(os.path.dirname(path))
+            util.write_file(path, content, mode)
+            changed.append(path)
+        if changed:
+            LOG.debug("Wrote changed network config files: %s", changed)
+        else:
+            LOG.debug("Network config files unchanged: %s", sorted(files))
+        return changed
+
     @abc.abstractmethod
     def render_network_state(self, network_state, target=None):
-        """Render network state."""
+        """Render network state, return the list of changed files."""
 
     def render_network_config(self, network_config, target=None):
         return self.render_network_state(
@@ -398,8 +398,7 @@ class Renderer(renderer.Renderer):
 
     @classmethod
     def _render_physical_interfaces(cls, network_state, iface_contents):
-        physical_filter = renderer.filter_by_physical
-        for iface in network_state.iter_interfaces(physical_filter):
+        for iface in network_state.iter_interfaces_by_type('physical'):
             iface_name = iface['name']
             iface_subnets = iface.get("subnets", [])
             iface_cfg = iface_contents[iface_name]
@@ -410,8 +409,7 @@ class Renderer(renderer.Renderer):
 
     @classmethod
     def _render_bond_interfaces(cls, network_state, iface_contents):
-        bond_filter = renderer.filter_by_type('bond')
-        for iface in network_state.iter_interfaces(bond_filter):
+        for iface in network_state.iter_interfaces_by_type('bond'):
             iface_name = iface['name']
             iface_cfg = iface_contents[iface_name]
             cls._render_bonding_opts(iface_cfg, iface)
@@ -429,8 +427,7 @@ class Renderer(renderer.Renderer):
 
     @staticmethod
     def _render_vlan_interfaces(network_state, iface_contents):
-        vlan_filter = renderer.filter_by_type('vlan')
-        for iface in network_state.iter_interfaces(vlan_filter):
+        for iface in network_state.iter_interfaces_by_type('vlan'):
             iface_name = iface['name']
             iface_cfg = iface_contents[iface_name]
             iface_cfg['VLAN'] = True
@@ -449,8 +446,7 @@ class Renderer(renderer.Renderer):
 
     @classmethod
     def _render_bridge_interfaces(cls, network_state, iface_contents):
-        bridge_filter = renderer.filter_by_type('bridge')
-        for iface in network_state.iter_interfaces(bridge_filter):
+        for iface in network_state.iter_interfaces_by_type('bridge'):
             iface_name = iface['name']
             iface_cfg = iface_contents[iface_name]
             iface_cfg.kind = 'bridge'
@@ -499,18 +495,14 @@ class Renderer(renderer.Renderer):
     def render_network_state(self, network_state, target=None):
         file_mode = 0o644
         base_sysconf_dir = util.target_path(target, self.sysconf_dir)
-        for path, data in self._render_sysconfig(base_sysconf_dir,
-                                                 network_state).items():
-            util.write_file(path, data, file_mode)
+        files = self._render_sysconfig(base_sysconf_dir, network_state)
         if self.dns_path:
             dns_path = util.target_path(target, self.dns_path)
-            resolv_content = self._render_dns(network_state,
-                                              existing_dns_path=dns_path)
-            util.write_file(dns_path, resolv_content, file_mode)
+            files[dns_path] = self._render_dns(network_state,
+                                               existing_dns_path=dns_path)
         if self.netrules_path:
-            netrules_content = self._render_persistent_net(network_state)
             netrules_path = util.target_path(target, self.netrules_path)
-            util.write_file(netrules_path, netrules_content, file_mode)
+            files[netrules_path] = self._render_persistent_net(network_state)
 
         # always write /etc/sysconfig/network configuration
         sysconfig_path = util.target_path(target, "etc/sysconfig/network")
@@ -518,7 +510,8 @@ class Renderer(renderer.Renderer):
         if network_state.use_ipv6:
             netcfg.append('NETWORKING_IPV6=yes')
             netcfg.append('IPV6_AUTOCONF=no')
-        util.write_file(sysconfig_path, "\n".join(netcfg) + "\n", file_mode)
+        files[sysconfig_path] = "\n".join(netcfg) + "\n"
+        return self._write_changed(files, mode=file_mode)
 
 
 def available(target=None):
@@ -8,17 +8,46 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import os
 import re
 
+from cloudinit import atomic_helper
 from cloudinit import log as logging
+from cloudinit import net
+from cloudinit.net import netlink
+from cloudinit.net.network_state import cidr2mask
 from cloudinit import util
 
 from prettytable import PrettyTable
 
 LOG = logging.getLogger()
 
+# Route flags as netstat shows them (RTF_* in linux/route.h, ipv6_route.h)
+ROUTE_FLAGS = [(0x1, 'U'), (0x2, 'G'), (0x4, 'H'), (0x8, 'R'), (0x10, 'D'),
+               (0x20, 'M'), (0x200, '!'), (0x40000, 'A'), (0x1000000, 'C')]
 
-def netdev_info(empty=""):
+
+def _netdev_info_netlink():
+    inventory = net.Inventory.from_netlink()
+    devs = {}
+    for name in inventory.names():
+        flags = inventory.get(name, 'flags') or 0
+        dev = {'up': bool(flags & netlink.IFF_UP),
+               'hwaddr': inventory.get(name, 'address') or "",
+               'addr': "", 'bcast': "", 'mask': ""}
+        for addr in inventory.addresses(name):
+            if addr['family'] == 'inet' and not dev['addr']:
+                dev['addr'] = addr['address']
+                dev['mask'] = cidr2mask(addr['prefixlen'])
+                dev['bcast'] = addr['broadcast'] or ""
+            elif addr['family'] == 'inet6' and not dev.get('addr6'):
+                dev['addr6'] = "%s/%s" % (addr['address'], addr['prefixlen'])
+                dev['scope6'] = addr['scope']
+        devs[name] = dev
+    return devs
+
+
+def _netdev_info_ifconfig():
     fields = ("hwaddr", "addr", "bcast", "mask")
     (ifcfg_out, _err) = util.subp(["ifconfig", "-a"])
     devs = {}
@@ -74,6 +103,15 @@ def netdev_info(empty=""):
                         pass
                 elif toks[i].startswith("%s" % origfield):
                     devs[curdev][target] = toks[i][len(field) + 1:]
+    return devs
+
+
+def netdev_info(empty=""):
+    try:
+        devs = _netdev_info_netlink()
+    except netlink.NetlinkError as e:
+        LOG.debug("Using ifconfig for net device info: %s", e)
+        devs = _netdev_info_ifconfig()
 
     if empty != "":
         for (_devname, dev) in devs.items():
@@ -84,7 +122,39 @@ def netdev_info(empty=""):
     return devs
 
 
-def route_info():
+def _route_flags(flags):
+    return ''.join(letter for (bit, letter) in ROUTE_FLAGS if flags & bit)
+
+
+def _route_info_proc():
+    routes = net.read_routes()
+    info = {'ipv4': [], 'ipv6': []}
+    for route in routes['ipv4']:
+        info['ipv4'].append({
+            'destination': route['destination'],
+            'gateway': route['gateway'],
+            'genmask': route['genmask'],
+            'flags': _route_flags(route['flags']),
+            'metric': str(route['metric']),
+            'ref': str(route['ref']),
+            'use': str(route['use']),
+            'iface': route['iface'],
+        })
+    for route in routes['ipv6']:
+        info['ipv6'].append({
+            'destination': "%s/%s" % (route['destination'],
+                                      route['prefixlen']),
+            'gateway': route['gateway'],
+            'flags': _route_flags(route['flags']),
+            'metric': str(route['metric']),
+            'ref': str(route['ref']),
+            'use': str(route['use']),
+            'iface': route['iface'],
+        })
+    return info
+
+
+def _route_info_netstat():
     (route_out, _err) = util.subp(["netstat", "-rn"])
 
     routes = {}
@@ -124,31 +194,17 @@ def route_info():
         }
         routes['ipv4'].append(entry)
 
-    try:
-        (route_out6, _err6) = util.subp(["netstat", "-A", "inet6", "-n"])
-    except util.ProcessExecutionError:
-        pass
-    else:
-        entries6 = route_out6.splitlines()[1:]
-        for line in entries6:
-            if not line:
-                continue
-            toks = line.split()
-            if (len(toks) < 6 or toks[0] == "Kernel" or
-                    toks[0] == "Proto" or toks[0] == "Active"):
-                continue
-            entry = {
-                'proto': toks[0],
-                'recv-q': toks[1],
-                'send-q': toks[2],
-                'local address': toks[3],
-                'foreign address': toks[4],
-                'state': toks[5],
-            }
-            routes['ipv6'].append(entry)
     return routes
 
 
+def route_info():
+    try:
+        return _route_info_proc()
+    except (IOError, OSError) as e:
+        LOG.debug("Using netstat for route info: %s", e)
+        return _route_info_netstat()
+
+
 def getgateway():
     try:
         routes = route_info()
@@ -204,15 +260,13 @@ def route_pformat():
             header = util.center("Route IPv4 info", "+", max_len)
             lines.extend([header, route_s])
         if routes.get('ipv6'):
-            fields_v6 = ['Route', 'Proto', 'Recv-Q', 'Send-Q',
-                         'Local Address', 'Foreign Address', 'State']
+            fields_v6 = ['Route', 'Destination', 'Gateway', 'Interface',
+                         'Flags']
             tbl_v6 = PrettyTable(fields_v6)
             for (n, r) in enumerate(routes.get('ipv6')):
                 route_id = str(n)
-                tbl_v6.add_row([route_id, r['proto'],
-                                r['recv-q'], r['send-q'],
-                                r['local address'], r['foreign address'],
-                                r['state']])
+                tbl_v6.add_row([route_id, r['destination'],
+                                r['gateway'], r['iface'], r['flags']])
             route_s = tbl_v6.get_string()
             max_len = len(max(route_s.splitlines(), key=len))
             header = util.center("Route IPv6 info", "+", max_len)
@@ -236,4 +290,25 @@ def debug_info(prefix='ci-info: '):
         lines.extend(route_lines)
     return "\n".join(lines)
 
+
+def json_info():
+    """Return the device and route info as one dictionary for json."""
+    info = {'netdev': None, 'routes': None}
+    try:
+        info['netdev'] = netdev_info()
+    except Exception as e:
+        util.logexc(LOG, "Net device info failed: %s" % e)
+    try:
+        info['routes'] = route_info()
+    except Exception as e:
+        util.logexc(LOG, "Route info failed: %s" % e)
+    return info
+
+
+def write_json_info(path):
+    """Write json_info() to path instead of rendering it as tables."""
+    util.ensure_dir(os.path.dirname(path))
+    atomic_helper.write_json(path, json_info())
+    LOG.debug("Wrote network info to %s", path)
+
 # vi: ts=4 expandtab
@@ -29,12 +29,18 @@ class _nameset(set):
 
 status = _nameset(("SUCCESS", "WARN", "FAIL"))
 
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    # python2 has no monotonic clock in the standard library.
+    _monotonic = time.time
+
 
 class ReportingEvent(object):
     """Encapsulation of event formatting."""
 
     def __init__(self, event_type, name, description,
-                 origin=DEFAULT_EVENT_ORIGIN, timestamp=None):
+                 origin=DEFAULT_EVENT_ORIGIN, timestamp=None, monotonic=None):
         self.event_type = event_type
         self.name = name
         self.description = description
@@ -42,6 +48,10 @@ class ReportingEvent(object):
         if timestamp is None:
             timestamp = time.time()
         self.timestamp = timestamp
+        # monotonic clock reading, used to time events across a boot
+        if monotonic is None:
+            monotonic = _monotonic()
+        self.monotonic = monotonic
 
     def as_string(self):
         """The event represented as a string."""
@@ -52,16 +62,18 @@ class ReportingEvent(object):
         """The event represented as a dictionary."""
         return {'name': self.name, 'description': self.description,
                 'event_type': self.event_type, 'origin': self.origin,
-                'timestamp': self.timestamp}
+                'timestamp': self.timestamp, 'monotonic': self.monotonic}
 
 
 class FinishReportingEvent(ReportingEvent):
 
     def __init__(self, name, description, result=status.SUCCESS,
-                 post_files=None):
+                 post_files=None, start_monotonic=None):
         super(FinishReportingEvent, self).__init__(
             FINISH_EVENT_TYPE, name, description)
         self.result = result
+        # monotonic reading of the matching start event, if known
+        self.start_monotonic = start_monotonic
         if post_files is None:
             post_files = []
         self.post_files = post_files
@@ -76,6 +88,8 @@ class FinishReportingEvent(ReportingEvent):
         """The event represented as json friendly."""
         data = super(FinishReportingEvent, self).as_dict()
         data['result'] = self.result
+        if self.start_monotonic is not None:
+            data['start_monotonic'] = self.start_monotonic
         if self.post_files:
             data['files'] = _collect_file_info(self.post_files)
         return data
@@ -96,13 +110,15 @@ def report_event(event):
 
 
 def report_finish_event(event_name, event_description,
-                        result=status.SUCCESS, post_files=None):
+                        result=status.SUCCESS, post_files=None,
+                        start_monotonic=None):
     """Report a "finish" event.
 
     See :py:func:`.report_event` for parameter details.
     """
     event = FinishReportingEvent(event_name, event_description, result,
-                                 post_files=post_files)
+                                 post_files=post_files,
+                                 start_monotonic=start_monotonic)
     return report_event(event)
 
 
@@ -177,6 +193,7 @@ class ReportEventStack(object):
         else:
             self.fullname = self.name
         self.children = {}
+        self.start_monotonic = None
 
     def __repr__(self):
         return ("ReportEventStack(%s, %s, reporting_enabled=%s)" %
@@ -184,6 +201,7 @@ class ReportEventStack(object):
 
     def __enter__(self):
         self.result = status.SUCCESS
+        self.start_monotonic = _monotonic()
         if self.reporting_enabled:
             report_start_event(self.fullname, self.description)
         if self.parent:
@@ -229,7 +247,8 @@ class ReportEventStack(object):
             self.parent.children[self.name] = (result, msg)
         if self.reporting_enabled:
             report_finish_event(self.fullname, msg, result,
-                                post_files=self.post_files)
+                                post_files=self.post_files,
+                                start_monotonic=self.start_monotonic)
 
 
 def _collect_file_info(files):
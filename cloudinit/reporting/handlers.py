@@ -2,11 +2,13 @@
 
 import abc
 import json
+import os
 import six
 
 from cloudinit import log as logging
 from cloudinit.registry import DictRegistry
 from cloudinit import (url_helper, util)
+from cloudinit.reporting import journal
 
 
 LOG = logging.getLogger(__name__)
@@ -85,9 +87,47 @@ class WebHookHandler(ReportingHandler):
             LOG.warning("failed posting event: %s", event.as_string())
 
 
+class JournalHandler(ReportingHandler):
+    """Append the timing of finished events to a per-boot journal file.
+
+    Each line records the event name, result and its monotonic start and
+    end times; 'cloud-init analyze' reads the resulting journals.
+    """
+
+    def __init__(self, journal_dir=None, keep=None):
+        super(JournalHandler, self).__init__()
+        if journal_dir is None:
+            journal_dir = journal.DEFAULT_JOURNAL_DIR
+        if keep is None:
+            keep = journal.DEFAULT_KEEP
+        self.journal_dir = journal_dir
+        self.keep = int(keep)
+        self._path = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = journal.journal_path(
+                self.journal_dir, journal.get_boot_id())
+        return self._path
+
+    def publish_event(self, event):
+        if event.event_type != 'finish':
+            return
+        line = journal.format_record(event)
+        try:
+            new_boot = not os.path.exists(self.path)
+            util.write_file(self.path, line, omode="ab")
+            if new_boot:
+                journal.prune_journals(self.journal_dir, self.keep)
+        except (IOError, OSError) as e:
+            LOG.warning("failed writing event journal %s: %s", self.path, e)
+
+
 available_handlers = DictRegistry()
 available_handlers.register_item('log', LogHandler)
 available_handlers.register_item('print', PrintHandler)
 available_handlers.register_item('webhook', WebHookHandler)
+available_handlers.register_item('journal', JournalHandler)
 
 # vi: ts=4 expandtab
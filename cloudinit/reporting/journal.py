@@ -0,0 +1,168 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""
+boot event journal.
+
+The journal handler appends one compact json line for every finished event
+to a file named after the current boot id.  Start and end times are taken
+from the monotonic clock carried on events, so the records of the separate
+cloud-init stage processes of one boot can be compared with each other.
+The functions here read those journals back and summarize them.
+"""
+
+import json
+import os
+
+from cloudinit import log as logging
+from cloudinit import util
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = '/var/lib/cloud/data/boot-journal'
+DEFAULT_KEEP = 10
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+JOURNAL_SUFFIX = '.json'
+
+STAGES = ('init-local', 'init-network', 'modules-init', 'modules-config',
+          'modules-final')
+MODULE_PREFIX = 'config-'
+
+
+def get_boot_id():
+    """Return the kernel boot id, or 'unknown' if it cannot be read."""
+    try:
+        return util.load_file(BOOT_ID_FILE).strip()
+    except (IOError, OSError):
+        return 'unknown'
+
+
+def journal_path(journal_dir, boot_id):
+    return os.path.join(journal_dir, boot_id + JOURNAL_SUFFIX)
+
+
+def list_journals(journal_dir):
+    """Return journal file paths in journal_dir, oldest first."""
+    if not os.path.isdir(journal_dir):
+        return []
+    found = []
+    for fname in os.listdir(journal_dir):
+        if not fname.endswith(JOURNAL_SUFFIX):
+            continue
+        path = os.path.join(journal_dir, fname)
+        found.append((os.path.getmtime(path), path))
+    return [path for (_mtime, path) in sorted(found)]
+
+
+def prune_journals(journal_dir, keep=DEFAULT_KEEP):
+    """Remove all but the newest 'keep' journals in journal_dir."""
+    journals = list_journals(journal_dir)
+    if keep < 1 or len(journals) <= keep:
+        return
+    for path in journals[:-keep]:
+        util.del_file(path)
+
+
+def format_record(event):
+    """Render a finish event as a journal line."""
+    record = {'name': event.name, 'result': event.result,
+              'start': event.start_monotonic, 'end': event.monotonic,
+              'time': event.timestamp}
+    return json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n'
+
+
+def load_journal(path):
+    """Return the list of records stored in the journal at path.
+
+    Lines that can not be decoded (a stage killed mid-write) are skipped.
+    """
+    records = []
+    for line in util.load_file(path).splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            LOG.debug("Skipping malformed line in %s: %s", path, line)
+            continue
+        if not isinstance(record, dict) or 'name' not in record:
+            continue
+        records.append(record)
+    return records
+
+
+def duration(record):
+    """Return the seconds a record took, or None without a start time."""
+    if record.get('start') is None or record.get('end') is None:
+        return None
+    return max(0.0, record['end'] - record['start'])
+
+
+def summarize(records):
+    """Summarize journal records.
+
+    :return: a dictionary with 'stages' mapping stage name to seconds,
+        'modules' mapping module event name to seconds and 'total' as the
+        span from the first stage start to the last stage end.
+    """
+    stages = {}
+    modules = {}
+    first = last = None
+    for record in records:
+        took = duration(record)
+        if took is None:
+            continue
+        name = record['name']
+        if '/' not in name:
+            stages[name] = stages.get(name, 0.0) + took
+            if first is None or record['start'] < first:
+                first = record['start']
+            if last is None or record['end'] > last:
+                last = record['end']
+        elif name.rsplit('/', 1)[1].startswith(MODULE_PREFIX):
+            modules[name] = modules.get(name, 0.0) + took
+    total = (last - first) if first is not None else 0.0
+    return {'stages': stages, 'modules': modules, 'total': total}
+
+
+def _stage_order(name):
+    if name in STAGES:
+        return (STAGES.index(name), name)
+    return (len(STAGES), name)
+
+
+def format_summary(summary, previous=None, top=10):
+    """Return a text report for a summary.
+
+    :param previous: optional summary of an earlier boot; when given each
+        stage and module line also shows the change from that boot.
+    :param top: how many of the slowest modules to list.
+    """
+    def fmt(name, secs, prev):
+        line = '  %-44s %9.3fs' % (name, secs)
+        if prev is not None:
+            if name in prev:
+                line += ' %+9.3fs' % (secs - prev[name])
+            else:
+                line += ' %10s' % 'new'
+        return line
+
+    prev_stages = prev_modules = None
+    if previous is not None:
+        prev_stages = previous['stages']
+        prev_modules = previous['modules']
+
+    lines = ['Stages:']
+    for name in sorted(summary['stages'], key=_stage_order):
+        lines.append(fmt(name, summary['stages'][name], prev_stages))
+    lines.append(fmt('total', summary['total'],
+                     None if previous is None else
+                     {'total': previous['total']}))
+
+    slowest = sorted(summary['modules'].items(),
+                     key=lambda item: (-item[1], item[0]))[:top]
+    lines.append('Slowest modules:')
+    for name, secs in slowest:
+        lines.append(fmt(name, secs, prev_modules))
+    return '\n'.join(lines) + '\n'
+
+# vi: ts=4 expandtab
@@ -6,8 +6,14 @@
 
 import yaml
 
+# libyaml's loader is several times faster, when python-yaml has it
+try:
+    _SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    _SafeLoader = yaml.SafeLoader
 
-class _CustomSafeLoader(yaml.SafeLoader):
+
+class _CustomSafeLoader(_SafeLoader):
     def construct_python_unicode(self, node):
         return self.construct_scalar(node)
 
@@ -16,6 +16,9 @@ CLOUD_CONFIG = '/etc/cloud/cloud.cfg'
 
 RUN_CLOUD_CONFIG = '/run/cloud-init/cloud.cfg'
 
+# Parsed CLOUD_CONFIG and its conf.d, shared by the processes of a boot
+CLOUD_CONFIG_CACHE = '/run/cloud-init/cloud.cfg.cache.json'
+
 # What u get if no config is provided
 CFG_BUILTIN = {
     'datasource_list': [
@@ -11,13 +11,14 @@ from functools import partial
 import os
 import os.path
 import re
-import time
 from xml.dom import minidom
 import xml.etree.ElementTree as ET
 
+from cloudinit import inotify
 from cloudinit import log as logging
 from cloudinit import sources
-from cloudinit.sources.helpers.azure import get_metadata_from_fabric
+from cloudinit.sources.helpers.azure import (
+    certificate_to_ssh_key, get_metadata_from_fabric)
 from cloudinit import util
 
 LOG = logging.getLogger(__name__)
@@ -389,7 +390,8 @@ class DataSourceAzureNet(sources.DataSource):
 
             metadata_func = partial(get_metadata_from_fabric,
                                     fallback_lease_file=self.
-                                    dhclient_lease_file)
+                                    dhclient_lease_file,
+                                    key_dir=self._transport_key_dir())
         else:
             metadata_func = self.get_metadata_from_agent
 
@@ -404,6 +406,15 @@ class DataSourceAzureNet(sources.DataSource):
 
         return True
 
+    def _transport_key_dir(self):
+        # the key pair used to talk to the fabric is kept with the instance
+        # (whose id is the system uuid) so later boots can reuse it
+        iid = util.read_dmi_data('system-uuid')
+        if not iid:
+            return None
+        return os.path.join(self.paths.get_cpath(), 'instances',
+                            str(iid).replace(os.sep, '_'), 'data', 'azure')
+
     def device_name_to_device(self, name):
         return self.ds_cfg['disk_aliases'].get(name)
 
@@ -556,6 +567,12 @@ def perform_hostname_bounce(hostname, cfg, prev_hostname):
 
 
 def crtfile_to_pubkey(fname, data=None):
+    try:
+        if data is None:
+            data = util.load_file(fname)
+        return certificate_to_ssh_key(data)
+    except (IOError, ValueError) as e:
+        LOG.debug("Converting %s with openssl: %s", fname, e)
     pipeline = ('openssl x509 -noout -pubkey < "$0" |'
                 'ssh-keygen -i -m PKCS8 -f /dev/stdin')
     (out, _err) = util.subp(['sh', '-c', pipeline, fname],
@@ -579,21 +596,18 @@ def pubkeys_from_crt_files(flist):
 
 
 def wait_for_files(flist, maxwait=60, naplen=.5, log_pre=""):
-    need = set(flist)
-    waited = 0
-    while True:
-        need -= set([f for f in need if os.path.exists(f)])
-        if len(need) == 0:
-            LOG.debug("%sAll files appeared after %s seconds: %s",
-                      log_pre, waited, flist)
-            return []
-        if waited == 0:
-            LOG.info("%sWaiting up to %s seconds for the following files: %s",
-                     log_pre, maxwait, flist)
-        if waited + naplen > maxwait:
-            break
-        time.sleep(naplen)
-        waited += naplen
+    need = set([f for f in flist if not os.path.exists(f)])
+    if need:
+        LOG.info("%sWaiting up to %s seconds for the following files: %s",
+                 log_pre, maxwait, flist)
+        (need, waited) = inotify.wait_for_paths(need, maxwait=maxwait,
+                                                naplen=naplen)
+    else:
+        waited = 0
+    if len(need) == 0:
+        LOG.debug("%sAll files appeared after %.3f seconds: %s",
+                  log_pre, waited, flist)
+        return []
 
     LOG.warning("%sStill missing files after %s seconds: %s",
                 log_pre, maxwait, need)
@@ -46,6 +46,9 @@ class DataSourceCloudSigma(sources.DataSource):
         LOG.warning("failed to query dmi data for system product name")
         return False
 
+    def detect(self):
+        return self.is_running_in_cloudsigma()
+
     def get_data(self):
         """
         Metadata is the whole server context and /meta/cloud-config is used
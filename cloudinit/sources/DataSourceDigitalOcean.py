@@ -44,6 +44,10 @@ class DataSourceDigitalOcean(sources.DataSource):
     def _get_sysinfo(self):
         return do_helper.read_sysinfo()
 
+    def detect(self):
+        (is_do, _droplet_id) = self._get_sysinfo()
+        return is_do
+
     def get_data(self):
         (is_do, droplet_id) = self._get_sysinfo()
 
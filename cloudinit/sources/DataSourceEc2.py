@@ -53,6 +53,13 @@ class DataSourceEc2(sources.DataSource):
         self.seed_dir = os.path.join(paths.seed_dir, "ec2")
         self.api_ver = DEF_MD_VERSION
 
+    def detect(self):
+        if os.path.isdir(self.seed_dir):
+            return None
+        if self.cloud_platform == Platforms.NO_EC2_METADATA:
+            return False
+        return None
+
     def get_data(self):
         seed_ret = {}
         if util.read_optional_seed(seed_ret, base=(self.seed_dir + "/")):
@@ -143,8 +150,9 @@ class DataSourceEc2(sources.DataSource):
             url2base[cur] = url
 
         start_time = time.time()
-        url = uhelp.wait_for_url(urls=urls, max_wait=max_wait,
-                                 timeout=timeout, status_cb=LOG.warn)
+        url = uhelp.wait_for_url(
+            urls=urls, max_wait=max_wait, timeout=timeout, status_cb=LOG.warn,
+            race=util.is_true(mcfg.get("race_metadata_urls", False)))
 
         if url:
             LOG.debug("Using metadata source: '%s'", url2base[url])
@@ -3,6 +3,9 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 from base64 import b64decode
+import json
+
+import six
 
 from cloudinit import log as logging
 from cloudinit import sources
@@ -22,8 +25,52 @@ class GoogleMetadataFetcher(object):
 
     def __init__(self, metadata_address):
         self.metadata_address = metadata_address
+        self.tree = None
+
+    def fetch_tree(self):
+        """Read the whole metadata tree with a single recursive request.
+
+        Once it is read get_value answers from it instead of making a
+        request per path.  Returns True if the tree was read, False if it
+        could not be, in which case values are fetched one by one.  A
+        UrlError is raised if the metadata server did not answer at all.
+        """
+        try:
+            resp = url_helper.readurl(
+                url=self.metadata_address + '?recursive=true',
+                headers=self.headers)
+        except url_helper.UrlError as exc:
+            if exc.code is None:
+                raise
+            LOG.debug("recursive metadata request returned code %s",
+                      exc.code)
+            return False
+        try:
+            self.tree = util.load_json(resp.contents)
+        except (ValueError, TypeError) as exc:
+            LOG.debug("recursive metadata was not a json dictionary: %s",
+                      exc)
+            return False
+        return True
+
+    def _get_tree_value(self, path, is_text):
+        value = self.tree
+        for part in path.split('/'):
+            if not isinstance(value, dict) or part not in value:
+                return None
+            value = value[part]
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        elif not isinstance(value, six.string_types):
+            # 'instance/id' is a number in the json tree
+            value = str(value)
+        if not is_text:
+            value = util.encode_text(value)
+        return value
 
     def get_value(self, path, is_text):
+        if self.tree is not None:
+            return self._get_tree_value(path, is_text)
         value = None
         try:
             resp = url_helper.readurl(url=self.metadata_address + path,
@@ -61,6 +108,9 @@ class DataSourceGCE(sources.DataSource):
         except Exception:
             return public_key
 
+    def detect(self):
+        return platform_reports_gce()
+
     def get_data(self):
         if not platform_reports_gce():
             return False
@@ -77,12 +127,14 @@ class DataSourceGCE(sources.DataSource):
              False, True),
         ]
 
-        # if we cannot resolve the metadata server, then no point in trying
-        if not util.is_resolvable_url(self.metadata_address):
-            LOG.debug("%s is not resolvable", self.metadata_address)
+        metadata_fetcher = GoogleMetadataFetcher(self.metadata_address)
+        # one request for everything, falling back to a request per path
+        try:
+            metadata_fetcher.fetch_tree()
+        except url_helper.UrlError as exc:
+            LOG.debug("%s is not reachable: %s", self.metadata_address, exc)
             return False
 
-        metadata_fetcher = GoogleMetadataFetcher(self.metadata_address)
         # iterate over url_map keys to get metadata items
         running_on_gce = False
         for (mkey, paths, required, is_text) in url_map:
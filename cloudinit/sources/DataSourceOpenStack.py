@@ -85,8 +85,9 @@ class DataSourceOpenStack(openstack.SourceMixin, sources.DataSource):
 
         (max_wait, timeout, retries) = self._get_url_settings()
         start_time = time.time()
+        race = util.is_true(self.ds_cfg.get("race_metadata_urls", False))
         avail_url = url_helper.wait_for_url(urls=md_urls, max_wait=max_wait,
-                                            timeout=timeout)
+                                            timeout=timeout, race=race)
         if avail_url:
             LOG.debug("Using metadata source: '%s'", url2base[avail_url])
         else:
@@ -76,6 +76,7 @@ NO_BASE64_DECODE = [
 METADATA_SOCKFILE = '/native/.zonecontrol/metadata.sock'
 SERIAL_DEVICE = '/dev/ttyS1'
 SERIAL_TIMEOUT = 60
+READ_SIZE = 4096
 
 # BUILT-IN DATASOURCE CONFIGURATION
 #  The following is the built-in configuration. If the values
@@ -226,12 +227,23 @@ class DataSourceSmartOS(sources.DataSource):
                       self.md_client)
             return False
 
+        # fetch every key in one pipelined batch rather than a round trip
+        # (and an open of the transport) per key
+        keys = ([smartos_noun for (smartos_noun, _strip) in
+                 SMARTOS_ATTRIB_MAP.values()] +
+                list(SMARTOS_ATTRIB_JSON.values()))
+        values = dict(zip(keys, self.md_client.get_many(keys)))
+
         for ci_noun, attribute in SMARTOS_ATTRIB_MAP.items():
             smartos_noun, strip = attribute
-            md[ci_noun] = self.md_client.get(smartos_noun, strip=strip)
+            val = values[smartos_noun]
+            if val and strip:
+                val = val.strip()
+            md[ci_noun] = val
 
         for ci_noun, smartos_noun in SMARTOS_ATTRIB_JSON.items():
-            md[ci_noun] = self.md_client.get_json(smartos_noun)
+            val = values[smartos_noun]
+            md[ci_noun] = None if val is None else json.loads(val)
 
         # @datadictionary: This key may contain a program that is written
         # to a file in the filesystem of the guest on each boot and then
@@ -324,12 +336,14 @@ class JoyentMetadataClient(object):
         r'V2 (?P<length>\d+) (?P<checksum>[0-9a-f]+)'
         r' (?P<body>(?P<request_id>[0-9a-f]+) (?P<status>SUCCESS|NOTFOUND)'
         r'( (?P<payload>.+))?)')
+    frame_id_regex = re.compile(r'V2 \d+ [0-9a-f]+ (?P<request_id>[0-9a-f]+) ')
 
     def __init__(self, smartos_type=None, fp=None):
         if smartos_type is None:
             smartos_type = get_smartos_environ()
         self.smartos_type = smartos_type
         self.fp = fp
+        self._rbuf = bytearray()
 
     def _checksum(self, body):
         return '{0:08x}'.format(
@@ -357,39 +371,84 @@ class JoyentMetadataClient(object):
         LOG.debug('Value "%s" found.', value)
         return value
 
-    def request(self, rtype, param=None):
-        request_id = '{0:08x}'.format(random.randint(0, 0xffffffff))
+    def _frame(self, request_id, rtype, param=None):
         message_body = ' '.join((request_id, rtype,))
         if param:
             message_body += ' ' + base64.b64encode(param.encode()).decode()
-        msg = 'V2 {0} {1} {2}\n'.format(
+        return 'V2 {0} {1} {2}\n'.format(
             len(message_body), self._checksum(message_body), message_body)
-        LOG.debug('Writing "%s" to metadata transport.', msg)
+
+    def _read_chunk(self):
+        """Read at least one byte from the transport.
+
+        Transports that can say what is already buffered return all of it,
+        so a frame is not read one byte at a time.
+        """
+        read1 = getattr(self.fp, 'read1', None)
+        if read1 is not None:
+            return read1(READ_SIZE)
+        return self.fp.read(1)
+
+    def _readline(self):
+        while True:
+            end = self._rbuf.find(b'\n')
+            if end >= 0:
+                line = bytes(self._rbuf[:end])
+                del self._rbuf[:end + 1]
+                return line.rstrip().decode('ascii')
+            chunk = self._read_chunk()
+            if not chunk:
+                raise JoyentMetadataFetchException(
+                    'Timed out reading from metadata transport.')
+            self._rbuf.extend(chunk)
+
+    def _request_many(self, requests):
+        """Send all requests at once and return their values in order.
+
+        requests is a list of (rtype, param).  Each request gets its own
+        request id and replies are matched back by id, so they do not
+        have to arrive in the order the requests were written.
+        """
+        first_id = random.randint(0, 0xffffffff)
+        pending = {}
+        msgs = []
+        for (num, (rtype, param)) in enumerate(requests):
+            request_id = '{0:08x}'.format((first_id + num) & 0xffffffff)
+            pending[request_id] = num
+            msgs.append(self._frame(request_id, rtype, param))
+        LOG.debug('Writing "%s" to metadata transport.', ''.join(msgs))
 
         need_close = False
         if not self.fp:
             self.open_transport()
             need_close = True
 
-        self.fp.write(msg.encode('ascii'))
-        self.fp.flush()
-
-        response = bytearray()
-        response.extend(self.fp.read(1))
-        while response[-1:] != b'\n':
-            response.extend(self.fp.read(1))
-
-        if need_close:
-            self.close_transport()
-
-        response = response.rstrip().decode('ascii')
-        LOG.debug('Read "%s" from metadata transport.', response)
-
-        if 'SUCCESS' not in response:
-            return None
+        values = [None] * len(requests)
+        try:
+            self.fp.write(''.join(msgs).encode('ascii'))
+            self.fp.flush()
+
+            while pending:
+                response = self._readline()
+                LOG.debug('Read "%s" from metadata transport.', response)
+                match = self.frame_id_regex.match(response)
+                request_id = match.group('request_id') if match else None
+                if request_id not in pending:
+                    raise JoyentMetadataFetchException(
+                        'Request ID mismatch (expected one of: {0}; got '
+                        '{1}).'.format(', '.join(sorted(pending)),
+                                       request_id))
+                num = pending.pop(request_id)
+                if 'SUCCESS' in response:
+                    values[num] = self._get_value_from_frame(request_id,
+                                                             response)
+        finally:
+            if need_close:
+                self.close_transport()
+        return values
 
-        value = self._get_value_from_frame(request_id, response)
-        return value
+    def request(self, rtype, param=None):
+        return self._request_many([(rtype, param)])[0]
 
     def get(self, key, default=None, strip=False):
         result = self.request(rtype='GET', param=key)
@@ -405,6 +464,20 @@ class JoyentMetadataClient(object):
             return default
         return json.loads(result)
 
+    def get_many(self, keys):
+        """Return the values of keys in order, None for those not found.
+
+        All the GETs are pipelined over a single open of the transport.  If
+        that fails the keys are fetched again one request at a time.
+        """
+        try:
+            return self._request_many([('GET', key) for key in keys])
+        except JoyentMetadataFetchException as e:
+            LOG.debug('Pipelined metadata requests failed, retrying one at'
+                      ' a time: %s', e)
+            self.close_transport()
+            return [self.request(rtype='GET', param=key) for key in keys]
+
     def list(self):
         result = self.request(rtype='KEYS')
         if result:
@@ -423,6 +496,7 @@ class JoyentMetadataClient(object):
         if self.fp:
             self.fp.close()
             self.fp = None
+        del self._rbuf[:]
 
     def __enter__(self):
         if self.fp:
@@ -470,6 +544,16 @@ class JoyentMetadataSerialClient(JoyentMetadataClient):
             raise SystemError("Unable to open %s" % self.device)
         self.fp = ser
 
+    def _read_chunk(self):
+        # block for the first byte, then take whatever else has arrived
+        data = self.fp.read(1)
+        waiting = getattr(self.fp, 'in_waiting', None)
+        if waiting is None and hasattr(self.fp, 'inWaiting'):
+            waiting = self.fp.inWaiting()
+        if data and waiting:
+            data += self.fp.read(min(waiting, READ_SIZE))
+        return data
+
     def __repr__(self):
         return "%s(device=%s, timeout=%s)" % (
             self.__class__.__name__, self.device, self.timeout)
@@ -544,24 +628,33 @@ class JoyentMetadataLegacySerialClient(JoyentMetadataSerialClient):
 
         return key in self.base64_keys
 
-    def get(self, key, default=None, strip=False):
-        mdefault = object()
-        val = self._get(key, strip=False, default=mdefault)
-        if val is mdefault:
-            return default
-
+    def _b64_decode(self, key, val):
         if self.is_b64_encoded(key):
             try:
                 val = base64.b64decode(val.encode()).decode()
             # Bogus input produces different errors in Python 2 and 3
             except (TypeError, binascii.Error):
                 LOG.warning("Failed base64 decoding key '%s': %s", key, val)
+        return val
+
+    def get(self, key, default=None, strip=False):
+        mdefault = object()
+        val = self._get(key, strip=False, default=mdefault)
+        if val is mdefault:
+            return default
+
+        val = self._b64_decode(key, val)
 
         if strip:
             val = val.strip()
 
         return val
 
+    def get_many(self, keys):
+        vals = super(JoyentMetadataLegacySerialClient, self).get_many(keys)
+        return [self._b64_decode(key, val) if val is not None else None
+                for (key, val) in zip(keys, vals)]
+
 
 def jmc_client_factory(
         smartos_type=None, metadata_sockfile=METADATA_SOCKFILE,
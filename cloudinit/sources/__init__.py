@@ -9,9 +9,12 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import abc
+import base64
 import copy
+import json
 import os
 import six
+import time
 
 from cloudinit import importer
 from cloudinit import log as logging
@@ -29,6 +32,21 @@ DSMODE_PASS = "pass"
 
 VALID_DSMODES = [DSMODE_DISABLED, DSMODE_LOCAL, DSMODE_NETWORK]
 
+# Version of the datasource cache format written by cache_dump.
+CACHE_VERSION = 1
+
+# Attributes that are never cached; they are recreated by __init__ or, for
+# the processed user/vendor data, derived again from the raw data.  ds_cfg
+# is cached, datasources merge their own settings into it.
+CACHE_EXCLUDED_ATTRS = frozenset([
+    'sys_cfg', 'distro', 'paths', 'ud_proc', 'userdata', 'vendordata',
+    '_cache_pending'])
+
+# Attributes a restored datasource can not do without; if one of these does
+# not come back from json as it is, the datasource is not cached at all.
+CACHE_REQUIRED_ATTRS = ('metadata', 'userdata_raw', 'vendordata_raw',
+                        'ds_cfg')
+
 DEP_FILESYSTEM = "FILESYSTEM"
 DEP_NETWORK = "NETWORK"
 DS_PREFIX = 'DataSource'
@@ -77,6 +95,26 @@ class DataSource(object):
     def __str__(self):
         return type_utils.obj_name(self)
 
+    def __getattr__(self, name):
+        # Only called for attributes not otherwise found: decode cached
+        # fields (see restore_from_cache) the first time they are used.
+        pending = self.__dict__.get('_cache_pending')
+        if not pending or name not in pending:
+            raise AttributeError(name)
+        value = _cache_decode(pending.pop(name))
+        setattr(self, name, value)
+        return value
+
+    def detect(self):
+        """Cheaply report if this datasource could be present.
+
+        This must not have side effects (no network configuration, no
+        mounts, no writes) so that it can be run alongside other datasources'
+        detection.  Return True or False when it can tell, and None when
+        only get_data can tell.
+        """
+        return None
+
     def get_userdata(self, apply_filter=False):
         if self.userdata is None:
             self.userdata = self.ud_proc.process(self.get_userdata_raw())
@@ -293,25 +331,76 @@ def normalize_pubkey_data(pubkey_data):
     return keys
 
 
+def _detect_source(ds):
+    if ds is None:
+        # The datasource could not even be created.
+        return (False, None)
+    start_time = time.time()
+    try:
+        found = ds.detect()
+    except Exception:
+        util.logexc(LOG, "Detecting %s failed", ds)
+        found = None
+    return (found, time.time() - start_time)
+
+
+def detect_sources(sources):
+    """Run the detect phase of all datasource instances concurrently.
+
+    Returns a list of (detected, seconds) tuples in the order of sources.
+    """
+    return util.map_threaded(_detect_source, sources)
+
+
 def find_source(sys_cfg, distro, paths, ds_deps, cfg_list, pkg_list, reporter):
     ds_list = list_sources(cfg_list, ds_deps, pkg_list)
     ds_names = [type_utils.obj_name(f) for f in ds_list]
     mode = "network" if DEP_NETWORK in ds_deps else "local"
     LOG.debug("Searching for %s data source in: %s", mode, ds_names)
 
-    for name, cls in zip(ds_names, ds_list):
+    # In parallel detect mode every candidate is created and detected up
+    # front; get_data then runs in datasource_list order for candidates not
+    # ruled out, so the first in the list still wins.
+    candidates = [None] * len(ds_list)
+    detections = [(None, None)] * len(ds_list)
+    if util.is_true(sys_cfg.get('datasource_parallel_detect', False)):
+        for (i, cls) in enumerate(ds_list):
+            try:
+                candidates[i] = cls(sys_cfg, distro, paths)
+            except Exception:
+                util.logexc(LOG, "Creating %s failed", cls)
+        detections = detect_sources(candidates)
+
+    for name, cls, s, (detected, detect_time) in zip(
+            ds_names, ds_list, candidates, detections):
         myrep = events.ReportEventStack(
             name="search-%s" % name.replace("DataSource", ""),
             description="searching for %s data from %s" % (mode, name),
             message="no %s data found from %s" % (mode, name),
             parent=reporter)
+        start_time = time.time()
+        timing = ""
+        if detect_time is not None:
+            timing = "detect %.3f seconds, " % detect_time
         try:
             with myrep:
+                if detected is False:
+                    myrep.message = (
+                        "no %s data found from %s (%snot detected)" %
+                        (mode, name, timing))
+                    continue
                 LOG.debug("Seeing if we can get any data from %s", cls)
-                s = cls(sys_cfg, distro, paths)
-                if s.get_data():
-                    myrep.message = "found %s data from %s" % (mode, name)
+                if s is None:
+                    s = cls(sys_cfg, distro, paths)
+                found = s.get_data()
+                timing += "search %.3f seconds" % (time.time() - start_time)
+                LOG.debug("Searching %s took: %s", name, timing)
+                if found:
+                    myrep.message = "found %s data from %s (%s)" % (
+                        mode, name, timing)
                     return (s, type_utils.obj_name(cls))
+                myrep.message = "no %s data found from %s (%s)" % (
+                    mode, name, timing)
         except Exception:
             util.logexc(LOG, "Getting data from %s failed", cls)
 
@@ -345,6 +434,123 @@ def list_sources(cfg_list, depends, pkg_list):
     return src_list
 
 
+class CacheError(Exception):
+    pass
+
+
+def _cache_encode_default(value):
+    if isinstance(value, six.binary_type):
+        return {'ci-b64': base64.b64encode(value).decode('ascii')}
+    raise TypeError("%r is not serializable" % type(value))
+
+
+def _cache_object_hook(obj):
+    if len(obj) == 1 and 'ci-b64' in obj:
+        return base64.b64decode(obj['ci-b64'])
+    return obj
+
+
+def _cache_decode(field):
+    return util.native_strings(
+        json.loads(field, object_hook=_cache_object_hook))
+
+
+def cache_dump(ds):
+    """Return the datasource's cacheable state as a json string.
+
+    Every attribute that json restores as it is (bytes are allowed) is
+    stored, each encoded as a separate json document so that
+    restore_from_cache can decode them independently and only when used.
+    Other attributes, such as tuples or dicts with int keys, are left to
+    __init__.  A network config is only stored if it was already computed.
+    Raises CacheError if one of CACHE_REQUIRED_ATTRS can not be stored.
+    """
+    fields = {}
+    for (name, value) in vars(ds).items():
+        if name in CACHE_EXCLUDED_ATTRS:
+            continue
+        try:
+            fields[name] = json.dumps(value, default=_cache_encode_default,
+                                      sort_keys=True)
+        except (TypeError, ValueError) as e:
+            # UnicodeDecodeError included: binary data in a python 2 str
+            reason = str(e)
+        else:
+            if util.is_exact_copy(value, _cache_decode(fields[name])):
+                continue
+            del fields[name]
+            reason = "it changes in json"
+        if name in CACHE_REQUIRED_ATTRS:
+            raise CacheError("attribute %s of %s can not be cached: %s" %
+                             (name, ds, reason))
+        LOG.debug("Not caching attribute %s of %s: %s", name, ds, reason)
+    pending = vars(ds).get('_cache_pending') or {}
+    for (name, field) in pending.items():
+        fields.setdefault(name, field)
+    if 'metadata' not in fields:
+        raise CacheError("datasource %s has no cacheable metadata" % ds)
+    cls = ds.__class__
+    return json.dumps({
+        'version': CACHE_VERSION,
+        'datasource': {'module': cls.__module__, 'class': cls.__name__},
+        'instance-id': str(ds.get_instance_id()),
+        'fields': fields,
+    }, sort_keys=True)
+
+
+def restore_from_cache(blob, sys_cfg, distro, paths):
+    """Recreate a datasource from a cache_dump string.
+
+    The datasource class is instantiated anew with the given sys_cfg,
+    distro and paths, so changes to a class' layout between versions do not
+    invalidate a cache.  Cached fields are only decoded when first used.
+    Raises CacheError if blob is not a valid cache.
+    """
+    try:
+        data = json.loads(util.decode_binary(blob))
+    except (TypeError, ValueError) as e:
+        raise CacheError("cache is not valid json: %s" % e)
+    if not isinstance(data, dict):
+        raise CacheError("cache is not a dictionary")
+    version = data.get('version')
+    if version != CACHE_VERSION:
+        raise CacheError("unsupported cache version %s" % version)
+    dsinfo = data.get('datasource')
+    fields = data.get('fields')
+    if not (isinstance(dsinfo, dict) and isinstance(fields, dict)):
+        raise CacheError("cache is missing datasource or fields")
+    if not all(isinstance(v, six.string_types) for v in fields.values()):
+        raise CacheError("cache fields must be encoded strings")
+    if not isinstance(data.get('instance-id'), six.string_types):
+        raise CacheError("cache has no instance-id")
+    if 'metadata' not in fields:
+        raise CacheError("cache has no metadata")
+    try:
+        mod = importer.import_module(dsinfo['module'])
+        cls = getattr(mod, dsinfo['class'])
+    except (KeyError, ImportError, AttributeError) as e:
+        raise CacheError("cached datasource class is unavailable: %s" % e)
+    if not (isinstance(cls, type) and issubclass(cls, DataSource)):
+        raise CacheError("cached class %s is not a datasource" % cls)
+
+    ds = cls(sys_cfg, distro, paths)
+    pending = {}
+    for (name, field) in fields.items():
+        if hasattr(cls, name):
+            # A class attribute would hide the field from __getattr__.
+            try:
+                setattr(ds, name, _cache_decode(field))
+            except (AttributeError, ValueError) as e:
+                LOG.debug("Not restoring attribute %s of %s: %s", name, ds, e)
+            continue
+        # Remove what __init__ set so that __getattr__ decodes the cached
+        # value on first use.
+        ds.__dict__.pop(name, None)
+        pending[name] = field
+    ds._cache_pending = pending
+    return ds
+
+
 def instance_id_matches_system_uuid(instance_id, field='system-uuid'):
     # quickly (local check only) if self.instance_id is still valid
     # we check kernel command line or files.
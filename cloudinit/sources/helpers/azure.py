@@ -1,5 +1,8 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import base64
+import binascii
+import datetime
 import json
 import logging
 import os
@@ -15,9 +18,23 @@ from xml.etree import ElementTree
 
 from cloudinit import util
 
+try:
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
 
 LOG = logging.getLogger(__name__)
 
+# DER encoding of the rsaEncryption object identifier (1.2.840.113549.1.1.1)
+RSA_ENCRYPTION_OID = b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x01\x01'
+
 
 @contextmanager
 def cd(newdir):
@@ -29,6 +46,130 @@ def cd(newdir):
         os.chdir(prevdir)
 
 
+def _der_element(data, offset):
+    """Return (tag, start, end) of the DER element of data at offset."""
+    if offset + 2 > len(data):
+        raise ValueError('Truncated DER element')
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        num = length & 0x7f
+        if not 0 < num <= 4 or offset + num > len(data):
+            raise ValueError('Bad DER length')
+        length = int(binascii.hexlify(data[offset:offset + num]), 16)
+        offset += num
+    if offset + length > len(data):
+        raise ValueError('Truncated DER element')
+    return (tag, offset, offset + length)
+
+
+def _der_children(data, start, end, count=0):
+    """Return the DER elements in data[start:end], at least count of them."""
+    children = []
+    while start < end:
+        element = _der_element(data, start)
+        children.append(element)
+        start = element[2]
+    if len(children) < count:
+        raise ValueError('Expected %d DER elements, found %d' %
+                         (count, len(children)))
+    return children
+
+
+def _ssh_string(data):
+    return struct.pack('>I', len(data)) + bytes(data)
+
+
+def certificate_to_ssh_key(certificate):
+    """Return the 'ssh-rsa ...' public key of a PEM encoded certificate.
+
+    This is what 'openssl x509 -pubkey | ssh-keygen -i -m PKCS8' would
+    print, worked out without running either.  ValueError is raised for
+    anything but an RSA key in a well formed certificate.
+    """
+    body = [line for line in certificate.strip().splitlines()
+            if line and not line.startswith('-----')]
+    try:
+        data = bytearray(base64.b64decode(''.join(body)))
+    except (TypeError, binascii.Error) as e:
+        raise ValueError('Certificate is not base64 encoded: %s' % e)
+    (_tag, start, end) = _der_element(data, 0)
+    (_tag, start, end) = _der_children(data, start, end, 1)[0]
+    tbs = _der_children(data, start, end)
+    if tbs and tbs[0][0] == 0xa0:
+        # explicitly tagged version
+        tbs = tbs[1:]
+    # serialNumber, signature, issuer, validity, subject, subjectPublicKeyInfo
+    if len(tbs) < 6:
+        raise ValueError('Certificate has no subjectPublicKeyInfo')
+    (_tag, start, end) = tbs[5]
+    (algorithm, public_key) = _der_children(data, start, end, 2)[:2]
+    oid = _der_children(data, algorithm[1], algorithm[2], 1)[0]
+    if bytes(data[oid[1] - 2:oid[2]]) != RSA_ENCRYPTION_OID:
+        raise ValueError('Certificate does not hold an RSA key')
+    # skip the count of unused bits at the start of the BIT STRING
+    (_tag, start, end) = _der_element(data, public_key[1] + 1)
+    (modulus, exponent) = _der_children(data, start, end, 2)[:2]
+    # DER INTEGERs are already in the form ssh wants for an mpint
+    blob = (_ssh_string(b'ssh-rsa') +
+            _ssh_string(data[exponent[1]:exponent[2]]) +
+            _ssh_string(data[modulus[1]:modulus[2]]))
+    return 'ssh-rsa ' + base64.b64encode(blob).decode('ascii')
+
+
+def _certificate_to_ssh_key_subp(certificate):
+    public_key, _ = util.subp(
+        'openssl x509 -noout -pubkey |'
+        'ssh-keygen -i -m PKCS8 -f /dev/stdin',
+        data=certificate,
+        shell=True)
+    return public_key.rstrip()
+
+
+def certificates_to_ssh_keys(certificates):
+    """Convert a list of PEM certificates to a list of ssh public keys.
+
+    Keys are converted in-process, only those that cannot be (not RSA)
+    go through openssl and ssh-keygen.
+    """
+    keys = []
+    for certificate in certificates:
+        try:
+            keys.append(certificate_to_ssh_key(certificate))
+        except ValueError as e:
+            LOG.debug('Converting certificate with openssl: %s', e)
+            keys.append(_certificate_to_ssh_key_subp(certificate))
+    return keys
+
+
+def _random_serial_number():
+    # x509.random_serial_number is only in cryptography 1.6 and later; this
+    # is the same positive number of at most 159 bits.
+    return int(binascii.hexlify(os.urandom(20)), 16) >> 1
+
+
+def _generate_transport_keypair(private_key_file, certificate_file):
+    """Write a new RSA key and self-signed certificate without openssl."""
+    backend = default_backend()
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=backend)
+    name = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, u'LinuxTransport')])
+    now = datetime.datetime.utcnow()
+    certificate = x509.CertificateBuilder().subject_name(
+        name).issuer_name(name).public_key(key.public_key()).serial_number(
+        _random_serial_number()).not_valid_before(now).not_valid_after(
+        now + datetime.timedelta(days=32768)).sign(
+        key, hashes.SHA256(), backend)
+    util.write_file(private_key_file, key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()), mode=0o600)
+    util.write_file(certificate_file, certificate.public_bytes(
+        serialization.Encoding.PEM), mode=0o600)
+
+
 def _get_dhcp_endpoint_option_name():
     if util.is_FreeBSD():
         azure_endpoint = "option-245"
@@ -110,26 +251,77 @@ class OpenSSLManager(object):
         'certificate': 'TransportCert.pem',
     }
 
-    def __init__(self):
+    def __init__(self, key_dir=None):
         self.tmpdir = tempfile.mkdtemp()
+        self.key_dir = key_dir
         self.certificate = None
         self.generate_certificate()
 
     def clean_up(self):
         util.del_dir(self.tmpdir)
 
+    def _copy_keypair(self, src, dst):
+        for name in self.certificate_names.values():
+            util.write_file(os.path.join(dst, name),
+                            util.load_file(os.path.join(src, name),
+                                           decode=False),
+                            mode=0o600)
+
+    def _load_cached_keypair(self):
+        if not self.key_dir:
+            return False
+        for name in self.certificate_names.values():
+            if not os.path.isfile(os.path.join(self.key_dir, name)):
+                return False
+        try:
+            self._copy_keypair(self.key_dir, self.tmpdir)
+        except (IOError, OSError) as e:
+            LOG.warning('Failed to read cached transport key pair: %s', e)
+            return False
+        return True
+
+    def _save_keypair(self):
+        if not self.key_dir:
+            return
+        try:
+            util.ensure_dir(self.key_dir, mode=0o700)
+            self._copy_keypair(self.tmpdir, self.key_dir)
+        except (IOError, OSError) as e:
+            LOG.warning('Failed to cache transport key pair in %s: %s',
+                        self.key_dir, e)
+
     def generate_certificate(self):
         LOG.debug('Generating certificate for communication with fabric...')
         if self.certificate is not None:
             LOG.debug('Certificate already generated.')
             return
         with cd(self.tmpdir):
-            util.subp([
-                'openssl', 'req', '-x509', '-nodes', '-subj',
-                '/CN=LinuxTransport', '-days', '32768', '-newkey', 'rsa:2048',
-                '-keyout', self.certificate_names['private_key'],
-                '-out', self.certificate_names['certificate'],
-            ])
+            if self._load_cached_keypair():
+                LOG.debug('Reusing transport key pair from %s', self.key_dir)
+            else:
+                generated = False
+                if HAS_CRYPTOGRAPHY:
+                    try:
+                        _generate_transport_keypair(
+                            os.path.join(
+                                self.tmpdir,
+                                self.certificate_names['private_key']),
+                            os.path.join(
+                                self.tmpdir,
+                                self.certificate_names['certificate']))
+                        generated = True
+                    except Exception as e:
+                        LOG.warning('Failed generating transport key pair,'
+                                    ' falling back to openssl: %s', e)
+                if not generated:
+                    util.subp([
+                        'openssl', 'req', '-x509', '-nodes', '-subj',
+                        '/CN=LinuxTransport', '-days', '32768',
+                        '-newkey', 'rsa:2048',
+                        '-keyout', self.certificate_names['private_key'],
+                        '-out', self.certificate_names['certificate'],
+                    ])
+                self._save_keypair()
             certificate = ''
             for line in open(self.certificate_names['certificate']):
                 if "CERTIFICATE" not in line:
@@ -167,16 +359,8 @@ class OpenSSLManager(object):
             elif re.match(r'[-]+END .*?CERTIFICATE[-]+$', line):
                 certificates.append('\n'.join(current))
                 current = []
-        keys = []
-        for certificate in certificates:
-            with cd(self.tmpdir):
-                public_key, _ = util.subp(
-                    'openssl x509 -noout -pubkey |'
-                    'ssh-keygen -i -m PKCS8 -f /dev/stdin',
-                    data=certificate,
-                    shell=True)
-            keys.append(public_key)
-        return keys
+        with cd(self.tmpdir):
+            return certificates_to_ssh_keys(certificates)
 
 
 class WALinuxAgentShim(object):
@@ -199,9 +383,10 @@ class WALinuxAgentShim(object):
         '  </Container>',
         '</Health>'])
 
-    def __init__(self, fallback_lease_file=None):
+    def __init__(self, fallback_lease_file=None, key_dir=None):
         LOG.debug('WALinuxAgentShim instantiated, fallback_lease_file=%s',
                   fallback_lease_file)
+        self.key_dir = key_dir
         self.dhcpoptions = None
         self._endpoint = None
         self.openssl_manager = None
@@ -314,7 +499,7 @@ class WALinuxAgentShim(object):
         return endpoint_ip_address
 
     def register_with_azure_and_fetch_data(self):
-        self.openssl_manager = OpenSSLManager()
+        self.openssl_manager = OpenSSLManager(key_dir=self.key_dir)
         http_client = AzureEndpointHttpClient(self.openssl_manager.certificate)
         LOG.info('Registering with Azure...')
         attempts = 0
@@ -358,8 +543,9 @@ class WALinuxAgentShim(object):
         LOG.info('Reported ready to Azure fabric.')
 
 
-def get_metadata_from_fabric(fallback_lease_file=None):
-    shim = WALinuxAgentShim(fallback_lease_file=fallback_lease_file)
+def get_metadata_from_fabric(fallback_lease_file=None, key_dir=None):
+    shim = WALinuxAgentShim(fallback_lease_file=fallback_lease_file,
+                            key_dir=key_dir)
     try:
         return shim.register_with_azure_and_fetch_data()
     finally:
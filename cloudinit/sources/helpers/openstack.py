@@ -49,6 +49,9 @@ OS_VERSIONS = (
     OS_LIBERTY,
 )
 
+# Maximum number of metadata files read at the same time by read_v2.
+READ_MAX_WORKERS = 8
+
 PHYSICAL_TYPES = (
     None,
     'bridge',
@@ -210,7 +213,19 @@ class BaseReader(object):
 
         If not a valid location, raise a NonReadable exception.
         """
+        results = self._read_openstack_datafiles()
+        # meta_data.json loaded, so this location is worth crawling.  The
+        # ec2 tree does not depend on anything in the openstack one, so
+        # crawl it while the provided files are read.  Errors from the
+        # openstack side come first, as they did when the crawl was last.
+        (_files, ec2_metadata) = util.map_threaded(
+            lambda func: func(),
+            [functools.partial(self._read_openstack_files, results),
+             self._read_ec2_metadata])
+        results['ec2-metadata'] = ec2_metadata
+        return results
 
+    def _read_openstack_datafiles(self):
         load_json_anytype = functools.partial(
             util.load_json, root_types=(dict, list) + six.string_types)
 
@@ -245,8 +260,9 @@ class BaseReader(object):
             'userdata': '',
             'version': 2,
         }
-        data = datafiles(self._find_working_version())
-        for (name, (path, required, translator)) in data.items():
+
+        def read_datafile(entry):
+            (_name, (path, required, translator)) = entry
             path = self._path_join(self.base_path, path)
             data = None
             found = False
@@ -269,6 +285,12 @@ class BaseReader(object):
                 except Exception as e:
                     raise BrokenMetadata("Failed to process "
                                          "path %s: %s" % (path, e))
+            return (found, data)
+
+        entries = list(datafiles(self._find_working_version()).items())
+        found_data = util.map_threaded(read_datafile, entries,
+                                       max_workers=READ_MAX_WORKERS)
+        for ((name, _info), (found, data)) in zip(entries, found_data):
             if found:
                 results[name] = data
 
@@ -280,33 +302,48 @@ class BaseReader(object):
             except (ValueError, TypeError) as e:
                 raise BrokenMetadata("Badly formatted metadata"
                                      " random_seed entry: %s" % e)
+        return results
 
-        # load any files that were provided
-        files = {}
-        metadata_files = metadata.get('files', [])
-        for item in metadata_files:
-            if 'path' not in item:
-                continue
+    def _read_openstack_files(self, results):
+        metadata = results['metadata']
+
+        # load any files that were provided, and the network config, at the
+        # same time.  Failures are raised in the order they would have been
+        # hit reading one after the other.
+        def read_file(item):
             path = item['path']
             try:
-                files[path] = self._read_content_path(item)
+                return self._read_content_path(item)
             except Exception as e:
                 raise BrokenMetadata("Failed to read provided "
                                      "file %s: %s" % (path, e))
-        results['files'] = files
 
         # The 'network_config' item in metadata is a content pointer
         # to the network config that should be applied. It is just a
         # ubuntu/debian '/etc/network/interfaces' file.
-        net_item = metadata.get("network_config", None)
-        if net_item:
+        def read_network_config(item):
             try:
-                content = self._read_content_path(net_item, decode=True)
-                results['network_config'] = content
+                return self._read_content_path(item, decode=True)
             except IOError as e:
                 raise BrokenMetadata("Failed to read network"
                                      " configuration: %s" % (e))
 
+        reads = [(read_file, item) for item in metadata.get('files', [])
+                 if 'path' in item]
+        net_item = metadata.get("network_config", None)
+        if net_item:
+            reads.append((read_network_config, net_item))
+        contents = util.map_threaded(lambda read: read[0](read[1]), reads,
+                                     max_workers=READ_MAX_WORKERS)
+
+        files = {}
+        for ((reader, item), content) in zip(reads, contents):
+            if reader is read_network_config:
+                results['network_config'] = content
+            else:
+                files[item['path']] = content
+        results['files'] = files
+
         # To openstack, user can specify meta ('nova boot --meta=key=value')
         # and those will appear under metadata['meta'].
         # if they specify 'dsmode' they're indicating the mode that they intend
@@ -316,16 +353,12 @@ class BaseReader(object):
         except KeyError:
             pass
 
-        # Read any ec2-metadata (if applicable)
-        results['ec2-metadata'] = self._read_ec2_metadata()
-
         # Perform some misc. metadata key renames...
         for (target_key, source_key, is_required) in KEY_COPIES:
             if is_required and source_key not in metadata:
                 raise BrokenMetadata("No '%s' entry in metadata" % source_key)
             if source_key in metadata:
                 metadata[target_key] = metadata.get(source_key)
-        return results
 
 
 class ConfigDriveReader(BaseReader):
@@ -7,12 +7,14 @@
 import copy
 import os
 import sys
+import threading
 
 import six
 from six.moves import cPickle as pickle
 
 from cloudinit.settings import (
-    FREQUENCIES, CLOUD_CONFIG, PER_INSTANCE, RUN_CLOUD_CONFIG)
+    FREQUENCIES, CLOUD_CONFIG, CLOUD_CONFIG_CACHE, PER_INSTANCE,
+    RUN_CLOUD_CONFIG)
 
 from cloudinit import handlers
 
@@ -184,6 +186,12 @@ class Init(object):
         # We try to restore from a current link and static path
         # by using the instance link, if purge_cache was called
         # the file wont exist.
+        ds = _cache_load(self.paths.get_ipath_cur('obj_json'), self.cfg,
+                         self.distro, self.paths)
+        if ds:
+            return ds
+        # Caches written by older versions are still used once; the next
+        # _write_to_cache replaces them.
         return _pkl_load(self.paths.get_ipath_cur('obj_pkl'))
 
     def _write_to_cache(self):
@@ -195,7 +203,13 @@ class Init(object):
             util.write_file(
                 self.paths.get_ipath_cur("manual_clean_marker"),
                 omode="w", content="")
-        return _pkl_store(self.datasource, self.paths.get_ipath_cur("obj_pkl"))
+        stored = _cache_store(self.datasource,
+                              self.paths.get_ipath_cur("obj_json"))
+        if not stored:
+            # a cache of an earlier run would be restored in its place
+            util.del_file(self.paths.get_ipath_cur("obj_json"))
+        util.del_file(self.paths.get_ipath_cur("obj_pkl"))
+        return stored
 
     def _get_datasources(self):
         # Any config provided???
@@ -503,7 +517,8 @@ class Init(object):
                 'handlercount': 0,
                 'excluded': excluded,
             }
-            handlers.walk(data_msg, handlers.walker_callback, data=part_data)
+            handlers.walk(data_msg, handlers.walker_callback, data=part_data,
+                          parts_dir=handlers.payload_dir(self.paths))
 
         def finalize_handlers():
             # Give callbacks opportunity to finalize
@@ -752,48 +767,86 @@ class Modules(object):
             mostly_mods.append([mod, raw_name, freq, run_args])
         return mostly_mods
 
+    def _run_module(self, cc, mod, name, freq, args):
+        # Returns None or (name, exception) if the module failed
+        try:
+            # Try the modules frequency, otherwise fallback to a known one
+            if not freq:
+                freq = mod.frequency
+            if freq not in FREQUENCIES:
+                freq = PER_INSTANCE
+            LOG.debug("Running module %s (%s) with frequency %s",
+                      name, mod, freq)
+
+            # Use the configs logger and not our own
+            # TODO(harlowja): possibly check the module
+            # for having a LOG attr and just give it back
+            # its own logger?
+            func_args = [name, self.cfg,
+                         cc, config.LOG, args]
+            # This name will affect the semaphore name created
+            run_name = "config-%s" % (name)
+
+            desc = "running %s with frequency %s" % (run_name, freq)
+            myrep = events.ReportEventStack(
+                name=run_name, description=desc, parent=self.reporter)
+
+            with myrep:
+                ran, _r = cc.run(run_name, mod.handle, func_args,
+                                 freq=freq)
+                if ran:
+                    myrep.message = "%s ran successfully" % run_name
+                else:
+                    myrep.message = "%s previously ran" % run_name
+
+        except Exception as e:
+            util.logexc(LOG, "Running module %s (%s) failed", name, mod)
+            return (name, e)
+        return None
+
+    def _run_module_group(self, cc, group, max_workers):
+        # Run declared modules concurrently.  A module waits for every
+        # module before it in the group that it depends on or that shares
+        # one of its resources, so those still run in configured order.
+        done = [threading.Event() for _ in group]
+        waits = []
+        for (i, (mod, _name, _freq, _args)) in enumerate(group):
+            depends = set(config.form_module_name(d) for d in mod.depends)
+            waits.append([
+                j for (j, (other, oname, _f, _a)) in enumerate(group[:i])
+                if (set(mod.resources) & set(other.resources) or
+                    config.form_module_name(oname) in depends)])
+
+        def run_one(i):
+            try:
+                for j in waits[i]:
+                    done[j].wait()
+                return self._run_module(cc, *group[i])
+            finally:
+                done[i].set()
+
+        LOG.debug("Running modules %s with %s workers",
+                  [name for (_mod, name, _freq, _args) in group],
+                  max_workers)
+        return util.map_threaded(run_one, range(len(group)),
+                                 max_workers=max_workers)
+
     def _run_modules(self, mostly_mods):
         cc = self.init.cloudify()
         # Return which ones ran
         # and which ones failed + the exception of why it failed
         failures = []
         which_ran = []
-        for (mod, name, freq, args) in mostly_mods:
-            try:
-                # Try the modules frequency, otherwise fallback to a known one
-                if not freq:
-                    freq = mod.frequency
-                if freq not in FREQUENCIES:
-                    freq = PER_INSTANCE
-                LOG.debug("Running module %s (%s) with frequency %s",
-                          name, mod, freq)
-
-                # Use the configs logger and not our own
-                # TODO(harlowja): possibly check the module
-                # for having a LOG attr and just give it back
-                # its own logger?
-                func_args = [name, self.cfg,
-                             cc, config.LOG, args]
-                # Mark it as having started running
-                which_ran.append(name)
-                # This name will affect the semaphore name created
-                run_name = "config-%s" % (name)
-
-                desc = "running %s with frequency %s" % (run_name, freq)
-                myrep = events.ReportEventStack(
-                    name=run_name, description=desc, parent=self.reporter)
-
-                with myrep:
-                    ran, _r = cc.run(run_name, mod.handle, func_args,
-                                     freq=freq)
-                    if ran:
-                        myrep.message = "%s ran successfully" % run_name
-                    else:
-                        myrep.message = "%s previously ran" % run_name
-
-            except Exception as e:
-                util.logexc(LOG, "Running module %s (%s) failed", name, mod)
-                failures.append((name, e))
+        max_workers = util.get_cfg_option_int(
+            self.cfg, 'module_workers', default=1)
+        for group in group_modules(mostly_mods, max_workers > 1):
+            # Mark them as having started running
+            which_ran.extend([name for (_mod, name, _freq, _args) in group])
+            if len(group) == 1:
+                results = [self._run_module(cc, *group[0])]
+            else:
+                results = self._run_module_group(cc, group, max_workers)
+            failures.extend([r for r in results if r])
         return (which_ran, failures)
 
     def run_single(self, mod_name, args=None, freq=None):
@@ -840,6 +893,28 @@ class Modules(object):
         return self._run_modules(mostly_mods)
 
 
+def group_modules(mostly_mods, parallel=False):
+    """Split modules into groups that are run one after the other.
+
+    With parallel, consecutive modules that declare the resources they
+    touch share a group and may run concurrently.  A module that does not
+    declare resources always runs in a group of its own, so it starts only
+    after everything before it has finished.
+    """
+    group = []
+    for entry in mostly_mods:
+        mod = entry[0]
+        if parallel and mod.resources is not None:
+            group.append(entry)
+            continue
+        if group:
+            yield group
+            group = []
+        yield [entry]
+    if group:
+        yield group
+
+
 def read_runtime_config():
     return util.read_conf(RUN_CLOUD_CONFIG)
 
@@ -850,7 +925,8 @@ def fetch_base_config():
             # builtin config
             util.get_builtin_cfg(),
             # Anything in your conf.d or 'default' cloud.cfg location.
-            util.read_conf_with_confd(CLOUD_CONFIG),
+            util.read_conf_with_confd(CLOUD_CONFIG,
+                                      cache_file=CLOUD_CONFIG_CACHE),
             # runtime config
             read_runtime_config(),
             # Kernel/cmdline parameters override system config
@@ -858,20 +934,43 @@ def fetch_base_config():
         ], reverse=True)
 
 
-def _pkl_store(obj, fname):
+def _cache_store(ds, fname):
     try:
-        pk_contents = pickle.dumps(obj)
+        contents = sources.cache_dump(ds)
+    except sources.CacheError as e:
+        LOG.debug("Not caching datasource %s: %s", ds, e)
+        return False
     except Exception:
-        util.logexc(LOG, "Failed pickling datasource %s", obj)
+        util.logexc(LOG, "Failed serializing datasource %s", ds)
         return False
     try:
-        util.write_file(fname, pk_contents, omode="wb", mode=0o400)
+        util.write_file(fname, contents, omode="w", mode=0o400)
     except Exception:
-        util.logexc(LOG, "Failed pickling datasource to %s", fname)
+        util.logexc(LOG, "Failed writing datasource cache to %s", fname)
         return False
     return True
 
 
+def _cache_load(fname, sys_cfg, distro, paths):
+    contents = None
+    try:
+        contents = util.load_file(fname, decode=False)
+    except Exception as e:
+        if os.path.isfile(fname):
+            LOG.warning("failed loading datasource cache in %s: %s", fname, e)
+
+    # This is allowed so just return nothing successfully loaded...
+    if not contents:
+        return None
+    try:
+        return sources.restore_from_cache(contents, sys_cfg, distro, paths)
+    except sources.CacheError as e:
+        LOG.warning("Ignoring datasource cache in %s: %s", fname, e)
+    except Exception:
+        util.logexc(LOG, "Failed restoring datasource from %s", fname)
+    return None
+
+
 def _pkl_load(fname):
     pickle_contents = None
     try:
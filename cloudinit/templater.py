@@ -19,13 +19,6 @@ try:
 except (ImportError, AttributeError):
     CHEETAH_AVAILABLE = False
 
-try:
-    import jinja2
-    from jinja2 import Template as JTemplate
-    JINJA_AVAILABLE = True
-except (ImportError, AttributeError):
-    JINJA_AVAILABLE = False
-
 from cloudinit import log as logging
 from cloudinit import type_utils as tu
 from cloudinit import util
@@ -35,6 +28,16 @@ TYPE_MATCHER = re.compile(r"##\s*template:(.*)", re.I)
 BASIC_MATCHER = re.compile(r'\$\{([A-Za-z0-9_.]+)\}|\$([A-Za-z0-9_.]+)')
 
 
+def _jinja2():
+    # jinja2 is slow to import and only needed for '## template: jinja'
+    # content, so it is imported on first use (None if not installed).
+    try:
+        import jinja2
+        return jinja2
+    except (ImportError, AttributeError):
+        return None
+
+
 def basic_render(content, params):
     """This does simple replacement of bash variable like templates.
 
@@ -81,9 +84,10 @@ def detect_template(text):
     def jinja_render(content, params):
         # keep_trailing_newline is in jinja2 2.7+, not 2.6
         add = "\n" if content.endswith("\n") else ""
-        return JTemplate(content,
-                         undefined=jinja2.StrictUndefined,
-                         trim_blocks=True).render(**params) + add
+        jinja2 = _jinja2()
+        return jinja2.Template(content,
+                               undefined=jinja2.StrictUndefined,
+                               trim_blocks=True).render(**params) + add
 
     if text.find("\n") != -1:
         ident, rest = text.split("\n", 1)
@@ -102,11 +106,12 @@ def detect_template(text):
         if template_type not in ('jinja', 'cheetah', 'basic'):
             raise ValueError("Unknown template rendering type '%s' requested"
                              % template_type)
-        if template_type == 'jinja' and not JINJA_AVAILABLE:
+        jinja_available = template_type == 'jinja' and _jinja2() is not None
+        if template_type == 'jinja' and not jinja_available:
             LOG.warning("Jinja not available as the selected renderer for"
                         " desired template, reverting to the basic renderer.")
             return ('basic', basic_render, rest)
-        elif template_type == 'jinja' and JINJA_AVAILABLE:
+        elif template_type == 'jinja' and jinja_available:
             return ('jinja', jinja_render, rest)
         if template_type == 'cheetah' and not CHEETAH_AVAILABLE:
             LOG.warning("Cheetah not available as the selected renderer for"
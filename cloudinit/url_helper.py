@@ -10,16 +10,14 @@
 
 import json
 import os
-import requests
 import six
+import threading
 import time
 
+from distutils.version import LooseVersion
 from email.utils import parsedate
 from functools import partial
 
-import oauthlib.oauth1 as oauth1
-from requests import exceptions
-
 from six.moves.urllib.parse import (
     urlparse, urlunparse,
     quote as urlquote)
@@ -32,26 +30,105 @@ LOG = logging.getLogger(__name__)
 if six.PY2:
     import httplib
     NOT_FOUND = httplib.NOT_FOUND
+    NOT_MODIFIED = httplib.NOT_MODIFIED
 else:
     import http.client
     NOT_FOUND = http.client.NOT_FOUND
+    NOT_MODIFIED = http.client.NOT_MODIFIED
+
+
+def _requests():
+    # requests (and urllib3 under it) is slow to import and many cloud-init
+    # invocations never read a url, so it is only imported on first use.
+    import requests
+    return requests
+
+
+def _requests_version():
+    return LooseVersion(_requests().__version__)
+
+
+def _ssl_enabled():
+    # Check if requests has ssl support (added in requests >= 0.8.8)
+    return _requests_version() >= LooseVersion('0.8.8')
+
+
+def _config_enabled():
+    # This was added in 0.7 (but taken out in >=1.0)
+    req_ver = _requests_version()
+    return LooseVersion('0.7.0') <= req_ver < LooseVersion('1.0.0')
 
 
-# Check if requests has ssl support (added in requests >= 0.8.8)
-SSL_ENABLED = False
-CONFIG_ENABLED = False  # This was added in 0.7 (but taken out in >=1.0)
-_REQ_VER = None
-try:
-    from distutils.version import LooseVersion
-    import pkg_resources
-    _REQ = pkg_resources.get_distribution('requests')
-    _REQ_VER = LooseVersion(_REQ.version)  # pylint: disable=no-member
-    if _REQ_VER >= LooseVersion('0.8.8'):
-        SSL_ENABLED = True
-    if _REQ_VER >= LooseVersion('0.7.0') and _REQ_VER < LooseVersion('1.0.0'):
-        CONFIG_ENABLED = True
-except ImportError:
-    pass
+# Keep-alive sessions shared by every readurl call made by this process,
+# keyed by the scheme, host, port and ssl details of the urls they read.
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def _session_key(url, ssl_details):
+    parsed_url = urlparse(url)
+    port = parsed_url.port
+    if port is None:
+        port = 443 if parsed_url.scheme == 'https' else 80
+    ssl_key = None
+    if ssl_details:
+        ssl_key = tuple(sorted((k, str(v)) for (k, v) in ssl_details.items()))
+    return (parsed_url.scheme, parsed_url.hostname, port, ssl_key)
+
+
+def get_session(url, ssl_details=None):
+    """Return the process-wide keep-alive session used for url."""
+    key = _session_key(url, ssl_details)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _requests().Session()
+            _SESSIONS[key] = session
+        return session
+
+
+def reset_sessions():
+    """Close and forget every pooled session (and its open connections)."""
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for session in sessions:
+        try:
+            session.close()
+        except Exception as e:
+            LOG.debug("Failed closing http session: %s", e)
+
+
+def session_stats():
+    """Return connection counters for the pooled sessions.
+
+    'new_connections' is how many connections were opened and
+    'reused_connections' is how many requests were sent over an already
+    open (kept alive) connection.
+    """
+    stats = {'sessions': 0, 'requests': 0, 'new_connections': 0,
+             'reused_connections': 0}
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+    for session in sessions:
+        stats['sessions'] += 1
+        for adapter in session.adapters.values():
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools',
+                            None)
+            if pools is None:
+                continue
+            for pool_key in list(pools.keys()):
+                try:
+                    pool = pools[pool_key]
+                except KeyError:
+                    continue
+                num_requests = getattr(pool, 'num_requests', 0)
+                num_connections = getattr(pool, 'num_connections', 0)
+                stats['requests'] += num_requests
+                stats['new_connections'] += num_connections
+                stats['reused_connections'] += max(
+                    0, num_requests - num_connections)
+    return stats
 
 
 def _cleanurl(url):
@@ -154,9 +231,10 @@ def _get_ssl_args(url, ssl_details):
     ssl_args = {}
     scheme = urlparse(url).scheme
     if scheme == 'https' and ssl_details:
-        if not SSL_ENABLED:
+        if not _ssl_enabled():
             LOG.warning("SSL is not supported in requests v%s, "
-                        "cert. verification can not occur!", _REQ_VER)
+                        "cert. verification can not occur!",
+                        _requests_version())
         else:
             if 'ca_certs' in ssl_details and ssl_details['ca_certs']:
                 ssl_args['verify'] = ssl_details['ca_certs']
@@ -173,6 +251,7 @@ def _get_ssl_args(url, ssl_details):
 def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
             headers=None, headers_cb=None, ssl_details=None,
             check_status=True, allow_redirects=True, exception_cb=None):
+    exceptions = _requests().exceptions
     url = _cleanurl(url)
     req_args = {
         'url': url,
@@ -187,7 +266,7 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     # It doesn't seem like config
     # was added in older library versions (or newer ones either), thus we
     # need to manually do the retries if it wasn't...
-    if CONFIG_ENABLED:
+    if _config_enabled():
         req_config = {
             'store_cookies': False,
         }
@@ -231,7 +310,8 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
             LOG.debug("[%s/%s] open '%s' with %s configuration", i,
                       manual_tries, url, filtered_req_args)
 
-            r = requests.request(**req_args)
+            session = get_session(url, ssl_details)
+            r = session.request(**req_args)
             if check_status:
                 r.raise_for_status()
             LOG.debug("Read from %s (%s, %sb) after %s attempts", url,
@@ -249,7 +329,7 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
                                       url=url))
             else:
                 excps.append(UrlError(e, url=url))
-                if SSL_ENABLED and isinstance(e, exceptions.SSLError):
+                if _ssl_enabled() and isinstance(e, exceptions.SSLError):
                     # ssl exceptions are not going to get fixed by waiting a
                     # few seconds
                     break
@@ -266,9 +346,71 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     return None  # Should throw before this...
 
 
+def _probe_url(url, headers_cb, timeout):
+    """Read url once, returning (url_exc, reason); url_exc is None if the
+    url responded with a non-empty, successful response."""
+    reason = ""
+    url_exc = None
+    try:
+        if headers_cb is not None:
+            headers = headers_cb(url)
+        else:
+            headers = {}
+
+        response = readurl(url, headers=headers, timeout=timeout,
+                           check_status=False)
+        if not response.contents:
+            reason = "empty response [%s]" % (response.code)
+            url_exc = UrlError(ValueError(reason), code=response.code,
+                               headers=response.headers, url=url)
+        elif not response.ok():
+            reason = "bad status code [%s]" % (response.code)
+            url_exc = UrlError(ValueError(reason), code=response.code,
+                               headers=response.headers, url=url)
+    except UrlError as e:
+        reason = "request error [%s]" % e
+        url_exc = e
+    except Exception as e:
+        reason = "unexpected error [%s]" % e
+        url_exc = e
+    return (url_exc, reason)
+
+
+def _race_urls(urls, headers_cb, timeout, failure_cb):
+    """Probe all urls at once and return the first one that is healthy.
+
+    failure_cb is called (in the calling thread) for every url found to be
+    unhealthy before a healthy one responds.  Probes still in flight once
+    a url wins are abandoned and their results are ignored.  A single url
+    is probed in the calling thread.
+    """
+    if len(urls) == 1:
+        (url_exc, reason) = _probe_url(urls[0], headers_cb, timeout)
+        if url_exc is None:
+            return urls[0]
+        failure_cb(urls[0], url_exc, reason)
+        return None
+
+    results = six.moves.queue.Queue()
+
+    def probe(url):
+        results.put((url,) + _probe_url(url, headers_cb, timeout))
+
+    for url in urls:
+        thread = threading.Thread(target=probe, args=(url,))
+        thread.daemon = True
+        thread.start()
+    for _i in range(len(urls)):
+        (url, url_exc, reason) = results.get()
+        if url_exc is None:
+            return url
+        failure_cb(url, url_exc, reason)
+    return None
+
+
 def wait_for_url(urls, max_wait=None, timeout=None,
                  status_cb=None, headers_cb=None, sleep_time=1,
-                 exception_cb=None):
+                 exception_cb=None, race=False):
     """
     urls:      a list of urls to try
     max_wait:  roughly the maximum time to wait before giving up
@@ -281,6 +423,9 @@ def wait_for_url(urls, max_wait=None, timeout=None,
                 for request.
     exception_cb: call method with 2 arguments 'msg' (per status_cb) and
                   'exception', the exception that occurred.
+    race:      probe all urls concurrently on each try and return the first
+               healthy one to respond, instead of trying them one after
+               another.  A try then takes at most timeout seconds.
 
     the idea of this routine is to wait for the EC2 metdata service to
     come up.  On both Eucalyptus and EC2 we have seen the case where
@@ -309,10 +454,29 @@ def wait_for_url(urls, max_wait=None, timeout=None,
         return ((max_wait <= 0 or max_wait is None) or
                 (time.time() - start_time > max_wait))
 
+    def url_failed(url, url_exc, reason):
+        time_taken = int(time.time() - start_time)
+        status_msg = "Calling '%s' failed [%s/%ss]: %s" % (url,
+                                                           time_taken,
+                                                           max_wait,
+                                                           reason)
+        status_cb(status_msg)
+        if exception_cb:
+            # This can be used to alter the headers that will be sent
+            # in the future, for example this is what the MAAS datasource
+            # does.
+            exception_cb(msg=status_msg, exception=url_exc)
+
+    # Each try probes one url, or every url at once when racing.
+    if race:
+        tries = [list(urls)]
+    else:
+        tries = [[url] for url in urls]
+
     loop_n = 0
     while True:
         sleep_time = int(loop_n / 5) + 1
-        for url in urls:
+        for candidates in tries:
             now = time.time()
             if loop_n != 0:
                 if timeup(max_wait, start_time):
@@ -321,44 +485,9 @@ def wait_for_url(urls, max_wait=None, timeout=None,
                     # shorten timeout to not run way over max_time
                     timeout = int((start_time + max_wait) - now)
 
-            reason = ""
-            url_exc = None
-            try:
-                if headers_cb is not None:
-                    headers = headers_cb(url)
-                else:
-                    headers = {}
-
-                response = readurl(url, headers=headers, timeout=timeout,
-                                   check_status=False)
-                if not response.contents:
-                    reason = "empty response [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                elif not response.ok():
-                    reason = "bad status code [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                else:
-                    return url
-            except UrlError as e:
-                reason = "request error [%s]" % e
-                url_exc = e
-            except Exception as e:
-                reason = "unexpected error [%s]" % e
-                url_exc = e
-
-            time_taken = int(time.time() - start_time)
-            status_msg = "Calling '%s' failed [%s/%ss]: %s" % (url,
-                                                               time_taken,
-                                                               max_wait,
-                                                               reason)
-            status_cb(status_msg)
-            if exception_cb:
-                # This can be used to alter the headers that will be sent
-                # in the future, for example this is what the MAAS datasource
-                # does.
-                exception_cb(msg=status_msg, exception=url_exc)
+            url = _race_urls(candidates, headers_cb, timeout, url_failed)
+            if url:
+                return url
 
         if timeup(max_wait, start_time):
             break
@@ -487,6 +616,8 @@ def oauth_headers(url, consumer_key, token_key, token_secret, consumer_secret,
     else:
         timestamp = None
 
+    import oauthlib.oauth1 as oauth1
+
     client = oauth1.Client(
         consumer_key,
         client_secret=consumer_secret,
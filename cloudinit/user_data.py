@@ -8,8 +8,10 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
 import os
 
+from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.nonmultipart import MIMENonMultipart
@@ -19,6 +21,7 @@ import six
 
 from cloudinit import handlers
 from cloudinit import log as logging
+from cloudinit import url_helper
 from cloudinit import util
 
 LOG = logging.getLogger(__name__)
@@ -27,6 +30,14 @@ LOG = logging.getLogger(__name__)
 NOT_MULTIPART_TYPE = handlers.NOT_MULTIPART_TYPE
 PART_FN_TPL = handlers.PART_FN_TPL
 OCTET_TYPE = handlers.OCTET_TYPE
+PAYLOAD_FILE_HEADER = handlers.PAYLOAD_FILE_HEADER
+
+# How many #include urls are fetched at the same time
+INCLUDE_WORKERS = 8
+
+# Part payloads of at least this many bytes are written to the instance
+# data directory instead of being kept in the processed message.
+SPILL_SIZE = 1024 * 1024
 
 # Saves typing errors
 CONTENT_TYPE = 'Content-Type'
@@ -70,6 +81,22 @@ def _set_filename(msg, filename):
                    'attachment', filename=str(filename))
 
 
+def _decode_text(payload):
+    # Text the way handlers.part_payload would hand it out.
+    if six.PY3 and isinstance(payload, six.binary_type):
+        return payload.decode('utf-8', 'surrogateescape')
+    return payload
+
+
+def _set_payload(msg, payload):
+    if msg.get_content_maintype() == 'text':
+        msg.set_payload(_decode_text(payload))
+    else:
+        msg.set_payload(payload)
+        if six.PY3 and isinstance(payload, six.binary_type):
+            encoders.encode_base64(msg)
+
+
 class UserDataProcessor(object):
     def __init__(self, paths):
         self.paths = paths
@@ -92,6 +119,8 @@ class UserDataProcessor(object):
         for part in base_msg.walk():
             if is_skippable(part):
                 continue
+            # Only ever set by this processor, not by the user-data.
+            del part[PAYLOAD_FILE_HEADER]
 
             ctype = None
             ctype_orig = part.get_content_type()
@@ -100,10 +129,12 @@ class UserDataProcessor(object):
 
             # When the message states it is of a gzipped content type ensure
             # that we attempt to decode said payload so that the decompressed
-            # data can be examined (instead of the compressed data).
+            # data can be examined (instead of the compressed data).  It is
+            # kept as bytes until its content type is known.
             if ctype_orig in DECOMP_TYPES:
                 try:
-                    payload = util.decomp_gzip(payload, quiet=False)
+                    payload = util.decomp_gzip(payload, quiet=False,
+                                               decode=False)
                     # At this point we don't know what the content-type is
                     # since we just decompressed it.
                     ctype_orig = None
@@ -122,6 +153,14 @@ class UserDataProcessor(object):
             if ctype is None:
                 ctype = ctype_orig
 
+            if ctype in INCLUDE_TYPES:
+                self._do_include(util.decode_binary(payload), append_msg)
+                continue
+
+            if ctype in ARCHIVE_TYPES:
+                self._explode_archive(util.decode_binary(payload), append_msg)
+                continue
+
             # In the case where the data was compressed, we want to make sure
             # that we create a new message that contains the found content
             # type with the uncompressed content since later traversals of the
@@ -129,7 +168,8 @@ class UserDataProcessor(object):
             if was_compressed:
                 maintype, subtype = ctype.split("/", 1)
                 n_part = MIMENonMultipart(maintype, subtype)
-                n_part.set_payload(payload)
+                if not self._spill_payload(n_part, payload):
+                    _set_payload(n_part, payload)
                 # Copy various headers from the old part to the new one,
                 # but don't include all the headers since some are not useful
                 # after decoding and decompression.
@@ -139,24 +179,41 @@ class UserDataProcessor(object):
                     if h in part:
                         _replace_header(n_part, h, str(part[h]))
                 part = n_part
+            else:
+                self._spill_payload(part, payload)
 
             if ctype != ctype_orig:
                 _replace_header(part, CONTENT_TYPE, ctype)
 
-            if ctype in INCLUDE_TYPES:
-                self._do_include(payload, append_msg)
-                continue
-
-            if ctype in ARCHIVE_TYPES:
-                self._explode_archive(payload, append_msg)
-                continue
-
             # TODO(harlowja): Should this be happening, shouldn't
             # the part header be modified and not the base?
             _replace_header(base_msg, CONTENT_TYPE, ctype)
 
             self._attach_part(append_msg, part)
 
+    def _spill_payload(self, msg, payload):
+        """Move a large payload out of msg and into a file.
+
+        The payload is written (once per distinct content) below the instance
+        data directory and msg is left empty, with PAYLOAD_FILE_HEADER naming
+        the file so handlers.part_payload can read it when the part is
+        handled.  Return True if the payload was moved.
+        """
+        if payload is None or len(payload) < SPILL_SIZE:
+            return False
+        if isinstance(payload, six.text_type):
+            blob = payload.encode('utf-8', 'surrogateescape')
+        else:
+            blob = payload
+        path = os.path.join(handlers.payload_dir(self.paths),
+                            util.hash_blob(blob, 'sha256'))
+        if not os.path.isfile(path):
+            util.write_file(path, blob, mode=0o600)
+        del msg['Content-Transfer-Encoding']
+        msg.set_payload('')
+        _replace_header(msg, PAYLOAD_FILE_HEADER, path)
+        return True
+
     def _attach_launch_index(self, msg):
         header_idx = msg.get('Launch-Index', None)
         payload_idx = None
@@ -164,7 +221,8 @@ class UserDataProcessor(object):
             try:
                 # See if it has a launch-index field
                 # that might affect the final header
-                payload = util.load_yaml(msg.get_payload(decode=True))
+                payload = util.load_yaml(handlers.part_payload(
+                    msg, handlers.payload_dir(self.paths)))
                 if payload:
                     payload_idx = payload.get('launch-index')
             except Exception:
@@ -186,6 +244,79 @@ class UserDataProcessor(object):
         return os.path.join(self.paths.get_ipath_cur('data'),
                             'urlcache', entry_fn)
 
+    def _get_include_cache_filename(self, entry):
+        # Plain #include content along with the validators (etag and
+        # last-modified) needed to revalidate it on a later boot.
+        return self._get_include_once_filename(entry) + '.cond'
+
+    def _load_include_cache(self, include_cache_fn):
+        try:
+            validators = json.loads(
+                util.load_file(include_cache_fn + '.json'))
+            content = util.load_file(include_cache_fn, decode=False)
+        except (IOError, OSError, ValueError):
+            return (None, None)
+        if not isinstance(validators, dict):
+            return (None, None)
+        return (validators, content)
+
+    def _store_include_cache(self, include_cache_fn, resp):
+        validators = {}
+        for (header, key) in (('ETag', 'etag'),
+                              ('Last-Modified', 'last_modified')):
+            value = resp.headers.get(header)
+            if value:
+                validators[key] = value
+        if not validators:
+            util.del_file(include_cache_fn)
+            util.del_file(include_cache_fn + '.json')
+            return
+        util.write_file(include_cache_fn, resp.contents, mode=0o600)
+        util.write_file(include_cache_fn + '.json', json.dumps(validators),
+                        mode=0o600)
+
+    def _fetch_include(self, include_url, include_once_on):
+        """Return the content of an included url, or None if it failed.
+
+        #include-once urls are read from the local urlcache after the first
+        successful fetch.  Other http(s) urls are fetched with a conditional
+        get when an earlier response carried an etag or last-modified header,
+        and the cached copy is reused if the server answers not modified.
+        """
+        if include_once_on:
+            include_once_fn = self._get_include_once_filename(include_url)
+            if os.path.isfile(include_once_fn):
+                return util.load_file(include_once_fn)
+
+        include_cache_fn = None
+        validators = cached = None
+        headers = {}
+        if (not include_once_on and
+                include_url.lower().startswith(('http://', 'https://'))):
+            include_cache_fn = self._get_include_cache_filename(include_url)
+            (validators, cached) = self._load_include_cache(include_cache_fn)
+            if validators:
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+
+        resp = util.read_file_or_url(include_url, headers=headers,
+                                     ssl_details=self.ssl_details)
+        if headers and resp.code == url_helper.NOT_MODIFIED:
+            LOG.debug("Using cached content of %s, not modified", include_url)
+            return cached
+        if not resp.ok():
+            LOG.warning(("Fetching from %s resulted in"
+                         " a invalid http code of %s"),
+                        include_url, resp.code)
+            return None
+        if include_once_on:
+            util.write_file(include_once_fn, resp.contents, mode=0o600)
+        elif include_cache_fn:
+            self._store_include_cache(include_cache_fn, resp)
+        return resp.contents
+
     def _process_before_attach(self, msg, attached_id):
         if not msg.get_filename():
             _set_filename(msg, PART_FN_TPL % (attached_id))
@@ -195,6 +326,8 @@ class UserDataProcessor(object):
         # Include a list of urls, one per line
         # also support '#include <url here>'
         # or #include-once '<url here>'
+        # All urls are fetched first (concurrently) and then processed.
+        includes = []
         include_once_on = False
         for line in content.splitlines():
             lc_line = line.lower()
@@ -214,25 +347,19 @@ class UserDataProcessor(object):
             include_url = line.strip()
             if not include_url:
                 continue
-
-            include_once_fn = None
-            content = None
-            if include_once_on:
-                include_once_fn = self._get_include_once_filename(include_url)
-            if include_once_on and os.path.isfile(include_once_fn):
-                content = util.load_file(include_once_fn)
-            else:
-                resp = util.read_file_or_url(include_url,
-                                             ssl_details=self.ssl_details)
-                if include_once_on and resp.ok():
-                    util.write_file(include_once_fn, resp.contents, mode=0o600)
-                if resp.ok():
-                    content = resp.contents
-                else:
-                    LOG.warning(("Fetching from %s resulted in"
-                                 " a invalid http code of %s"),
-                                include_url, resp.code)
-
+            includes.append((include_url, include_once_on))
+
+        if not includes:
+            return
+        # Workers write into the same cache directory, so create it here
+        # rather than letting them race to do so.
+        util.ensure_dir(os.path.dirname(
+            self._get_include_once_filename(includes[0][0])))
+        contents = util.map_threaded(
+            lambda include: self._fetch_include(*include), includes,
+            max_workers=INCLUDE_WORKERS)
+        # Processing stays sequential so parts keep the order of the urls.
+        for content in contents:
             if content is not None:
                 new_msg = convert_string(content)
                 self._process_msg(new_msg, append_msg)
@@ -261,13 +388,14 @@ class UserDataProcessor(object):
                 mtype = handlers.type_from_starts_with(content, default)
 
             maintype, subtype = mtype.split('/', 1)
-            if maintype == "text":
-                if isinstance(content, six.binary_type):
-                    content = content.decode()
-                msg = MIMEText(content, _subtype=subtype)
-            else:
-                msg = MIMEBase(maintype, subtype)
-                msg.set_payload(content)
+            msg = MIMEBase(maintype, subtype)
+            if not self._spill_payload(msg, content):
+                if maintype == "text":
+                    if isinstance(content, six.binary_type):
+                        content = content.decode()
+                    msg = MIMEText(content, _subtype=subtype)
+                else:
+                    msg.set_payload(content)
 
             if 'filename' in ent:
                 _set_filename(msg, ent['filename'])
@@ -278,7 +406,8 @@ class UserDataProcessor(object):
                 if header.lower() in ('content', 'filename', 'type',
                                       'launch-index', 'content-disposition',
                                       ATTACHMENT_FIELD.lower(),
-                                      CONTENT_TYPE.lower()):
+                                      CONTENT_TYPE.lower(),
+                                      PAYLOAD_FILE_HEADER.lower()):
                     continue
                 msg.add_header(header, ent[header])
 
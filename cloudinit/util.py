@@ -8,6 +8,7 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import collections
 import contextlib
 import copy as obj_copy
 import ctypes
@@ -32,6 +33,7 @@ import string
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 
 from base64 import b64decode, b64encode
@@ -40,6 +42,7 @@ from six.moves.urllib import parse as urlparse
 import six
 import yaml
 
+from cloudinit import atomic_helper
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import mergers
@@ -218,6 +221,36 @@ DMIDECODE_TO_DMI_SYS_MAPPING = {
     'system-version': 'product_version',
 }
 
+# Sections and fields of a full dmidecode dump holding the same values
+DMIDECODE_DUMP_FIELDS = {
+    ('BIOS Information', 'Vendor'): 'bios-vendor',
+    ('BIOS Information', 'Version'): 'bios-version',
+    ('BIOS Information', 'Release Date'): 'bios-release-date',
+    ('System Information', 'Manufacturer'): 'system-manufacturer',
+    ('System Information', 'Product Name'): 'system-product-name',
+    ('System Information', 'Version'): 'system-version',
+    ('System Information', 'Serial Number'): 'system-serial-number',
+    ('System Information', 'UUID'): 'system-uuid',
+    ('Base Board Information', 'Manufacturer'): 'baseboard-manufacturer',
+    ('Base Board Information', 'Product Name'): 'baseboard-product-name',
+    ('Base Board Information', 'Version'): 'baseboard-version',
+    ('Base Board Information', 'Serial Number'): 'baseboard-serial-number',
+    ('Base Board Information', 'Asset Tag'): 'baseboard-asset-tag',
+    ('Chassis Information', 'Manufacturer'): 'chassis-manufacturer',
+    ('Chassis Information', 'Version'): 'chassis-version',
+    ('Chassis Information', 'Serial Number'): 'chassis-serial-number',
+    ('Chassis Information', 'Asset Tag'): 'chassis-asset-tag',
+}
+
+# Memoized dmi values (key -> value), None until the first snapshot.
+_DMI_DATA = None
+_DMI_LOCK = threading.Lock()
+# File the dmi snapshot is shared through, see set_dmi_cache_file().
+_DMI_CACHE_FILE = None
+
+# Merged config read by read_conf_with_confd (path -> (stats, config)).
+_CONF_CACHE = {}
+
 
 class ProcessExecutionError(IOError):
 
@@ -554,6 +587,50 @@ def load_json(text, root_types=(dict,)):
     return decoded
 
 
+def native_strings(obj):
+    """Return obj with its text turned into native strings where possible.
+
+    On python 2 json decodes all text to unicode, where yaml gives str for
+    ascii text; this gives back what yaml would have.  Other types, and
+    everything on python 3, are returned as they are."""
+    if six.PY3:
+        return obj
+    if isinstance(obj, six.text_type):
+        try:
+            return obj.encode('ascii')
+        except UnicodeEncodeError:
+            return obj
+    if isinstance(obj, list):
+        return [native_strings(item) for item in obj]
+    if isinstance(obj, dict):
+        return dict((native_strings(k), native_strings(v))
+                    for (k, v) in obj.items())
+    return obj
+
+
+def is_exact_copy(orig, copy):
+    """Return True if copy equals orig with the same types throughout.
+
+    Unlike ==, this tells a tuple from a list, 1 from '1' as a key, and on
+    python 2 str from unicode, which a json round trip changes."""
+    if type(orig) is not type(copy):
+        return False
+    if isinstance(orig, dict):
+        if len(orig) != len(copy):
+            return False
+        keys = dict((k, k) for k in copy)
+        for (k, v) in orig.items():
+            if k not in keys or type(keys[k]) is not type(k):
+                return False
+            if not is_exact_copy(v, copy[k]):
+                return False
+        return True
+    if isinstance(orig, list):
+        return (len(orig) == len(copy) and
+                all(is_exact_copy(a, b) for (a, b) in zip(orig, copy)))
+    return orig == copy
+
+
 def is_ipv4(instr):
     """determine if input string is a ipv4 address. return boolean."""
     toks = instr.split('.')
@@ -945,7 +1022,108 @@ def read_seeded(base="", ext="", timeout=5, retries=10, file_retries=0):
     return (md, ud)
 
 
-def read_conf_d(confd):
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, st.st_ino]
+
+
+def _conf_digest(path):
+    """Return a hash of a config file, or of the file names in a directory."""
+    if os.path.isdir(path):
+        content = "\n".join(sorted(os.listdir(path))).encode('utf-8')
+    else:
+        try:
+            content = load_file(path, decode=False)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+    return hashlib.sha256(content).hexdigest()
+
+
+def _conf_unchanged(inputs):
+    """Return True if none of the inputs ([path, stat, digest]) changed.
+
+    A stat that differs only costs hashing the content again; the stat of
+    an input with unchanged content is updated in place."""
+    for entry in inputs:
+        (path, key, digest) = entry
+        cur = _stat_key(path)
+        if cur == key:
+            continue
+        if _conf_digest(path) != digest:
+            return False
+        entry[1] = cur
+    return True
+
+
+def _read_conf_input(path, inputs):
+    # stat before reading, so a change while reading shows later
+    key = _stat_key(path)
+    try:
+        blob = load_file(path, decode=False)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        inputs.append([path, None, None])
+        return {}
+    inputs.append([path, key, hashlib.sha256(blob).hexdigest()])
+    return load_yaml(blob, default={})
+
+
+def _valid_conf_inputs(inputs):
+    """Return True if inputs is a list of [path, stat, digest] entries."""
+    if not (isinstance(inputs, list) and inputs):
+        return False
+    for entry in inputs:
+        if not (isinstance(entry, list) and len(entry) == 3):
+            return False
+        (path, key, digest) = entry
+        if not isinstance(path, six.string_types):
+            return False
+        if key is not None and not (isinstance(key, list) and len(key) == 3):
+            return False
+        if digest is not None and not isinstance(digest, six.string_types):
+            return False
+    return True
+
+
+def _load_conf_cache(cache_file, cfgfile):
+    try:
+        data = native_strings(json.loads(load_file(cache_file)))
+        if data['cfgfile'] != cfgfile:
+            return None
+        if not (_valid_conf_inputs(data['inputs']) and
+                isinstance(data['config'], dict)):
+            raise ValueError("unexpected cache contents")
+        return (data['inputs'], data['config'])
+    except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+        LOG.debug("Not using config cache %s: %s", cache_file, e)
+    return None
+
+
+def _store_conf_cache(cache_file, cfgfile, inputs, cfg):
+    data = {'cfgfile': cfgfile, 'inputs': inputs, 'config': cfg}
+    try:
+        blob = json.dumps(data, sort_keys=True)
+        # yaml has types (int keys, tuples, dates) that json changes
+        if not is_exact_copy(data, native_strings(json.loads(blob))):
+            LOG.debug("Config from %s can not be cached as json", cfgfile)
+            return
+        atomic_helper.write_file(cache_file, blob, mode=0o600, omode="w")
+    except (IOError, OSError, TypeError, ValueError) as e:
+        LOG.debug("Failed writing config cache %s: %s", cache_file, e)
+
+
+def reset_conf_cache():
+    """Forget the config remembered by read_conf_with_confd."""
+    _CONF_CACHE.clear()
+
+
+def read_conf_d(confd, inputs=None):
     # Get reverse sorted list (later trumps newer)
     confs = sorted(os.listdir(confd), reverse=True)
 
@@ -959,13 +1137,49 @@ def read_conf_d(confd):
     # Load them all so that they can be merged
     cfgs = []
     for fn in confs:
-        cfgs.append(read_conf(os.path.join(confd, fn)))
+        path = os.path.join(confd, fn)
+        if inputs is not None:
+            cfgs.append(_read_conf_input(path, inputs))
+        else:
+            cfgs.append(read_conf(path))
 
     return mergemanydict(cfgs)
 
 
-def read_conf_with_confd(cfgfile):
-    cfg = read_conf(cfgfile)
+def read_conf_with_confd(cfgfile, cache_file=None):
+    """Return cfgfile merged with the config in its conf.d directory.
+
+    Every stage reads the same files more than once, so the result is
+    remembered until cfgfile, the conf.d directory or one of its files
+    changes.  With cache_file, the parsed result is also kept there for
+    the processes of later stages.  Inputs are checked by size, mtime and
+    inode, and by content hash when those differ.  Callers get their own
+    copy."""
+    cached = _CONF_CACHE.get(cfgfile)
+    from_file = False
+    if cached is None and cache_file:
+        cached = _load_conf_cache(cache_file, cfgfile)
+        from_file = cached is not None
+    if cached is not None:
+        (inputs, cfg) = cached
+        stats = [entry[1] for entry in inputs]
+        if _conf_unchanged(inputs):
+            _CONF_CACHE[cfgfile] = cached
+            if from_file and stats != [entry[1] for entry in inputs]:
+                # same content, new stats: save hashing it next time
+                _store_conf_cache(cache_file, cfgfile, inputs, cfg)
+            return obj_copy.deepcopy(cfg)
+    inputs = []
+    cfg = _read_conf_with_confd(cfgfile, inputs)
+    if inputs[0][1] is not None:
+        _CONF_CACHE[cfgfile] = (inputs, obj_copy.deepcopy(cfg))
+        if cache_file:
+            _store_conf_cache(cache_file, cfgfile, inputs, cfg)
+    return cfg
+
+
+def _read_conf_with_confd(cfgfile, inputs):
+    cfg = _read_conf_input(cfgfile, inputs)
 
     confd = False
     if "conf_d" in cfg:
@@ -977,14 +1191,17 @@ def read_conf_with_confd(cfgfile):
                                 (cfgfile, type_utils.obj_name(confd)))
             else:
                 confd = str(confd).strip()
-    elif os.path.isdir("%s.d" % cfgfile):
+    else:
         confd = "%s.d" % cfgfile
 
+    if confd:
+        # files being added or removed changes the directory
+        inputs.append([confd, _stat_key(confd), _conf_digest(confd)])
     if not confd or not os.path.isdir(confd):
         return cfg
 
     # Conf.d settings override input configuration
-    confd_cfg = read_conf_d(confd)
+    confd_cfg = read_conf_d(confd, inputs)
     return mergemanydict([confd_cfg, cfg])
 
 
@@ -1193,7 +1410,24 @@ def find_devs_with(criteria=None, oformat='device',
       TYPE=<filesystem>
       LABEL=<label>
       UUID=<uuid>
+
+    Device queries are answered from the index kept by blkid_devices(),
+    so blkid only runs once per process for them (or again with no_cache).
     """
+    if oformat == 'device' and not tag:
+        if path:
+            devices = _blkid_export(path=path)
+            with _BLKID_LOCK:
+                if _BLKID_DEVICES is not None:
+                    _BLKID_DEVICES.update(devices)
+        else:
+            devices = blkid_devices(refresh=no_cache)
+        if not criteria:
+            return list(devices)
+        key, _sep, value = criteria.partition("=")
+        return [dev for (dev, tags) in devices.items()
+                if tags.get(key) == value]
+
     blk_id_cmd = ['blkid']
     options = []
     if criteria:
@@ -1220,6 +1454,15 @@ def find_devs_with(criteria=None, oformat='device',
     if path:
         options.append(path)
     cmd = blk_id_cmd + options
+    entries = []
+    for line in _blkid(cmd).splitlines():
+        line = line.strip()
+        if line:
+            entries.append(line)
+    return entries
+
+
+def _blkid(cmd):
     # See man blkid for why 2 is added
     try:
         (out, _err) = subp(cmd, rcs=[0, 2])
@@ -1229,12 +1472,74 @@ def find_devs_with(criteria=None, oformat='device',
             out = ""
         else:
             raise
-    entries = []
-    for line in out.splitlines():
+    return out
+
+
+def _blkid_export(path=None, no_cache=False):
+    """Run 'blkid -o export' and return {device: {TAG: value}}.
+
+    The result keeps the order blkid reported the devices in.
+    """
+    cmd = ['blkid']
+    if no_cache:
+        cmd.extend(["-c", "/dev/null"])
+    cmd.append('-oexport')
+    if path:
+        cmd.append(path)
+    devices = collections.OrderedDict()
+    tags = {}
+    for line in _blkid(cmd).splitlines() + ['']:
         line = line.strip()
-        if line:
-            entries.append(line)
-    return entries
+        if not line:
+            if 'DEVNAME' in tags:
+                devices[tags.pop('DEVNAME')] = tags
+            tags = {}
+            continue
+        key, _sep, value = line.partition("=")
+        # export format escapes shell special characters with a backslash
+        tags[key] = re.sub(r'\\(.)', r'\1', value)
+    return devices
+
+
+# Device index built by blkid_devices(); None until first scanned.
+_BLKID_DEVICES = None
+# Set once devices changed, blkid's own cache can not be trusted after that.
+_BLKID_INVALIDATED = False
+_BLKID_LOCK = threading.Lock()
+
+
+def blkid_devices(refresh=False):
+    """Return {device: {TAG: value}} for all block devices blkid knows.
+
+    blkid is run once and the result kept for later calls.  Anything that
+    changes partitions or filesystems must call invalidate_blkid_devices()
+    (or pass refresh) so the next call scans again, bypassing blkid's
+    cache which may not have seen the change yet.
+    """
+    global _BLKID_DEVICES
+    with _BLKID_LOCK:
+        if _BLKID_DEVICES is None or refresh:
+            _BLKID_DEVICES = _blkid_export(
+                no_cache=refresh or _BLKID_INVALIDATED)
+        return _BLKID_DEVICES.copy()
+
+
+def blkid_probe(path):
+    """Return {TAG: value} for the device at path, probed by blkid without
+    its cache.  The result is added to the device index."""
+    devices = _blkid_export(path=path, no_cache=True)
+    with _BLKID_LOCK:
+        if _BLKID_DEVICES is not None:
+            _BLKID_DEVICES.update(devices)
+    return next(iter(devices.values()), {})
+
+
+def invalidate_blkid_devices():
+    """Drop the device index so the next query runs blkid again."""
+    global _BLKID_DEVICES, _BLKID_INVALIDATED
+    with _BLKID_LOCK:
+        _BLKID_DEVICES = None
+        _BLKID_INVALIDATED = True
 
 
 def peek_file(fname, max_bytes):
@@ -2232,6 +2537,51 @@ def log_time(logfunc, msg, func, args=None, kwargs=None, get_uptime=False):
     return ret
 
 
+def map_threaded(func, items, max_workers=None):
+    """Return [func(item) for item in items], computed by a bounded pool.
+
+    At most max_workers threads (default: one per item) call func
+    concurrently.  Results are returned in the order of items.  If func
+    raises for any item, no further items are started and the exception
+    of the first failing item (in items order) is re-raised.
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = len(items)
+    max_workers = min(max_workers, len(items))
+    if max_workers <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    failures = {}
+    work = six.moves.queue.Queue()
+    for entry in enumerate(items):
+        work.put(entry)
+
+    def worker():
+        while not failures:
+            try:
+                (idx, item) = work.get_nowait()
+            except six.moves.queue.Empty:
+                return
+            try:
+                results[idx] = func(item)
+            except Exception:
+                failures[idx] = sys.exc_info()
+
+    threads = []
+    for _i in range(max_workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if failures:
+        six.reraise(*failures[min(failures)])
+    return results
+
+
 def expand_dotted_devname(dotted):
     toks = dotted.rsplit(".", 1)
     if len(toks) > 1:
@@ -2366,6 +2716,86 @@ def _call_dmidecode(key, dmidecode_path):
         return None
 
 
+def _dmidecode_supported():
+    # running dmidecode can be problematic on some arches (LP: #1243287)
+    uname_arch = os.uname()[4]
+    if not (uname_arch == "x86_64" or
+            (uname_arch.startswith("i") and uname_arch[2:] == "86") or
+            uname_arch == 'aarch64' or
+            uname_arch == 'amd64'):
+        LOG.debug("dmidata is not supported on %s", uname_arch)
+        return False
+    return True
+
+
+def _dump_dmidecode(dmidecode_path):
+    """Return the dmi values found in a single full dmidecode dump."""
+    try:
+        cmd = [dmidecode_path, "--type", "bios,system,baseboard,chassis"]
+        (out, _err) = subp(cmd)
+    except (IOError, OSError) as e:
+        LOG.debug('failed dmidecode cmd: %s\n%s', cmd, e)
+        return {}
+    found = {}
+    section = None
+    for line in out.splitlines():
+        if not line.startswith("\t"):
+            section = line.strip()
+            continue
+        field, sep, value = line.strip().partition(":")
+        key = DMIDECODE_DUMP_FIELDS.get((section, field))
+        if sep and key and key not in found:
+            value = value.strip()
+            if value.replace(".", "") == "":
+                value = ""
+            found[key] = value
+    return found
+
+
+def _read_dmi_snapshot():
+    if _DMI_CACHE_FILE and os.path.exists(_DMI_CACHE_FILE):
+        try:
+            return load_json(load_file(_DMI_CACHE_FILE))
+        except (IOError, OSError, ValueError, TypeError) as e:
+            LOG.debug("Ignoring dmi cache %s: %s", _DMI_CACHE_FILE, e)
+
+    if os.path.isdir(DMI_SYS_PATH):
+        data = {}
+        for key in DMIDECODE_TO_DMI_SYS_MAPPING:
+            value = _read_dmi_syspath(key)
+            if value is not None:
+                data[key] = value
+    elif _dmidecode_supported() and which('dmidecode'):
+        data = _dump_dmidecode(which('dmidecode'))
+    else:
+        data = {}
+
+    if _DMI_CACHE_FILE:
+        try:
+            write_file(_DMI_CACHE_FILE, json.dumps(data), mode=0o600)
+        except (IOError, OSError) as e:
+            LOG.debug("Failed writing dmi cache %s: %s", _DMI_CACHE_FILE, e)
+    return data
+
+
+def set_dmi_cache_file(path):
+    """Share the dmi snapshot of this process through the file at path.
+
+    The file is read instead of sysfs/dmidecode if it exists, and written
+    after a fresh snapshot otherwise.  Use a path on a tmpfs (/run) so it
+    does not outlive the boot.
+    """
+    global _DMI_CACHE_FILE
+    _DMI_CACHE_FILE = path
+
+
+def reset_dmi_data():
+    """Forget memoized dmi values so they are read again on next use."""
+    global _DMI_DATA
+    with _DMI_LOCK:
+        _DMI_DATA = None
+
+
 def read_dmi_data(key):
     """
     Wrapper for reading DMI data.
@@ -2377,25 +2807,28 @@ def read_dmi_data(key):
         2) Use `key` as a sysfs key directly and look in /sys/class/dmi/...
         3) Fall-back to passing `key` to `dmidecode --string`.
 
-    If all of the above fail to find a value, None will be returned.
+    All mapped keys are read in one pass (of sysfs, or a single dmidecode
+    dump without sysfs) on first use and memoized for the process, as are
+    later dmidecode answers.  If all of the above fail to find a value,
+    None will be returned.
     """
-
-    syspath_value = _read_dmi_syspath(key)
-    if syspath_value is not None:
-        return syspath_value
-
-    # running dmidecode can be problematic on some arches (LP: #1243287)
-    uname_arch = os.uname()[4]
-    if not (uname_arch == "x86_64" or
-            (uname_arch.startswith("i") and uname_arch[2:] == "86") or
-            uname_arch == 'aarch64' or
-            uname_arch == 'amd64'):
-        LOG.debug("dmidata is not supported on %s", uname_arch)
+    global _DMI_DATA
+    with _DMI_LOCK:
+        if _DMI_DATA is None:
+            _DMI_DATA = _read_dmi_snapshot()
+        if key in _DMI_DATA:
+            return _DMI_DATA[key]
+
+    if not _dmidecode_supported():
         return None
 
     dmidecode_path = which('dmidecode')
     if dmidecode_path:
-        return _call_dmidecode(key, dmidecode_path)
+        value = _call_dmidecode(key, dmidecode_path)
+        with _DMI_LOCK:
+            if _DMI_DATA is not None:
+                _DMI_DATA[key] = value
+        return value
 
     LOG.warning("did not find either path %s or dmidecode command",
                 DMI_SYS_PATH)
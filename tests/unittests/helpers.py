@@ -21,6 +21,7 @@ except ImportError:
     from contextlib2 import ExitStack
 
 from cloudinit import helpers as ch
+from cloudinit import url_helper
 from cloudinit import util
 
 # Used for skipping tests
@@ -82,7 +83,11 @@ def retarget_many_wrapper(new_base, am, old_func):
 
 
 class TestCase(unittest2.TestCase):
-    pass
+    def setUp(self):
+        super(TestCase, self).setUp()
+        # dmi values are memoized per process, do not leak them across tests
+        util.reset_dmi_data()
+        util.reset_conf_cache()
 
 
 class CiTestCase(TestCase):
@@ -265,6 +270,18 @@ class HttprettyTestCase(TestCase):
         if self.restore_proxy is not None:
             del os.environ['http_proxy']
         super(HttprettyTestCase, self).setUp()
+        # httpretty's fake sockets are not thread safe, so run everything
+        # that would be fetched concurrently in the calling thread.
+        map_threaded = util.map_threaded
+        patcher = mock.patch.object(
+            util, 'map_threaded',
+            lambda func, items, max_workers=None: map_threaded(
+                func, items, max_workers=1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Don't let pooled keep-alive connections leak between tests.
+        url_helper.reset_sessions()
+        self.addCleanup(url_helper.reset_sessions)
 
     def tearDown(self):
         if self.restore_proxy:
@@ -1,5 +1,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
+import os
 import six
 
 from . import helpers as test_helpers
@@ -36,4 +38,61 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         self.assertEqual(2, exit_code)
 
 
+class TestAnalyze(test_helpers.FilesystemMockingTestCase):
+
+    def setUp(self):
+        super(TestAnalyze, self).setUp()
+        self.stdout = six.StringIO()
+        self.stderr = six.StringIO()
+        self.patchStdoutAndStderr(stdout=self.stdout, stderr=self.stderr)
+        self.journal_dir = self.tmp_dir()
+
+    def _write_journal(self, boot_id, records, mtime):
+        path = os.path.join(self.journal_dir, boot_id + '.json')
+        with open(path, 'w') as stream:
+            for record in records:
+                stream.write(json.dumps(record) + '\n')
+        os.utime(path, (mtime, mtime))
+
+    def _call_main(self, *args):
+        return cli.main(['cloud-init', 'analyze',
+                         '--journal-dir', self.journal_dir] + list(args))
+
+    def test_no_journals_is_error(self):
+        self.assertEqual(1, self._call_main())
+        self.assertIn('No event journals found', self.stderr.getvalue())
+
+    def test_reports_latest_boot_against_previous(self):
+        self._write_journal('boot1', [
+            {'name': 'init-network', 'start': 1.0, 'end': 3.0},
+            {'name': 'init-network/config-ssh', 'start': 1.0, 'end': 2.0},
+        ], 100)
+        self._write_journal('boot2', [
+            {'name': 'init-network', 'start': 1.0, 'end': 2.5},
+            {'name': 'init-network/config-ssh', 'start': 1.0, 'end': 1.25},
+            {'name': 'modules-final/config-scripts-user',
+             'start': 2.0, 'end': 2.5},
+        ], 200)
+        self.assertEqual(0, self._call_main())
+        out = self.stdout.getvalue()
+        self.assertIn('Compared to boot boot1', out)
+        lines = out.splitlines()
+        stage = [l for l in lines if l.strip().startswith('init-network ')]
+        self.assertEqual(['init-network', '1.500s', '-0.500s'],
+                         stage[0].split())
+        modules = lines[lines.index('Slowest modules:') + 1:]
+        self.assertEqual(
+            ['modules-final/config-scripts-user', '0.500s', 'new'],
+            modules[0].split())
+        self.assertEqual(
+            ['init-network/config-ssh', '0.250s', '-0.750s'],
+            modules[1].split())
+
+    def test_unknown_boot_is_error(self):
+        self._write_journal('boot1', [], 100)
+        self.assertEqual(1, self._call_main('--boot', 'nope'))
+        self.assertIn("No event journal for boot 'nope'",
+                      self.stderr.getvalue())
+
+
 # vi: ts=4 expandtab
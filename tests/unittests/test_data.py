@@ -5,6 +5,7 @@
 import gzip
 import logging
 import os
+import threading
 
 try:
     from unittest import mock
@@ -24,6 +25,7 @@ from cloudinit import log
 from cloudinit.settings import (PER_INSTANCE)
 from cloudinit import sources
 from cloudinit import stages
+from cloudinit import url_helper
 from cloudinit import user_data as ud
 from cloudinit import util
 
@@ -546,6 +548,177 @@ class TestUDProcess(helpers.ResourceUsingTestCase):
         self.assertTrue(count_messages(message) == 1)
 
 
+class TestUDInclude(helpers.ResourceUsingTestCase):
+
+    def _response(self, contents, code=200, headers=None):
+        resp = url_helper.StringResponse(contents, code=code)
+        resp.headers = headers or {}
+        return resp
+
+    def _payloads(self, message):
+        return [m.get_payload(decode=True) for m in message.walk()
+                if not ud.is_skippable(m)]
+
+    def test_includes_fetched_concurrently_in_order(self):
+        second_fetched = threading.Event()
+
+        def read_url(url, **kwargs):
+            if url.endswith('/first'):
+                # only returns promptly if '/second' is fetched alongside
+                second_fetched.wait(5)
+            else:
+                second_fetched.set()
+            return self._response(b'#!/bin/sh\necho ' +
+                                  url.rsplit('/', 1)[1].encode())
+
+        ud_proc = ud.UserDataProcessor(self.getCloudPaths())
+        msg = '#include\nhttp://example.com/first\nhttp://example.com/second\n'
+        with mock.patch.object(util, 'read_file_or_url', side_effect=read_url):
+            message = ud_proc.process(msg)
+        self.assertTrue(second_fetched.is_set())
+        self.assertEqual([b'#!/bin/sh\necho first', b'#!/bin/sh\necho second'],
+                         self._payloads(message))
+
+    def test_include_revalidated_with_conditional_get(self):
+        paths = self.getCloudPaths()
+        msg = '#include http://example.com/cfg\n'
+        content = b'#cloud-config\nlocale: chicago\n'
+        with mock.patch.object(util, 'read_file_or_url') as m_read:
+            m_read.return_value = self._response(
+                content, headers={'ETag': '"abc"',
+                                  'Last-Modified': 'Mon, 01 May 2017'})
+            ud.UserDataProcessor(paths).process(msg)
+            self.assertEqual({}, m_read.call_args[1]['headers'])
+
+            m_read.return_value = self._response(b'', code=304)
+            message = ud.UserDataProcessor(paths).process(msg)
+        self.assertEqual({'If-None-Match': '"abc"',
+                          'If-Modified-Since': 'Mon, 01 May 2017'},
+                         m_read.call_args[1]['headers'])
+        self.assertEqual([content], self._payloads(message))
+
+    def test_include_without_validators_not_cached(self):
+        paths = self.getCloudPaths()
+        msg = '#include http://example.com/cfg\n'
+        with mock.patch.object(util, 'read_file_or_url') as m_read:
+            m_read.return_value = self._response(b'#cloud-config\n{}\n')
+            ud.UserDataProcessor(paths).process(msg)
+            ud.UserDataProcessor(paths).process(msg)
+        self.assertEqual({}, m_read.call_args[1]['headers'])
+
+    def test_include_once_not_refetched(self):
+        paths = self.getCloudPaths()
+        msg = '#include-once http://example.com/cfg\n'
+        content = b'#cloud-config\nlocale: chicago\n'
+        with mock.patch.object(util, 'read_file_or_url') as m_read:
+            m_read.return_value = self._response(content)
+            ud.UserDataProcessor(paths).process(msg)
+            message = ud.UserDataProcessor(paths).process(msg)
+        self.assertEqual(1, m_read.call_count)
+        self.assertEqual([content], self._payloads(message))
+
+
+class TestUDSpill(helpers.ResourceUsingTestCase):
+
+    def _walk(self, message, paths=None):
+        found = []
+
+        def callback(_data, filename, payload, headers):
+            found.append((headers['Content-Type'], payload))
+
+        if paths is None:
+            paths = self.getCloudPaths()
+        handlers.walk(message, callback, None,
+                      parts_dir=handlers.payload_dir(paths))
+        return found
+
+    def test_large_part_spilled_to_instance_dir(self):
+        paths = self.getCloudPaths()
+        script = '#!/bin/sh\n' + 'echo hi\n' * 4
+        with mock.patch.object(ud, 'SPILL_SIZE', 16):
+            message = ud.UserDataProcessor(paths).process(script)
+        part = [m for m in message.walk() if not ud.is_skippable(m)][0]
+        path = part[ud.PAYLOAD_FILE_HEADER]
+        self.assertTrue(path.startswith(paths.get_ipath_cur('data')))
+        self.assertEqual(script, util.load_file(path))
+        self.assertNotIn('echo', str(message))
+        self.assertEqual([('text/x-shellscript', script)],
+                         self._walk(message, paths))
+
+    def test_small_part_not_spilled(self):
+        script = '#!/bin/sh\necho hi\n'
+        message = ud.UserDataProcessor(self.getCloudPaths()).process(script)
+        part = [m for m in message.walk() if not ud.is_skippable(m)][0]
+        self.assertNotIn(ud.PAYLOAD_FILE_HEADER, part)
+        self.assertEqual([('text/x-shellscript', script)],
+                         self._walk(message))
+
+    def test_payload_file_header_from_user_data_ignored(self):
+        outer = MIMEMultipart()
+        part = MIMEBase('text', 'x-shellscript')
+        part.set_payload('#!/bin/sh\necho hi\n')
+        part.add_header(ud.PAYLOAD_FILE_HEADER, '/etc/shadow')
+        outer.attach(part)
+        message = ud.UserDataProcessor(self.getCloudPaths()).process(
+            str(outer))
+        self.assertEqual([('text/x-shellscript', '#!/bin/sh\necho hi\n')],
+                         self._walk(message))
+
+    def test_payload_file_header_from_archive_ignored(self):
+        secret = self.tmp_path('secret')
+        util.write_file(secret, 'not for user-data')
+        archive = '\n'.join([
+            '#cloud-config-archive',
+            '- type: text/x-shellscript',
+            '  content: "#!/bin/sh\\necho hi\\n"',
+            '  %s: %s' % (ud.PAYLOAD_FILE_HEADER, secret)])
+        message = ud.UserDataProcessor(self.getCloudPaths()).process(archive)
+        part = [m for m in message.walk() if not ud.is_skippable(m)][0]
+        self.assertNotIn(ud.PAYLOAD_FILE_HEADER, part)
+        self.assertEqual([('text/x-shellscript', '#!/bin/sh\necho hi\n')],
+                         self._walk(message))
+
+    def test_payload_file_outside_parts_dir_not_read(self):
+        secret = self.tmp_path('secret')
+        util.write_file(secret, 'not for user-data')
+        part = MIMEBase('text', 'x-shellscript')
+        part.set_payload('')
+        part.add_header(ud.PAYLOAD_FILE_HEADER, secret)
+        self.assertEqual([('text/x-shellscript', '')], self._walk(part))
+
+    def test_compressed_binary_payload_kept(self):
+        blob = b'\x00\x99binary\xff'
+        contents = BytesIO()
+        with gzip.GzipFile(fileobj=contents, mode='wb') as f:
+            f.write(blob)
+        outer = MIMEMultipart()
+        outer.attach(MIMEApplication(contents.getvalue(), 'x-gzip'))
+        message = ud.UserDataProcessor(self.getCloudPaths()).process(
+            outer.as_string())
+        [(ctype, payload)] = self._walk(message)
+        self.assertEqual(ud.UNDEF_TYPE, ctype)
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf-8', 'surrogateescape')
+        self.assertEqual(blob, payload)
+
+
+class TestTypeFromStartsWith(helpers.TestCase):
+
+    def test_leading_whitespace_skipped(self):
+        payload = ' ' * 200 + '#cloud-config\n'
+        self.assertEqual('text/cloud-config',
+                         handlers.type_from_starts_with(payload))
+
+    def test_multibyte_char_cut_by_sniff_size(self):
+        payload = (u'#!/bin/sh\n# ' + u'\u00e9' * 100).encode('utf-8')
+        self.assertEqual('text/x-shellscript',
+                         handlers.type_from_starts_with(payload[:200]))
+
+    def test_undecodable_start_is_default(self):
+        self.assertEqual('x', handlers.type_from_starts_with(
+            b'\xff\xfe#!/bin/sh', default='x'))
+
+
 class TestConvertString(helpers.TestCase):
     def test_handles_binary_non_utf8_decodable(self):
         blob = b'\x32\x99'
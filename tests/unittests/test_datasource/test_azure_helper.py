@@ -1,9 +1,33 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import base64
 import os
 
 from cloudinit.sources.helpers import azure as azure_helper
-from ..helpers import ExitStack, mock, TestCase
+from ..helpers import (
+    CiTestCase, ExitStack, mock, populate_dir, skipIf, TestCase)
+
+TEST_CERTIFICATE = """\
+-----BEGIN CERTIFICATE-----
+MIICEDCCAXmgAwIBAgIUU4hU+kqFfmBv736QRskvNAXgHuMwDQYJKoZIhvcNAQEL
+BQAwGTEXMBUGA1UEAwwOTGludXhUcmFuc3BvcnQwIBcNMjYxMDE3MDYwNzMzWhgP
+MjExNjA3MDUwNjA3MzNaMBkxFzAVBgNVBAMMDkxpbnV4VHJhbnNwb3J0MIGfMA0G
+CSqGSIb3DQEBAQUAA4GNADCBiQKBgQClWM4G0dLM1Rx22UFjwLnbw2cwjwviJjMz
+94wgmvk0xMYQ+CYTrvXZx1Bws3PUuspxU1xgLfi3o29e0VWV8jlmV5xPwV3YKHtk
+Z/IgHudM37eVXC3rWU+fF6NYiNbKxuHlbZyAD+AoKP3odr3UfeHy9QafJtbkaJ6w
+E98C+EawfwIDAQABo1MwUTAdBgNVHQ4EFgQUJ0Z+SHhXNcDIXCM5pws1/040Z1kw
+HwYDVR0jBBgwFoAUJ0Z+SHhXNcDIXCM5pws1/040Z1kwDwYDVR0TAQH/BAUwAwEB
+/zANBgkqhkiG9w0BAQsFAAOBgQBEacQFA/hzNgbneGUo5xxWEMGEzpjnE1D3Z47j
+WQFo4CXmxD/e8vUs2yGE8/hXok1naQQRCuLTZGp3u6Pe5KPxMmAf904PI7qnQS20
+9EkneR6C+mzHWLBO7/CJtFj2ZSv7hjsKL/lKpmQz83rt5YXTLlcjthZjnGrFok39
+9fen6A==
+-----END CERTIFICATE-----
+"""
+
+TEST_SSH_KEY = (
+    'ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAAAgQClWM4G0dLM1Rx22UFjwLnbw2cwjwviJjMz'
+    '94wgmvk0xMYQ+CYTrvXZx1Bws3PUuspxU1xgLfi3o29e0VWV8jlmV5xPwV3YKHtkZ/IgHudM'
+    '37eVXC3rWU+fF6NYiNbKxuHlbZyAD+AoKP3odr3UfeHy9QafJtbkaJ6wE98C+Eawfw==')
 
 
 GOAL_STATE_TEMPLATE = """\
@@ -267,6 +291,8 @@ class TestOpenSSLManager(TestCase):
 
         self.subp = patches.enter_context(
             mock.patch.object(azure_helper.util, 'subp'))
+        patches.enter_context(
+            mock.patch.object(azure_helper, 'HAS_CRYPTOGRAPHY', False))
         try:
             self.open = patches.enter_context(
                 mock.patch('__builtin__.open'))
@@ -300,6 +326,121 @@ class TestOpenSSLManager(TestCase):
         self.assertEqual([mock.call(manager.tmpdir)], del_dir.call_args_list)
 
 
+class TestTransportKeyCache(CiTestCase):
+
+    def setUp(self):
+        super(TestTransportKeyCache, self).setUp()
+        patches = ExitStack()
+        self.addCleanup(patches.close)
+        self.subp = patches.enter_context(
+            mock.patch.object(azure_helper.util, 'subp'))
+        patches.enter_context(
+            mock.patch.object(azure_helper, 'HAS_CRYPTOGRAPHY', False))
+        self.key_dir = self.tmp_path('azure')
+
+    def test_generated_key_pair_is_cached(self):
+        def openssl_req(*_args, **_kwargs):
+            populate_dir(os.getcwd(), {'TransportPrivate.pem': 'KEY',
+                                       'TransportCert.pem': TEST_CERTIFICATE})
+
+        self.subp.side_effect = openssl_req
+        manager = azure_helper.OpenSSLManager(key_dir=self.key_dir)
+        self.addCleanup(manager.clean_up)
+        self.assertEqual(1, self.subp.call_count)
+        self.assertEqual(
+            ['TransportCert.pem', 'TransportPrivate.pem'],
+            sorted(os.listdir(self.key_dir)))
+        key_file = os.path.join(self.key_dir, 'TransportPrivate.pem')
+        self.assertEqual(0o600, os.stat(key_file).st_mode & 0o777)
+
+    def test_cached_key_pair_is_reused(self):
+        populate_dir(self.key_dir, {'TransportPrivate.pem': 'KEY',
+                                    'TransportCert.pem': TEST_CERTIFICATE})
+        manager = azure_helper.OpenSSLManager(key_dir=self.key_dir)
+        self.addCleanup(manager.clean_up)
+        self.assertEqual(0, self.subp.call_count)
+        self.assertEqual(
+            ''.join(TEST_CERTIFICATE.splitlines()[1:-1]), manager.certificate)
+        with open(os.path.join(manager.tmpdir, 'TransportPrivate.pem')) as f:
+            self.assertEqual('KEY', f.read())
+
+    def test_failed_in_process_generation_falls_back_to_openssl(self):
+        def openssl_req(*_args, **_kwargs):
+            populate_dir(os.getcwd(), {'TransportPrivate.pem': 'KEY',
+                                       'TransportCert.pem': TEST_CERTIFICATE})
+
+        self.subp.side_effect = openssl_req
+        with mock.patch.object(azure_helper, 'HAS_CRYPTOGRAPHY', True):
+            with mock.patch.object(
+                    azure_helper, '_generate_transport_keypair',
+                    side_effect=AttributeError('random_serial_number')):
+                manager = azure_helper.OpenSSLManager(key_dir=self.key_dir)
+        self.addCleanup(manager.clean_up)
+        self.assertEqual(1, self.subp.call_count)
+        self.assertEqual(
+            ''.join(TEST_CERTIFICATE.splitlines()[1:-1]), manager.certificate)
+
+    @skipIf(not azure_helper.HAS_CRYPTOGRAPHY, 'cryptography not available')
+    def test_key_pair_generated_in_process(self):
+        with mock.patch.object(azure_helper, 'HAS_CRYPTOGRAPHY', True):
+            manager = azure_helper.OpenSSLManager(key_dir=self.key_dir)
+        self.addCleanup(manager.clean_up)
+        self.assertEqual(0, self.subp.call_count)
+        with open(os.path.join(self.key_dir, 'TransportCert.pem')) as f:
+            pubkey = azure_helper.certificate_to_ssh_key(f.read())
+        self.assertTrue(pubkey.startswith('ssh-rsa '))
+
+    def test_random_serial_number_is_positive_and_fits(self):
+        for _ in range(32):
+            serial = azure_helper._random_serial_number()
+            self.assertTrue(0 < serial < 2 ** 159)
+
+
+class TestCertificateToSshKey(TestCase):
+
+    def test_rsa_certificate_converted_in_process(self):
+        with mock.patch.object(azure_helper.util, 'subp') as subp:
+            self.assertEqual(
+                [TEST_SSH_KEY],
+                azure_helper.certificates_to_ssh_keys([TEST_CERTIFICATE]))
+        self.assertEqual(0, subp.call_count)
+
+    def test_garbage_raises_value_error(self):
+        self.assertRaises(ValueError, azure_helper.certificate_to_ssh_key,
+                          '-----BEGIN CERTIFICATE-----\nMIIB\n')
+
+    def test_truncated_der_raises_value_error(self):
+        def seq(*parts):
+            content = b''.join(parts)
+            return bytes(bytearray([0x30, len(content)])) + content
+
+        def pem(der):
+            return '\n'.join(['-----BEGIN CERTIFICATE-----',
+                              base64.b64encode(der).decode('ascii'),
+                              '-----END CERTIFICATE-----'])
+
+        # an empty certificate SEQUENCE, and an AlgorithmIdentifier
+        # without an algorithm
+        no_algorithm = seq(seq(b'\x02\x01\x01', seq(), seq(), seq(), seq(),
+                               seq(seq(), b'\x03\x01\x00')))
+        for der in [seq(), no_algorithm]:
+            self.assertRaises(ValueError, azure_helper.certificate_to_ssh_key,
+                              pem(der))
+            with mock.patch.object(azure_helper.util, 'subp') as subp:
+                subp.return_value = ('ssh-rsa AAAA\n', '')
+                self.assertEqual(['ssh-rsa AAAA'],
+                                 azure_helper.certificates_to_ssh_keys(
+                                     [pem(der)]))
+
+    def test_unconvertible_certificates_fall_back_to_openssl(self):
+        with mock.patch.object(azure_helper.util, 'subp') as subp:
+            subp.return_value = ('ecdsa-sha2-nistp256 AAAA\n', '')
+            self.assertEqual(
+                ['ecdsa-sha2-nistp256 AAAA'],
+                azure_helper.certificates_to_ssh_keys(['not a certificate']))
+        self.assertEqual(1, subp.call_count)
+
+
 class TestWALinuxAgentShim(TestCase):
 
     def setUp(self):
@@ -319,6 +460,12 @@ class TestWALinuxAgentShim(TestCase):
         patches.enter_context(
             mock.patch.object(azure_helper.time, 'sleep', mock.MagicMock()))
 
+    def test_key_dir_passed_to_openssl_manager(self):
+        shim = azure_helper.WALinuxAgentShim(key_dir='/var/lib/keys')
+        shim.register_with_azure_and_fetch_data()
+        self.assertEqual([mock.call(key_dir='/var/lib/keys')],
+                         self.OpenSSLManager.call_args_list)
+
     def test_http_client_uses_certificate(self):
         shim = azure_helper.WALinuxAgentShim()
         shim.register_with_azure_and_fetch_data()
@@ -1,7 +1,13 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
+import mock
+import threading
+
+from cloudinit import helpers
 from cloudinit import settings
 from cloudinit import sources
+from cloudinit import stages
 from cloudinit import type_utils
 from cloudinit.sources import (
     DataSourceAliYun as AliYun,
@@ -73,4 +79,238 @@ class ExpectedDataSources(test_helpers.TestCase):
         self.assertEqual(set([AliYun.DataSourceAliYun]), set(found))
 
 
+class _FakeSource(sources.DataSource):
+    detected = None
+    found = False
+    calls = []
+
+    def detect(self):
+        self.calls.append(('detect', type_utils.obj_name(self)))
+        return self.detected
+
+    def get_data(self):
+        self.calls.append(('get_data', type_utils.obj_name(self)))
+        return self.found
+
+
+class DataSourceNotHere(_FakeSource):
+    detected = False
+    found = True
+
+
+class DataSourceUnsure(_FakeSource):
+    detected = None
+    found = False
+
+
+class DataSourceHere(_FakeSource):
+    detected = True
+    found = True
+
+
+class DataSourceAlsoHere(_FakeSource):
+    detected = True
+    found = True
+
+
+class TestFindSource(test_helpers.TestCase):
+
+    def setUp(self):
+        super(TestFindSource, self).setUp()
+        _FakeSource.calls = []
+        self.paths = helpers.Paths({})
+
+    def _find_source(self, ds_list, sys_cfg):
+        with mock.patch.object(sources, 'list_sources',
+                               return_value=ds_list):
+            return sources.find_source(
+                sys_cfg, None, self.paths, [sources.DEP_FILESYSTEM],
+                [], [], None)
+
+    def test_serial_search_does_not_detect(self):
+        """Without parallel detection every source's get_data is tried."""
+        (ds, name) = self._find_source(
+            [DataSourceNotHere, DataSourceHere], {})
+        self.assertEqual('DataSourceNotHere', name)
+        self.assertEqual([('get_data', 'DataSourceNotHere')],
+                         _FakeSource.calls)
+
+    def test_parallel_detect_skips_undetected_sources(self):
+        """Sources whose detect says no are not searched."""
+        (ds, name) = self._find_source(
+            [DataSourceNotHere, DataSourceUnsure, DataSourceHere],
+            {'datasource_parallel_detect': True})
+        self.assertEqual('DataSourceHere', name)
+        self.assertIsInstance(ds, DataSourceHere)
+        self.assertEqual(
+            [('get_data', 'DataSourceUnsure'), ('get_data', 'DataSourceHere')],
+            [call for call in _FakeSource.calls if call[0] == 'get_data'])
+        self.assertEqual(
+            set(['DataSourceNotHere', 'DataSourceUnsure', 'DataSourceHere']),
+            set(n for (kind, n) in _FakeSource.calls if kind == 'detect'))
+
+    def test_parallel_detect_honors_list_order(self):
+        """The first detected source in datasource_list wins."""
+        (_ds, name) = self._find_source(
+            [DataSourceAlsoHere, DataSourceHere],
+            {'datasource_parallel_detect': True})
+        self.assertEqual('DataSourceAlsoHere', name)
+
+    def test_parallel_detect_reports_timing(self):
+        """search events report how long detection and search took."""
+        reporter = mock.MagicMock(fullname='init-local',
+                                  reporting_enabled=False)
+        reporter.children = {}
+        with mock.patch.object(sources, 'list_sources',
+                               return_value=[DataSourceNotHere,
+                                             DataSourceHere]):
+            sources.find_source(
+                {'datasource_parallel_detect': True}, None, self.paths,
+                [sources.DEP_FILESYSTEM], [], [], reporter)
+        (_result, msg) = reporter.children['search-NotHere']
+        self.assertRegex(msg, r'detect [0-9.]+ seconds, not detected')
+        (_result, msg) = reporter.children['search-Here']
+        self.assertRegex(
+            msg, r'found local data from DataSourceHere '
+                 r'\(detect [0-9.]+ seconds, search [0-9.]+ seconds\)')
+
+    def test_nothing_found_raises(self):
+        self.assertRaises(
+            sources.DataSourceNotFoundException, self._find_source,
+            [DataSourceNotHere, DataSourceUnsure],
+            {'datasource_parallel_detect': True})
+
+
+class DataSourceCacheable(sources.DataSource):
+    _platform = None
+
+    def __init__(self, sys_cfg, distro, paths):
+        sources.DataSource.__init__(self, sys_cfg, distro, paths)
+        self._network_config = None
+        self.lock = threading.Lock()
+
+    @property
+    def network_config(self):
+        if self._network_config is None:
+            self._network_config = {'version': 1, 'config': []}
+        return self._network_config
+
+
+class TestDataSourceCache(test_helpers.CiTestCase):
+
+    def setUp(self):
+        super(TestDataSourceCache, self).setUp()
+        self.paths = helpers.Paths({})
+
+    def _cached_ds(self):
+        ds = DataSourceCacheable({}, None, self.paths)
+        ds.metadata = {'instance-id': 'i-abc', 'local-hostname': 'me'}
+        ds.userdata_raw = b'#cloud-config\n\xff'
+        ds.vendordata_raw = None
+        ds._platform = 'test'
+        return ds
+
+    def test_round_trip(self):
+        """A restored datasource has the cached data."""
+        blob = sources.cache_dump(self._cached_ds())
+        ds = sources.restore_from_cache(blob, {}, None, self.paths)
+        self.assertIsInstance(ds, DataSourceCacheable)
+        self.assertEqual('i-abc', ds.get_instance_id())
+        self.assertEqual(b'#cloud-config\n\xff', ds.get_userdata_raw())
+        self.assertIsNone(ds.get_vendordata_raw())
+        self.assertEqual('test', ds._platform)
+        self.assertEqual({'version': 1, 'config': []}, ds.network_config)
+        self.assertIs(self.paths, ds.paths)
+
+    def test_fields_are_decoded_lazily(self):
+        """Fields are only decoded when used."""
+        blob = sources.cache_dump(self._cached_ds())
+        ds = sources.restore_from_cache(blob, {}, None, self.paths)
+        self.assertNotIn('userdata_raw', ds.__dict__)
+        ds.get_instance_id()
+        self.assertNotIn('userdata_raw', ds.__dict__)
+        ds.get_userdata_raw()
+        self.assertIn('userdata_raw', ds.__dict__)
+        # Undecoded fields survive a dump of the restored datasource.
+        again = sources.restore_from_cache(
+            sources.cache_dump(ds), {}, None, self.paths)
+        self.assertEqual({'version': 1, 'config': []}, again.network_config)
+
+    def test_unserializable_attributes_are_not_cached(self):
+        """Attributes that can not be serialized come from __init__."""
+        data = json.loads(sources.cache_dump(self._cached_ds()))
+        self.assertNotIn('lock', data['fields'])
+        self.assertNotIn('sys_cfg', data['fields'])
+        self.assertEqual('i-abc', data['instance-id'])
+        self.assertEqual(sources.CACHE_VERSION, data['version'])
+
+    def test_ds_cfg_is_cached(self):
+        """Settings a datasource merged into ds_cfg are restored."""
+        ds = self._cached_ds()
+        ds.ds_cfg = {'disk_aliases': {'ephemeral0': '/dev/sdb'}}
+        blob = sources.cache_dump(ds)
+        ds = sources.restore_from_cache(blob, {}, None, self.paths)
+        self.assertEqual({'ephemeral0': '/dev/sdb'},
+                         ds.ds_cfg['disk_aliases'])
+
+    def test_attributes_changed_by_json_are_not_cached(self):
+        """Tuples and non-string keys do not survive json, so such
+        attributes are left to __init__ rather than restored differently."""
+        for value in [('a', 'b'), {1: 'one'}, {'key': [('a', 1)]}]:
+            ds = self._cached_ds()
+            ds.extra = value
+            data = json.loads(sources.cache_dump(ds))
+            self.assertNotIn('extra', data['fields'])
+            self.assertIn('metadata', data['fields'])
+
+    def test_required_attributes_changed_by_json_raise(self):
+        """A datasource whose metadata json would change is not cached."""
+        ds = self._cached_ds()
+        ds.metadata = {'instance-id': 'i-abc', 1: 'one'}
+        self.assertRaises(sources.CacheError, sources.cache_dump, ds)
+
+    def test_network_config_not_computed_for_the_cache(self):
+        """Only a network config that was already computed is cached."""
+        ds = self._cached_ds()
+        with mock.patch.object(DataSourceCacheable, 'network_config',
+                               new_callable=mock.PropertyMock) as m_netcfg:
+            m_netcfg.side_effect = RuntimeError("conversion failed")
+            data = json.loads(sources.cache_dump(ds))
+        self.assertEqual(0, m_netcfg.call_count)
+        self.assertEqual('null', data['fields']['_network_config'])
+
+    def test_seeded_datasources_cached_and_restored(self):
+        """NoCloud and OVF keep their seed prefixes in a tuple, they are
+        still cached and come back with what __init__ sets."""
+        for cls in [NoCloud.DataSourceNoCloud, NoCloud.DataSourceNoCloudNet,
+                    OVF.DataSourceOVF, OVF.DataSourceOVFNet]:
+            ds = cls({}, None, self.paths)
+            ds.metadata = {'instance-id': 'i-seeded'}
+            ds.userdata_raw = b'#cloud-config\n{}\n'
+            ds.vendordata_raw = ''
+            cache_file = self.tmp_path('obj.json')
+            self.assertTrue(stages._cache_store(ds, cache_file))
+            restored = stages._cache_load(cache_file, {}, None, self.paths)
+            self.assertIsInstance(restored, cls)
+            self.assertEqual('i-seeded', restored.get_instance_id())
+            self.assertEqual(ds.userdata_raw, restored.get_userdata_raw())
+            self.assertEqual(ds.supported_seed_starts,
+                             restored.supported_seed_starts)
+
+    def test_invalid_caches_raise_cache_error(self):
+        """Caches that fail the schema check raise CacheError."""
+        good = json.loads(sources.cache_dump(self._cached_ds()))
+        bad_version = dict(good, version=sources.CACHE_VERSION + 1)
+        missing_class = dict(good, datasource={'module': 'cloudinit.sources',
+                                               'class': 'DataSourceGone'})
+        not_a_ds = dict(good, datasource={'module': 'cloudinit.sources',
+                                          'class': 'CacheError'})
+        no_metadata = dict(good, fields={})
+        bad_field = dict(good, fields={'metadata': {}})
+        for blob in ['not json', '[]', json.dumps(bad_version),
+                     json.dumps(missing_class), json.dumps(not_a_ds),
+                     json.dumps(no_metadata), json.dumps(bad_field)]:
+            self.assertRaises(sources.CacheError, sources.restore_from_cache,
+                              blob, {}, None, self.paths)
+
 # vi: ts=4 expandtab
@@ -5,6 +5,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import httpretty
+import json
 import mock
 import re
 
@@ -13,6 +14,7 @@ from six.moves.urllib_parse import urlparse
 
 from cloudinit import helpers
 from cloudinit import settings
+from cloudinit import url_helper
 from cloudinit.sources import DataSourceGCE
 
 from .. import helpers as test_helpers
@@ -45,16 +47,32 @@ MD_URL_RE = re.compile(
     r'http://metadata.google.internal/computeMetadata/v1/.*')
 
 
-def _set_mock_metadata(gce_meta=None):
+def _metadata_tree(gce_meta):
+    tree = {}
+    for (path, value) in gce_meta.items():
+        node = tree
+        parts = path.split('/')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        node[parts[-1]] = value
+    return tree
+
+
+def _set_mock_metadata(gce_meta=None, recursive=False, url_re=MD_URL_RE):
     if gce_meta is None:
         gce_meta = GCE_META
 
     def _request_callback(method, uri, headers):
-        url_path = urlparse(uri).path
+        parsed = urlparse(uri)
+        url_path = parsed.path
         if url_path.startswith('/computeMetadata/v1/'):
             path = url_path.split('/computeMetadata/v1/')[1:][0]
         else:
             path = None
+        if path == '' and 'recursive=true' in parsed.query and recursive:
+            return (200, headers, json.dumps(_metadata_tree(gce_meta)))
         if path in gce_meta:
             return (200, headers, gce_meta.get(path))
         else:
@@ -62,7 +80,7 @@ def _set_mock_metadata(gce_meta=None):
 
     # reset is needed. https://github.com/gabrielfalcao/HTTPretty/issues/316
     httpretty.reset()
-    httpretty.register_uri(httpretty.GET, MD_URL_RE, body=_request_callback)
+    httpretty.register_uri(httpretty.GET, url_re, body=_request_callback)
 
 
 @httpretty.activate
@@ -167,5 +185,49 @@ class TestDataSourceGCE(test_helpers.HttprettyTestCase):
         self.m_platform_reports_gce.return_value = False
         self.assertEqual(False, self.ds.get_data())
 
+    def test_recursive_metadata_read_with_one_request(self):
+        meta = GCE_META_ENCODING.copy()
+        meta['instance/id'] = 12345
+        meta['project/attributes/sshKeys'] = GCE_META[
+            'project/attributes/sshKeys']
+        _set_mock_metadata(meta, recursive=True)
+        self.assertTrue(self.ds.get_data())
+        self.assertEqual(1, len(httpretty.HTTPretty.latest_requests))
+        self.assertEqual('12345', self.ds.get_instance_id())
+        self.assertEqual('server', self.ds.get_hostname())
+        self.assertEqual('bang', self.ds.availability_zone)
+        self.assertEqual(b'/bin/echo baz\n', self.ds.get_userdata_raw())
+        self.assertEqual(['ssh-rsa AA2..+aRD0fyVw== root@server'],
+                         self.ds.get_public_ssh_keys())
+
+    def test_recursive_metadata_missing_required_key(self):
+        meta = GCE_META_PARTIAL.copy()
+        del meta['instance/zone']
+        _set_mock_metadata(meta, recursive=True)
+        self.assertFalse(self.ds.get_data())
+        self.assertEqual(1, len(httpretty.HTTPretty.latest_requests))
+
+    def test_falls_back_to_a_request_per_path(self):
+        _set_mock_metadata()
+        self.assertTrue(self.ds.get_data())
+        self.assertGreater(len(httpretty.HTTPretty.latest_requests), 1)
+        self.assertEqual(GCE_META['instance/id'], self.ds.get_instance_id())
+
+    def test_local_metadata_url(self):
+        url = 'http://127.0.0.1:8080/computeMetadata/v1/'
+        ds = DataSourceGCE.DataSourceGCE(
+            {'datasource': {'GCE': {'metadata_url': url}}}, None,
+            helpers.Paths({}))
+        _set_mock_metadata(recursive=True, url_re=re.compile(
+            re.escape(url) + '.*'))
+        self.assertTrue(ds.get_data())
+        self.assertEqual(GCE_META['instance/id'], ds.get_instance_id())
+
+    @mock.patch('cloudinit.sources.DataSourceGCE.url_helper.readurl')
+    def test_unreachable_metadata_server_is_not_gce(self, m_readurl):
+        m_readurl.side_effect = url_helper.UrlError('no route to host')
+        self.assertFalse(self.ds.get_data())
+        self.assertEqual(1, m_readurl.call_count)
+
 
 # vi: ts=4 expandtab
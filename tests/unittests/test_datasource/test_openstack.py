@@ -8,6 +8,7 @@ import copy
 import httpretty as hp
 import json
 import re
+import threading
 
 from .. import helpers as test_helpers
 
@@ -302,6 +303,91 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
         self.assertIsNone(ds_os.version)
 
 
+class FakeReader(openstack.BaseReader):
+    """Reads OS_FILES from memory, the ec2 crawl runs ec2_reader."""
+
+    def __init__(self, os_files, ec2_reader):
+        super(FakeReader, self).__init__('')
+        self.os_files = os_files
+        self.ec2_reader = ec2_reader
+
+    def _path_join(self, base, *add_ons):
+        return '/'.join([p for p in (base,) + add_ons if p])
+
+    def _path_read(self, path, decode=False):
+        if path not in self.os_files:
+            raise IOError("%s not found" % path)
+        return self.os_files[path]
+
+    def _fetch_available_versions(self):
+        return [openstack.OS_LATEST]
+
+    def _read_ec2_metadata(self):
+        return self.ec2_reader()
+
+
+class TestReadV2Concurrency(test_helpers.TestCase):
+
+    def test_ec2_crawl_overlaps_openstack_reads(self):
+        ec2_started = threading.Event()
+        seen = []
+
+        class SlowReader(FakeReader):
+            def _path_read(self, path, decode=False):
+                # provided files only return promptly if the ec2 crawl
+                # runs alongside
+                if '/content/' in path:
+                    seen.append(ec2_started.wait(5))
+                return super(SlowReader, self)._path_read(path, decode)
+
+        def ec2_reader():
+            ec2_started.set()
+            return EC2_META
+
+        results = SlowReader(OS_FILES, ec2_reader).read_v2()
+        self.assertEqual(EC2_META, results['ec2-metadata'])
+        self.assertEqual(USER_DATA, results['userdata'])
+        self.assertEqual({'/etc/foo.cfg': CONTENT_0,
+                          '/etc/bar/bar.cfg': CONTENT_1}, results['files'])
+        self.assertEqual([True, True], seen)
+
+    def test_no_ec2_crawl_without_openstack_metadata(self):
+        """A location without meta_data.json fails without crawling."""
+        ec2_reader = test_helpers.mock.Mock(return_value=EC2_META)
+        os_files = copy.deepcopy(OS_FILES)
+        del os_files['openstack/latest/meta_data.json']
+        reader = FakeReader(os_files, ec2_reader)
+        self.assertRaises(openstack.NonReadable, reader.read_v2)
+        self.assertEqual(0, ec2_reader.call_count)
+
+    def test_openstack_errors_take_precedence(self):
+        def ec2_reader():
+            raise openstack.BrokenMetadata("ec2 is broken too")
+
+        os_files = copy.deepcopy(OS_FILES)
+        del os_files['openstack/content/0000']
+        reader = FakeReader(os_files, ec2_reader)
+        with self.assertRaises(openstack.BrokenMetadata) as ctx:
+            reader.read_v2()
+        self.assertIn('/etc/foo.cfg', str(ctx.exception))
+
+    def test_ec2_errors_still_raised(self):
+        def ec2_reader():
+            raise openstack.BrokenMetadata("ec2 is broken")
+
+        reader = FakeReader(OS_FILES, ec2_reader)
+        self.assertRaises(openstack.BrokenMetadata, reader.read_v2)
+
+    def test_first_unreadable_file_is_reported(self):
+        os_files = copy.deepcopy(OS_FILES)
+        del os_files['openstack/content/0000']
+        del os_files['openstack/content/0001']
+        reader = FakeReader(os_files, lambda: {})
+        with self.assertRaises(openstack.BrokenMetadata) as ctx:
+            reader.read_v2()
+        self.assertIn('/etc/foo.cfg', str(ctx.exception))
+
+
 class TestVendorDataLoading(test_helpers.TestCase):
     def cvj(self, data):
         return convert_vendordata(data)
@@ -341,6 +341,9 @@ class PsuedoJoyentClient(object):
             return default
         return json.loads(result)
 
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
     def exists(self):
         return True
 
@@ -737,6 +740,96 @@ class TestJoyentMetadataClient(FilesystemMockingTestCase):
         self.assertIsNone(client.get('some_key'))
 
 
+def _reply(request_id, value=None):
+    if value is None:
+        body = '{0:08x} NOTFOUND'.format(request_id)
+    else:
+        body = '{0:08x} SUCCESS {1}'.format(request_id, b64e(value))
+    return 'V2 {0} {1:08x} {2}\n'.format(
+        len(body), crc32(body.encode('utf-8')) & 0xffffffff, body)
+
+
+class BufferedTransport(object):
+    """A transport that hands out everything written so far per read1."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.written = []
+        self.reads = 0
+
+    def write(self, data):
+        self.written.append(data)
+
+    def flush(self):
+        pass
+
+    def read1(self, _size):
+        self.reads += 1
+        data = self.replies
+        self.replies = b''
+        return data
+
+    def close(self):
+        pass
+
+
+class TestJoyentMetadataClientBatch(TestCase):
+
+    request_id = 0x10
+
+    def setUp(self):
+        super(TestJoyentMetadataClientBatch, self).setUp()
+        patcher = mock.patch(
+            'cloudinit.sources.DataSourceSmartOS.random.randint',
+            mock.Mock(return_value=self.request_id))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_client(self, replies):
+        self.fp = BufferedTransport(''.join(replies).encode('ascii'))
+        return DataSourceSmartOS.JoyentMetadataClient(
+            fp=self.fp, smartos_type=DataSourceSmartOS.SMARTOS_ENV_KVM)
+
+    def test_get_many_writes_all_requests_at_once(self):
+        client = self._get_client(
+            [_reply(0x10, 'a'), _reply(0x11, 'b'), _reply(0x12)])
+        self.assertEqual(['a', 'b', None],
+                         client.get_many(['ka', 'kb', 'kc']))
+        self.assertEqual(1, len(self.fp.written))
+        ids = [line.split(' ')[3] for line in
+               self.fp.written[0].decode('ascii').splitlines()]
+        self.assertEqual(['00000010', '00000011', '00000012'], ids)
+        self.assertEqual(1, self.fp.reads)
+
+    def test_get_many_matches_replies_by_request_id(self):
+        client = self._get_client(
+            [_reply(0x12, 'c'), _reply(0x10, 'a'), _reply(0x11, 'b')])
+        self.assertEqual(['a', 'b', 'c'], client.get_many(['ka', 'kb', 'kc']))
+
+    def test_get_many_validates_frames(self):
+        bad = _reply(0x11, 'b').replace('SUCCESS', 'SUCCESS ')
+        client = self._get_client([_reply(0x10, 'a'), bad])
+        client.request = mock.Mock(
+            side_effect=DataSourceSmartOS.JoyentMetadataFetchException)
+        self.assertRaises(DataSourceSmartOS.JoyentMetadataFetchException,
+                          client.get_many, ['ka', 'kb'])
+
+    def test_get_many_falls_back_to_one_request_per_key(self):
+        client = self._get_client([_reply(0xdead, 'a')])
+        client.request = mock.Mock(side_effect=['a', 'b'])
+        self.assertEqual(['a', 'b'], client.get_many(['ka', 'kb']))
+        self.assertEqual([mock.call(rtype='GET', param='ka'),
+                          mock.call(rtype='GET', param='kb')],
+                         client.request.call_args_list)
+
+    def test_get_buffers_replies_for_later_frames(self):
+        client = self._get_client([_reply(0x10, 'a')])
+        self.fp.replies += _reply(0x10, 'b').encode('ascii')
+        self.assertEqual('a', client.get('ka'))
+        self.assertEqual('b', client.get('kb'))
+        self.assertEqual(1, self.fp.reads)
+
+
 class TestNetworkConversion(TestCase):
     def test_convert_simple(self):
         expected = {
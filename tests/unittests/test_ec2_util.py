@@ -185,4 +185,63 @@ class TestEc2Util(helpers.HttprettyTestCase):
         self.assertEqual(iam['info']['LastUpdated'], '2016-10-27T17:29:39Z')
         self.assertNotIn('security-credentials', iam)
 
+
+class TestMetadataMaterializer(helpers.TestCase):
+    base_url = 'http://169.254.169.254/latest/meta-data/'
+    tree = {
+        '': "\n".join(['hostname', 'public-keys/', 'block-device-mapping/',
+                       'iam/']),
+        'hostname': 'ec2.fake.host.name.com',
+        'public-keys/': "\n".join(['0=my-public-key', '1=my-other-key']),
+        'public-keys/0/openssh-key': 'ssh-rsa AAAA my-public-key',
+        'public-keys/1/openssh-key': 'ssh-rsa BBBB my-other-key',
+        'block-device-mapping/': "\n".join(['ami', 'ephemeral0']),
+        'block-device-mapping/ami': 'sdb',
+        'block-device-mapping/ephemeral0': 'sdc',
+        'iam/': "\n".join(['info/', 'security-credentials/']),
+        'iam/info/': 'LastUpdated',
+        'iam/info/LastUpdated': '2016-10-27T17:29:39Z',
+    }
+
+    def _caller(self, url):
+        return self.tree[url[len(self.base_url):]]
+
+    def _materialize(self, max_workers):
+        materializer = eu.MetadataMaterializer(
+            self.tree[''], self.base_url, self._caller,
+            max_workers=max_workers)
+        return (materializer, materializer.materialize())
+
+    def test_concurrent_crawl_matches_sequential_crawl(self):
+        """A concurrent crawl returns exactly what a sequential one does."""
+        (_m, expected) = self._materialize(max_workers=1)
+        (_m, found) = self._materialize(max_workers=4)
+        self.assertEqual(expected, found)
+        self.assertEqual(
+            {'hostname': 'ec2.fake.host.name.com',
+             'public-keys': {'my-public-key': 'ssh-rsa AAAA my-public-key',
+                             'my-other-key': 'ssh-rsa BBBB my-other-key'},
+             'block-device-mapping': {'ami': 'sdb', 'ephemeral0': 'sdc'},
+             'iam': {'info': {'LastUpdated': '2016-10-27T17:29:39Z'}}},
+            found)
+
+    def test_crawl_records_timing_per_request(self):
+        """Every url fetched while crawling has a recorded timing."""
+        (materializer, _md) = self._materialize(max_workers=4)
+        urls = sorted(url for (url, _elapsed) in materializer.timings)
+        expected = sorted(
+            self.base_url + path for path in self.tree if path)
+        self.assertEqual(expected, urls)
+
+    def test_crawl_error_is_raised(self):
+        """A failing fetch propagates out of materialize."""
+        def caller(url):
+            if url.endswith('ami'):
+                raise uh.UrlError(ValueError('boom'), code=500, url=url)
+            return self._caller(url)
+
+        materializer = eu.MetadataMaterializer(
+            self.tree[''], self.base_url, caller, max_workers=4)
+        self.assertRaises(uh.UrlError, materializer.materialize)
+
 # vi: ts=4 expandtab
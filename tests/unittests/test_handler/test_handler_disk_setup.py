@@ -222,4 +222,50 @@ class TestMkfsCommandHandling(TestCase):
              '-L', 'without_cmd', '-F', 'are', 'added'],
             shell=False)
 
+
+@mock.patch('cloudinit.config.cc_disk_setup.util.subp', return_value=('', ''))
+@mock.patch('cloudinit.config.cc_disk_setup.udev_db_path',
+            return_value='/run/udev/data/b8:16')
+@mock.patch('cloudinit.config.cc_disk_setup.os.path.exists')
+class TestAssertAndSettleDevice(TestCase):
+
+    def test_new_device_waits_for_its_udev_entry(self, m_exists, _db, subp):
+        m_exists.side_effect = [False, True]
+        cc_disk_setup.assert_and_settle_device('/dev/sdb')
+        self.assertEqual(
+            [mock.call(['udevadm', 'settle', '--exit-if-exists=/dev/sdb']),
+             mock.call(['udevadm', 'settle',
+                        '--exit-if-exists=/run/udev/data/b8:16'])],
+            subp.call_args_list)
+
+    def test_existing_device_settles(self, m_exists, _db, subp):
+        m_exists.return_value = True
+        cc_disk_setup.assert_and_settle_device('/dev/sdb')
+        self.assertEqual([mock.call(['udevadm', 'settle'])],
+                         subp.call_args_list)
+
+    def test_missing_device_raises(self, m_exists, _db, subp):
+        m_exists.return_value = False
+        self.assertRaises(RuntimeError,
+                          cc_disk_setup.assert_and_settle_device, '/dev/sdb')
+
+
+@mock.patch('cloudinit.config.cc_disk_setup.util.blkid_probe')
+@mock.patch('cloudinit.config.cc_disk_setup.util.blkid_devices')
+class TestCheckFs(TestCase):
+
+    def test_indexed_device_not_probed(self, m_devices, m_probe):
+        m_devices.return_value = {'/dev/vdb': {'TYPE': 'ext4', 'UUID': 'u'}}
+        self.assertEqual((None, 'ext4', 'u'),
+                         cc_disk_setup.check_fs('/dev/vdb'))
+        self.assertEqual(0, m_probe.call_count)
+
+    def test_device_missing_from_index_probed(self, m_devices, m_probe):
+        """A device that appeared after the index was built is probed."""
+        m_devices.return_value = {}
+        m_probe.return_value = {'LABEL': 'eph', 'TYPE': 'ext4'}
+        self.assertEqual(('eph', 'ext4', None),
+                         cc_disk_setup.check_fs('/dev/sdb'))
+        m_probe.assert_called_once_with('/dev/sdb')
+
 # vi: ts=4 expandtab
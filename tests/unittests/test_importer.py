@@ -0,0 +1,34 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from cloudinit import importer
+
+from .helpers import CiTestCase, mock
+
+
+class TestFindModule(CiTestCase):
+
+    def test_module_exists(self):
+        self.assertTrue(importer.module_exists('cloudinit.config.cc_ntp'))
+        self.assertFalse(
+            importer.module_exists('cloudinit.config.cc_does_not_exist'))
+        self.assertFalse(importer.module_exists('cloudinit.nopkg.cc_ntp'))
+
+    def test_missing_modules_not_probed(self):
+        """Locations without the module are not import-probed."""
+        with mock.patch('cloudinit.importer.import_module') as m_import:
+            found, looked = importer.find_module(
+                'cc_does_not_exist', ['', 'cloudinit.config'], ['handle'])
+        self.assertEqual([], found)
+        self.assertEqual(['cc_does_not_exist',
+                          'cloudinit.config.cc_does_not_exist'], looked)
+        self.assertEqual(0, m_import.call_count)
+
+    def test_found_module_with_required_attrs(self):
+        found, _looked = importer.find_module(
+            'cc_ntp', ['', 'cloudinit.config'], ['handle'])
+        self.assertEqual(['cloudinit.config.cc_ntp'], found)
+        found, _looked = importer.find_module(
+            'cc_ntp', ['cloudinit.config'], ['not_an_attr'])
+        self.assertEqual([], found)
+
+# vi: ts=4 expandtab
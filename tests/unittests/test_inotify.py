@@ -0,0 +1,61 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.inotify."""
+
+import os
+import threading
+
+from cloudinit import inotify
+
+from .helpers import CiTestCase, mock
+
+
+class TestWaitForPaths(CiTestCase):
+
+    def setUp(self):
+        super(TestWaitForPaths, self).setUp()
+        self.tmp = self.tmp_dir()
+
+    def _create_later(self, path, delay=0.1):
+        def create():
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fp:
+                fp.write('')
+        timer = threading.Timer(delay, create)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_existing_paths_do_not_wait(self):
+        path = os.path.join(self.tmp, 'there')
+        open(path, 'w').close()
+        (missing, waited) = inotify.wait_for_paths([path], maxwait=10)
+        self.assertEqual(set(), missing)
+        self.assertLess(waited, 1)
+
+    def test_returns_when_path_is_created(self):
+        # a missed event would only be noticed after naplen
+        path = os.path.join(self.tmp, 'disk', 'by-id', 'dev')
+        self._create_later(path)
+        (missing, waited) = inotify.wait_for_paths([path], maxwait=30,
+                                                   naplen=20)
+        self.assertEqual(set(), missing)
+        self.assertLess(waited, 10)
+
+    def test_missing_paths_returned_after_maxwait(self):
+        path = os.path.join(self.tmp, 'never')
+        (missing, waited) = inotify.wait_for_paths([path], maxwait=0.1,
+                                                   naplen=0.05)
+        self.assertEqual(set([path]), missing)
+        self.assertGreaterEqual(waited, 0.1)
+
+    @mock.patch('cloudinit.inotify.Inotify')
+    def test_polls_without_inotify(self, m_inotify):
+        m_inotify.side_effect = inotify.InotifyError('no inotify here')
+        path = os.path.join(self.tmp, 'dev')
+        self._create_later(path)
+        (missing, _waited) = inotify.wait_for_paths([path], maxwait=30,
+                                                    naplen=0.05)
+        self.assertEqual(set(), missing)
+
+# vi: ts=4 expandtab
@@ -6,6 +6,7 @@ from cloudinit.handlers import cloud_config
 from cloudinit.handlers import (CONTENT_START, CONTENT_END)
 
 from cloudinit import helpers as c_helpers
+from cloudinit import mergers
 from cloudinit import util
 
 import collections
@@ -258,4 +259,32 @@ class TestSimpleRun(helpers.ResourceUsingTestCase):
         d = util.mergemanydict([a, b])
         self.assertEqual(c, d)
 
+
+class TestMergePlans(helpers.TestCase):
+
+    def test_same_mergers_built_once(self):
+        parsed = mergers.string_extract_mergers('list(append)+dict()+str()')
+        merger = mergers.construct(parsed)
+        self.assertIs(merger, mergers.construct(
+            mergers.string_extract_mergers('list(append)+dict()+str()')))
+        self.assertIsNot(merger, mergers.construct(
+            mergers.string_extract_mergers('list()+dict()+str()')))
+
+    def test_parsed_mergers_are_copies(self):
+        parsed = mergers.string_extract_mergers('dict(replace)+list()')
+        parsed.append(('str', []))
+        self.assertEqual(
+            [('dict', ['replace']), ('list', [])],
+            mergers.string_extract_mergers('dict(replace)+list()'))
+
+    def test_reused_merger_merges_by_type(self):
+        merger = mergers.construct(mergers.string_extract_mergers(
+            'list(append)+dict(recurse_array)+str()'))
+        for _i in range(2):
+            self.assertEqual(
+                {'a': [1, 2], 'b': 'x', 'c': {'d': 1, 'e': 2}, 'f': 3},
+                merger.merge({'a': [1], 'b': 'x', 'c': {'d': 1}, 'f': 3},
+                             {'a': [2], 'b': 'y', 'c': {'e': 2}, 'f': 4}))
+            self.assertEqual(3, merger.merge(3, 4))
+
 # vi: ts=4 expandtab
@@ -4,6 +4,7 @@ from cloudinit import net
 from cloudinit.net import _natural_sort_key
 from cloudinit.net import cmdline
 from cloudinit.net import eni
+from cloudinit.net import netlink
 from cloudinit.net import netplan
 from cloudinit.net import network_state
 from cloudinit.net import renderers
@@ -22,6 +23,8 @@ import gzip
 import io
 import json
 import os
+import socket
+import struct
 import textwrap
 import yaml
 
@@ -854,7 +857,9 @@ class TestSysConfigRendering(CiTestCase):
     @mock.patch("cloudinit.net.sys_dev_path")
     @mock.patch("cloudinit.net.read_sys_net")
     @mock.patch("cloudinit.net.get_devicelist")
-    def test_default_generation(self, mock_get_devicelist,
+    @mock.patch("cloudinit.net.netlink.dump_links",
+                side_effect=netlink.NetlinkError("no netlink"))
+    def test_default_generation(self, _mock_dump_links, mock_get_devicelist,
                                 mock_read_sys_net,
                                 mock_sys_dev_path):
         tmp_dir = self.tmp_dir()
@@ -1005,7 +1010,9 @@ class TestEniNetRendering(CiTestCase):
     @mock.patch("cloudinit.net.sys_dev_path")
     @mock.patch("cloudinit.net.read_sys_net")
     @mock.patch("cloudinit.net.get_devicelist")
-    def test_default_generation(self, mock_get_devicelist,
+    @mock.patch("cloudinit.net.netlink.dump_links",
+                side_effect=netlink.NetlinkError("no netlink"))
+    def test_default_generation(self, _mock_dump_links, mock_get_devicelist,
                                 mock_read_sys_net,
                                 mock_sys_dev_path):
         tmp_dir = self.tmp_dir()
@@ -1059,7 +1066,9 @@ class TestNetplanNetRendering(CiTestCase):
     @mock.patch("cloudinit.net.sys_dev_path")
     @mock.patch("cloudinit.net.read_sys_net")
     @mock.patch("cloudinit.net.get_devicelist")
-    def test_default_generation(self, mock_get_devicelist,
+    @mock.patch("cloudinit.net.netlink.dump_links",
+                side_effect=netlink.NetlinkError("no netlink"))
+    def test_default_generation(self, _mock_dump_links, mock_get_devicelist,
                                 mock_read_sys_net,
                                 mock_sys_dev_path,
                                 mock_clean_default):
@@ -1211,6 +1220,134 @@ class TestNetplanPostcommands(CiTestCase):
             mock_subp.assert_has_calls(expected)
 
 
+class TestRenderOnlyChanged(CiTestCase):
+    mycfg = {
+        'config': [{"type": "physical", "name": "eth0",
+                    "mac_address": "c0:d6:9f:2c:e8:80",
+                    "subnets": [{"type": "dhcp"}]}],
+        'version': 1}
+
+    def _ns(self):
+        return network_state.parse_net_config_data(self.mycfg,
+                                                   skip_broken=False)
+
+    def test_eni_unchanged_files_not_rewritten(self):
+        tmp_dir = self.tmp_dir()
+        renderer = eni.Renderer(
+            {'eni_path': 'interfaces', 'netrules_path': 'netrules'})
+        expected = [os.path.join(tmp_dir, f)
+                    for f in ('interfaces', 'netrules')]
+        self.assertEqual(expected,
+                         renderer.render_network_state(self._ns(), tmp_dir))
+        self.assertEqual([],
+                         renderer.render_network_state(self._ns(), tmp_dir))
+
+        util.write_file(expected[0], "# changed by hand\n")
+        self.assertEqual(expected[:1],
+                         renderer.render_network_state(self._ns(), tmp_dir))
+
+    @mock.patch.object(netplan.Renderer, '_netplan_generate')
+    @mock.patch.object(netplan.Renderer, '_net_setup_link')
+    def test_netplan_postcmds_skipped_when_unchanged(self, m_setup_link,
+                                                     m_generate):
+        tmp_dir = self.tmp_dir()
+        renderer = netplan.Renderer(
+            {'netplan_path': 'netplan.yaml', 'postcmds': True})
+        self.assertEqual([os.path.join(tmp_dir, 'netplan.yaml')],
+                         renderer.render_network_state(self._ns(), tmp_dir))
+        self.assertEqual(1, m_generate.call_count)
+        self.assertEqual([],
+                         renderer.render_network_state(self._ns(), tmp_dir))
+        self.assertEqual(1, m_generate.call_count)
+        self.assertEqual(1, m_setup_link.call_count)
+
+
+class TestNetworkStateIndexes(CiTestCase):
+    mycfg = {
+        'config': [
+            {'type': 'physical', 'name': 'eth0',
+             'mac_address': 'C0:D6:9F:2C:E8:80', 'subnets': []},
+            {'type': 'physical', 'name': 'eth1',
+             'mac_address': 'c0:d6:9f:2c:e8:81', 'subnets': []},
+            {'type': 'physical', 'name': 'eth2',
+             'mac_address': 'c0:d6:9f:2c:e8:82', 'subnets': []},
+            {'type': 'bond', 'name': 'bond0',
+             'bond_interfaces': ['eth1', 'eth2'],
+             'params': {'bond-mode': 'active-backup'}},
+            {'type': 'vlan', 'name': 'eth0.10', 'vlan_link': 'eth0',
+             'vlan_id': 10},
+            {'type': 'bridge', 'name': 'br0', 'bridge_interfaces': ['eth0']},
+            {'type': 'route', 'destination': '10.0.0.0/8',
+             'gateway': '192.168.1.1'}],
+        'version': 1}
+
+    def setUp(self):
+        super(TestNetworkStateIndexes, self).setUp()
+        self.ns = network_state.parse_net_config_data(self.mycfg,
+                                                      skip_broken=False)
+
+    def test_lookups(self):
+        self.assertEqual('bond0', self.ns.get_interface('bond0')['name'])
+        self.assertIsNone(self.ns.get_interface('eth9'))
+        self.assertEqual(
+            'eth0', self.ns.get_interface_by_mac('c0:d6:9f:2c:e8:80')['name'])
+        self.assertIsNone(self.ns.get_interface_by_mac('00:00:00:00:00:00'))
+        self.assertEqual(
+            ['eth0', 'eth1', 'eth2'],
+            sorted(i['name']
+                   for i in self.ns.iter_interfaces_by_type('physical')))
+        self.assertEqual([], list(self.ns.iter_interfaces_by_type('wifi')))
+
+    def test_iter_linked(self):
+        self.assertEqual(
+            ['eth1', 'eth2'],
+            sorted(i['name'] for i in self.ns.iter_linked('bond0')))
+        self.assertEqual(
+            ['br0', 'eth0.10'],
+            sorted(i['name'] for i in self.ns.iter_linked('eth0')))
+        self.assertEqual(
+            ['eth0.10'],
+            [i['name'] for i in self.ns.iter_linked('eth0',
+                                                    'vlan-raw-device')])
+
+    def test_views_are_read_only(self):
+        iface = self.ns.get_interface('eth0')
+        with self.assertRaises(TypeError):
+            iface['mtu'] = 9000
+        route = list(self.ns.iter_routes())[0]
+        self.assertEqual('10.0.0.0', route['network'])
+        with self.assertRaises(TypeError):
+            route['network'] = '0.0.0.0'
+
+    def test_rendering_leaves_state_unchanged(self):
+        before = [dict(i) for i in self.ns.iter_interfaces()]
+        eni.Renderer()._render_interfaces(self.ns)
+        self.assertEqual(before, list(self.ns.iter_interfaces()))
+
+    def test_netplan_bond_slaves_from_index(self):
+        content = yaml.safe_load(netplan.Renderer()._render_content(self.ns))
+        self.assertEqual(
+            ['eth1', 'eth2'],
+            content['network']['bonds']['bond0']['interfaces'])
+
+
+class TestNetworkStateV2Routes(CiTestCase):
+
+    def test_route_prefix_converted_to_netmask(self):
+        cfg = {'version': 2, 'ethernets': {'eth0': {
+            'addresses': ['10.0.0.2/24'],
+            'routes': [{'to': '10.20.0.0/16', 'via': '10.0.0.1'},
+                       {'to': '192.168.7.0/27', 'via': '10.0.0.1'}]}}}
+        ns = network_state.parse_net_config_data(cfg, skip_broken=False)
+        [subnet] = ns.get_interface('eth0')['subnets']
+        self.assertEqual(
+            [{'address': '10.20.0.0', 'netmask': '255.255.0.0',
+              'gateway': '10.0.0.1'},
+             {'address': '192.168.7.0', 'netmask': '255.255.255.224',
+              'gateway': '10.0.0.1'}],
+            [dict(r) for r in subnet['routes']])
+
+
 class TestEniNetworkStateToEni(CiTestCase):
     mycfg = {
         'config': [{"type": "physical", "name": "eth0",
@@ -1579,6 +1716,10 @@ class TestGetInterfacesByMac(CiTestCase):
         mocks = ('get_devicelist', 'get_interface_mac', 'is_bridge',
                  'interface_has_own_mac', 'is_vlan')
         self.mocks = {}
+        m = mock.patch('cloudinit.net.netlink.dump_links',
+                       side_effect=netlink.NetlinkError("no netlink"))
+        self.addCleanup(m.stop)
+        m.start()
         for n in mocks:
             m = mock.patch('cloudinit.net.' + n,
                            side_effect=getattr(self, '_se_' + n))
@@ -1652,6 +1793,198 @@ class TestGetInterfacesByMac(CiTestCase):
         self.assertEqual('lo', ret[empty_mac])
 
 
+def _rtattr(atype, data):
+    length = 4 + len(data)
+    pad = b'\0' * ((4 - length % 4) % 4)
+    return struct.pack('=HH', length, atype) + data + pad
+
+
+class TestNetlink(CiTestCase):
+
+    def test_dump_links_parses_attributes(self):
+        linkinfo = _rtattr(netlink.IFLA_INFO_KIND, b'vlan\0')
+        body = (struct.pack('=BxHiII', 0, 1, 7, netlink.IFF_UP, 0) +
+                _rtattr(netlink.IFLA_IFNAME, b'eth0.101\0') +
+                _rtattr(netlink.IFLA_ADDRESS, b'\xaa\xbb\xcc\x00\x00\x01') +
+                _rtattr(netlink.IFLA_OPERSTATE, b'\x06') +
+                _rtattr(netlink.IFLA_CARRIER, b'\x01') +
+                _rtattr(netlink.IFLA_LINK, struct.pack('=I', 2)) +
+                _rtattr(netlink.IFLA_LINKINFO | 0x8000, linkinfo))
+        with mock.patch.object(netlink, '_dump', return_value=[body]):
+            [link] = netlink.dump_links()
+        self.assertEqual(
+            {'index': 7, 'name': 'eth0.101', 'flags': netlink.IFF_UP,
+             'address': 'aa:bb:cc:00:00:01', 'mtu': None, 'operstate': 'up',
+             'carrier': 1, 'link': 2, 'master': None, 'kind': 'vlan',
+             'slave_kind': None, 'perm_address': None}, link)
+
+    def test_dump_addresses_parses_attributes(self):
+        body = (struct.pack('=BBBBI', socket.AF_INET, 24, 0x80, 0, 3) +
+                _rtattr(netlink.IFA_ADDRESS, socket.inet_aton('10.0.0.2')) +
+                _rtattr(netlink.IFA_LOCAL, socket.inet_aton('10.0.0.2')) +
+                _rtattr(netlink.IFA_BROADCAST,
+                        socket.inet_aton('10.0.0.255')))
+        with mock.patch.object(netlink, '_dump', return_value=[body]):
+            [addr] = netlink.dump_addresses()
+        self.assertEqual(
+            {'index': 3, 'family': 'inet', 'address': '10.0.0.2',
+             'prefixlen': 24, 'broadcast': '10.0.0.255', 'scope': 'global',
+             'permanent': True, 'label': None}, addr)
+
+
+class TestInventory(CiTestCase):
+
+    links = [
+        {'index': 1, 'name': 'eth0', 'flags': 1,
+         'address': 'aa:aa:00:00:00:01', 'mtu': 1500, 'operstate': 'up',
+         'carrier': 1, 'link': None, 'master': None, 'kind': None,
+         'slave_kind': None, 'perm_address': None},
+        {'index': 2, 'name': 'br0', 'flags': 1,
+         'address': 'aa:aa:00:00:00:02', 'mtu': 1500, 'operstate': 'up',
+         'carrier': 1, 'link': None, 'master': None, 'kind': 'bridge',
+         'slave_kind': None, 'perm_address': None},
+        {'index': 3, 'name': 'eth1', 'flags': 0,
+         'address': 'aa:aa:00:00:00:02', 'mtu': 1500, 'operstate': 'down',
+         'carrier': 0, 'link': None, 'master': 4, 'kind': None,
+         'slave_kind': 'bond', 'perm_address': 'aa:aa:00:00:00:03'}]
+    addresses = [
+        {'index': 1, 'family': 'inet', 'address': '10.0.0.2', 'prefixlen': 24,
+         'broadcast': None, 'scope': 'global', 'permanent': True,
+         'label': 'eth0'}]
+
+    def setUp(self):
+        super(TestInventory, self).setUp()
+        for (name, value) in (('dump_links', self.links),
+                              ('dump_addresses', self.addresses)):
+            m = mock.patch.object(netlink, name,
+                                  return_value=copy.deepcopy(value))
+            self.addCleanup(m.stop)
+            m.start()
+        m = mock.patch('cloudinit.net.interface_has_own_mac',
+                       return_value=True)
+        self.addCleanup(m.stop)
+        self.m_own_mac = m.start()
+
+    def test_netlink_answers_from_memory(self):
+        inventory = net.get_inventory()
+        with mock.patch('cloudinit.net.read_sys_net') as m_read:
+            self.assertEqual({'aa:aa:00:00:00:01': 'eth0',
+                              'aa:aa:00:00:00:03': 'eth1'},
+                             inventory.by_mac())
+            self.assertTrue(inventory.is_up('eth0'))
+            self.assertTrue(inventory.is_bridge('br0'))
+            self.assertEqual(['10.0.0.2'], [
+                a['address'] for a in inventory.addresses('eth0')])
+        self.assertEqual(0, m_read.call_count)
+
+    def test_fields_read_from_sysfs_once(self):
+        inventory = net.get_inventory()
+        inventory.by_mac()
+        inventory.by_mac()
+        self.assertEqual(3, self.m_own_mac.call_count)
+
+    def test_rename_info_downable(self):
+        info = net._get_current_rename_info(inventory=net.get_inventory())
+        self.assertEqual(
+            {'aa:aa:00:00:00:01': {'name': 'eth0', 'up': True,
+                                   'downable': False},
+             'aa:aa:00:00:00:03': {'name': 'eth1', 'up': False,
+                                   'downable': True}}, info)
+
+    def test_fallback_to_sysfs(self):
+        netlink.dump_links.side_effect = netlink.NetlinkError("no netlink")
+        with mock.patch('cloudinit.net.get_devicelist',
+                        return_value=['ens3']):
+            inventory = net.get_inventory()
+        self.assertEqual(['ens3'], inventory.names())
+
+    @mock.patch('cloudinit.net.util.subp')
+    def test_sysfs_addresses_from_ip(self, m_subp):
+        m_subp.return_value = (textwrap.dedent("""\
+            1: lo    inet 127.0.0.1/8 scope host lo\\       valid_lft forever
+            2: ens3    inet 10.0.0.5/24 brd 10.0.0.255 scope global dynamic x
+            2: ens3    inet6 fe80::1/64 scope link \\       valid_lft forever
+            """), '')
+        inventory = net.Inventory({'ens3': {}})
+        self.assertEqual(
+            [{'family': 'inet', 'address': '10.0.0.5', 'prefixlen': 24,
+              'broadcast': '10.0.0.255', 'scope': 'global',
+              'permanent': False, 'label': None},
+             {'family': 'inet6', 'address': 'fe80::1', 'prefixlen': 64,
+              'broadcast': None, 'scope': 'link', 'permanent': True,
+              'label': None}],
+            inventory.addresses('ens3'))
+
+
+class TestRenameInterfaces(CiTestCase):
+
+    current_info = {
+        'aa:aa:00:00:00:01': {'name': 'eth0', 'up': False, 'downable': True},
+        'aa:aa:00:00:00:02': {'name': 'eth1', 'up': True, 'downable': True}}
+    renames = [['aa:aa:00:00:00:01', 'ens3'], ['aa:aa:00:00:00:02', 'ens4']]
+    plan = [
+        ('rename', 'aa:aa:00:00:00:01', 'ens3', ('eth0', 'ens3')),
+        ('down', 'aa:aa:00:00:00:02', 'ens4', ('eth1',)),
+        ('rename', 'aa:aa:00:00:00:02', 'ens4', ('eth1', 'ens4')),
+        ('up', 'aa:aa:00:00:00:02', 'ens4', ('ens4',))]
+
+    def _rename(self, **kwargs):
+        return net._rename_interfaces(
+            self.renames, current_info=copy.deepcopy(self.current_info),
+            **kwargs)
+
+    @mock.patch('cloudinit.net.util.subp')
+    def test_dry_run_returns_plan(self, m_subp):
+        self.assertEqual(self.plan, self._rename(dry_run=True))
+        self.assertEqual(0, m_subp.call_count)
+
+    @mock.patch('cloudinit.net.util.subp')
+    def test_ops_run_as_one_batch(self, m_subp):
+        m_subp.return_value = ('', '')
+        self.assertIsNone(self._rename())
+        m_subp.assert_called_once_with(
+            ['ip', '-force', '-batch', '-'], capture=True,
+            data=('link set dev eth0 name ens3\n'
+                  'link set dev eth1 down\n'
+                  'link set dev eth1 name ens4\n'
+                  'link set dev ens4 up\n'))
+
+    @mock.patch('cloudinit.net.util.subp')
+    def test_batch_errors_aggregated(self, m_subp):
+        m_subp.side_effect = util.ProcessExecutionError(
+            exit_code=1, stderr=('Cannot find device "eth0"\n'
+                                 'Command failed -:1\n'
+                                 'RTNETLINK answers: Device or resource busy\n'
+                                 'Command failed -:3\n'))
+        with self.assertRaises(Exception) as ctx:
+            self._rename()
+        self.assertEqual(
+            "[unknown] Error performing rename('eth0', 'ens3') for"
+            " aa:aa:00:00:00:01, ens3: Cannot find device \"eth0\"\n"
+            "[unknown] Error performing rename('eth1', 'ens4') for"
+            " aa:aa:00:00:00:02, ens4: RTNETLINK answers: Device or"
+            " resource busy", str(ctx.exception))
+        self.assertEqual(1, m_subp.call_count)
+
+    @mock.patch('cloudinit.net.util.subp')
+    def test_without_batch_support_ops_run_singly(self, m_subp):
+        m_subp.side_effect = [
+            util.ProcessExecutionError(exit_code=255,
+                                       stderr='Unknown option "-batch"'),
+            ('', ''), ('', ''), ('', ''), ('', '')]
+        self._rename()
+        self.assertEqual(
+            [mock.call(['ip', 'link', 'set', 'dev', 'eth0', 'name', 'ens3'],
+                       capture=True),
+             mock.call(['ip', 'link', 'set', 'dev', 'eth1', 'down'],
+                       capture=True),
+             mock.call(['ip', 'link', 'set', 'dev', 'eth1', 'name', 'ens4'],
+                       capture=True),
+             mock.call(['ip', 'link', 'set', 'dev', 'ens4', 'up'],
+                       capture=True)],
+            m_subp.call_args_list[1:])
+
+
 class TestInterfacesSorting(CiTestCase):
 
     def test_natural_order(self):
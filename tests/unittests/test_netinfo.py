@@ -0,0 +1,97 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.netinfo"""
+
+import json
+import os
+
+from cloudinit import net
+from cloudinit import netinfo
+from cloudinit import util
+
+from .helpers import CiTestCase, mock, populate_dir
+
+PROC_NET_ROUTE = (
+    "Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask"
+    "\t\tMTU\tWindow\tIRTT\n"
+    "eth0\t00000000\t010200C0\t0003\t0\t0\t100\t00000000\t0\t0\t0\n"
+    "eth0\t000200C0\t00000000\t0001\t0\t0\t0\t00FFFFFF\t0\t0\t0\n")
+PROC_NET_IPV6_ROUTE = (
+    "fd000000000000000000000000000000 40 0000000000000000000000000000"
+    "0000 00 00000000000000000000000000000000 00000100 00000001 00000000"
+    " 00000001     eth0\n"
+    "00000000000000000000000000000000 00 0000000000000000000000000000"
+    "0000 00 fd000000000000000000000000000001 00000400 00000001 00000000"
+    " 00000003     eth0\n")
+
+
+class TestRouteInfo(CiTestCase):
+
+    def setUp(self):
+        super(TestRouteInfo, self).setUp()
+        self.proc_net = self.tmp_dir() + '/'
+        m = mock.patch.object(net, 'PROC_NET', self.proc_net)
+        self.addCleanup(m.stop)
+        m.start()
+
+    def test_read_routes(self):
+        populate_dir(self.proc_net, {'route': PROC_NET_ROUTE,
+                                     'ipv6_route': PROC_NET_IPV6_ROUTE})
+        routes = net.read_routes()
+        self.assertEqual(
+            {'destination': '0.0.0.0', 'gateway': '192.0.2.1',
+             'genmask': '0.0.0.0', 'prefixlen': 0, 'flags': 3, 'ref': 0,
+             'use': 0, 'metric': 100, 'iface': 'eth0'},
+            routes['ipv4'][0])
+        self.assertEqual(24, routes['ipv4'][1]['prefixlen'])
+        self.assertEqual(
+            {'destination': '::', 'gateway': 'fd00::1', 'prefixlen': 0,
+             'flags': 3, 'ref': 1, 'use': 0, 'metric': 1024,
+             'iface': 'eth0'},
+            routes['ipv6'][1])
+
+    def test_no_ipv6_route_file(self):
+        populate_dir(self.proc_net, {'route': PROC_NET_ROUTE})
+        self.assertEqual([], net.read_routes()['ipv6'])
+
+    @mock.patch('cloudinit.netinfo.util.subp')
+    def test_route_info_from_proc(self, m_subp):
+        populate_dir(self.proc_net, {'route': PROC_NET_ROUTE,
+                                     'ipv6_route': PROC_NET_IPV6_ROUTE})
+        routes = netinfo.route_info()
+        self.assertEqual(0, m_subp.call_count)
+        self.assertEqual(['UG', 'U'], [r['flags'] for r in routes['ipv4']])
+        self.assertEqual(['fd00::/64', '::/0'],
+                         [r['destination'] for r in routes['ipv6']])
+        self.assertEqual('192.0.2.1[eth0]', netinfo.getgateway())
+        table = netinfo.route_pformat()
+        self.assertIn('Route IPv4 info', table)
+        self.assertIn('fd00::1', table)
+
+    @mock.patch('cloudinit.netinfo.util.subp')
+    def test_netstat_without_proc(self, m_subp):
+        m_subp.return_value = (
+            "Kernel IP routing table\n"
+            "Destination  Gateway    Genmask  Flags MSS Window irtt Iface\n"
+            "0.0.0.0      10.65.0.1  0.0.0.0  UG      0 0         0 eth0\n",
+            "")
+        routes = netinfo.route_info()
+        m_subp.assert_called_once_with(['netstat', '-rn'])
+        self.assertEqual('10.65.0.1', routes['ipv4'][0]['gateway'])
+        self.assertEqual([], routes['ipv6'])
+
+
+class TestJsonInfo(CiTestCase):
+
+    @mock.patch('cloudinit.netinfo.route_info')
+    @mock.patch('cloudinit.netinfo.netdev_info')
+    def test_write_json_info(self, m_netdev, m_routes):
+        m_netdev.return_value = {'eth0': {'up': True, 'addr': '10.0.0.2'}}
+        m_routes.side_effect = OSError("no routes")
+        # /run/cloud-init may not exist yet
+        path = os.path.join(self.tmp_dir(), 'cloud-init', 'netinfo.json')
+        netinfo.write_json_info(path)
+        self.assertEqual({'netdev': m_netdev.return_value, 'routes': None},
+                         json.loads(util.load_file(path)))
+
+# vi: ts=4 expandtab
@@ -2,13 +2,16 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import os
+
 from cloudinit import reporting
 from cloudinit.reporting import events
 from cloudinit.reporting import handlers
+from cloudinit.reporting import journal
 
 import mock
 
-from .helpers import TestCase
+from .helpers import CiTestCase, TestCase
 
 
 def _fake_registry():
@@ -104,10 +107,12 @@ class TestReportingEvent(TestCase):
         expected = {'event_type': event_type, 'name': name,
                     'description': desc, 'origin': 'cloudinit'}
 
-        # allow for timestamp to differ, but must be present
+        # allow for timestamp and monotonic to differ, but must be present
         as_dict = event.as_dict()
         self.assertIn('timestamp', as_dict)
         del as_dict['timestamp']
+        self.assertIn('monotonic', as_dict)
+        del as_dict['monotonic']
 
         self.assertEqual(expected, as_dict)
 
@@ -249,7 +254,7 @@ class TestReportingEventStack(TestCase):
             [mock.call('myname', 'mydesc')], report_start.call_args_list)
         self.assertEqual(
             [mock.call('myname', 'mydesc', events.status.SUCCESS,
-                       post_files=[])],
+                       post_files=[], start_monotonic=mock.ANY)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
@@ -264,7 +269,8 @@ class TestReportingEventStack(TestCase):
             pass
         self.assertEqual([mock.call(name, desc)], report_start.call_args_list)
         self.assertEqual(
-            [mock.call(name, desc, events.status.FAIL, post_files=[])],
+            [mock.call(name, desc, events.status.FAIL, post_files=[],
+                       start_monotonic=mock.ANY)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
@@ -280,7 +286,8 @@ class TestReportingEventStack(TestCase):
             pass
         self.assertEqual([mock.call(name, desc)], report_start.call_args_list)
         self.assertEqual(
-            [mock.call(name, desc, events.status.WARN, post_files=[])],
+            [mock.call(name, desc, events.status.WARN, post_files=[],
+                       start_monotonic=mock.ANY)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_start_event')
@@ -309,7 +316,8 @@ class TestReportingEventStack(TestCase):
                 child.result = events.status.WARN
 
         report_finish.assert_called_with(
-            "topname", "topdesc", events.status.WARN, post_files=[])
+            "topname", "topdesc", events.status.WARN, post_files=[],
+            start_monotonic=mock.ANY)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
     def test_message_used_in_finish(self, report_finish):
@@ -318,7 +326,7 @@ class TestReportingEventStack(TestCase):
             pass
         self.assertEqual(
             [mock.call("myname", "mymessage", events.status.SUCCESS,
-                       post_files=[])],
+                       post_files=[], start_monotonic=mock.ANY)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
@@ -327,7 +335,7 @@ class TestReportingEventStack(TestCase):
             c.message = "all good"
         self.assertEqual(
             [mock.call("myname", "all good", events.status.SUCCESS,
-                       post_files=[])],
+                       post_files=[], start_monotonic=mock.ANY)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_start_event')
@@ -353,6 +361,15 @@ class TestReportingEventStack(TestCase):
         self.assertEqual(report_start.call_count, 0)
         self.assertEqual(report_finish.call_count, 0)
 
+    @mock.patch('cloudinit.reporting.events.report_finish_event')
+    def test_finish_carries_start_monotonic(self, report_finish):
+        with mock.patch('cloudinit.reporting.events._monotonic',
+                        return_value=42.0):
+            with events.ReportEventStack("myname", "mydesc"):
+                pass
+        self.assertEqual(
+            42.0, report_finish.call_args[1]['start_monotonic'])
+
     def test_reporting_event_has_sane_repr(self):
         myrep = events.ReportEventStack("fooname", "foodesc",
                                         reporting_enabled=True).__repr__()
@@ -365,6 +382,70 @@ class TestReportingEventStack(TestCase):
         self.assertRaises(ValueError, setattr, f, "result", "BOGUS")
 
 
+class TestJournalHandler(CiTestCase):
+
+    def setUp(self):
+        super(TestJournalHandler, self).setUp()
+        self.journal_dir = self.tmp_dir()
+        patcher = mock.patch(
+            'cloudinit.reporting.journal.get_boot_id', return_value='b1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_finish_events_are_journaled(self):
+        handler = handlers.JournalHandler(journal_dir=self.journal_dir)
+        handler.publish_event(
+            events.ReportingEvent(events.START_EVENT_TYPE, 'a', 'desc'))
+        handler.publish_event(
+            events.FinishReportingEvent('a', 'desc', start_monotonic=1.5))
+        path = os.path.join(self.journal_dir, 'b1.json')
+        records = journal.load_journal(path)
+        self.assertEqual(1, len(records))
+        self.assertEqual('a', records[0]['name'])
+        self.assertEqual(1.5, records[0]['start'])
+        self.assertEqual(events.status.SUCCESS, records[0]['result'])
+
+    def test_old_journals_pruned_on_new_boot(self):
+        for num, boot in enumerate(('old1', 'old2')):
+            path = os.path.join(self.journal_dir, boot + '.json')
+            with open(path, 'w') as stream:
+                stream.write('{}\n')
+            os.utime(path, (num, num))
+        handler = handlers.JournalHandler(
+            journal_dir=self.journal_dir, keep=2)
+        handler.publish_event(events.FinishReportingEvent('a', 'desc'))
+        self.assertEqual(['b1.json', 'old2.json'],
+                         sorted(os.listdir(self.journal_dir)))
+
+
+class TestJournalSummary(TestCase):
+
+    def test_summarize_stages_and_modules(self):
+        records = [
+            {'name': 'init-local', 'start': 1.0, 'end': 2.0},
+            {'name': 'init-network', 'start': 3.0, 'end': 5.0},
+            {'name': 'init-network/search-Ec2', 'start': 3.0, 'end': 4.0},
+            {'name': 'init-network/config-ssh', 'start': 4.0, 'end': 4.5},
+            {'name': 'modules-config/config-ntp', 'start': None, 'end': 6.0},
+        ]
+        self.assertEqual(
+            {'stages': {'init-local': 1.0, 'init-network': 2.0},
+             'modules': {'init-network/config-ssh': 0.5},
+             'total': 4.0},
+            journal.summarize(records))
+
+    def test_load_journal_skips_partial_lines(self):
+        with mock.patch('cloudinit.reporting.journal.util.load_file',
+                        return_value='{"name": "a"}\n{"name": "b'):
+            self.assertEqual([{'name': 'a'}], journal.load_journal('x'))
+
+    def test_format_summary_orders_stages(self):
+        summary = {'stages': {'modules-final': 1.0, 'init-local': 2.0},
+                   'modules': {}, 'total': 3.0}
+        out = journal.format_summary(summary)
+        self.assertLess(out.index('init-local'), out.index('modules-final'))
+
+
 class TestStatusAccess(TestCase):
     def test_invalid_status_access_raises_value_error(self):
         self.assertRaises(AttributeError, getattr, events.status, "BOGUS")
@@ -0,0 +1,110 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests related to cloudinit.stages module."""
+
+import threading
+
+from cloudinit import config
+from cloudinit import stages
+
+from .helpers import CiTestCase, mock
+
+
+class FakeCloud(object):
+    def run(self, name, functor, args, freq=None, clear_on_fail=False):
+        return (True, functor(*args))
+
+
+def _mod(handle, resources=None, depends=None):
+    mod = mock.Mock(spec=['handle', 'frequency', 'resources', 'depends'])
+    mod.handle = handle
+    mod.frequency = 'always'
+    mod.resources = resources
+    mod.depends = depends or []
+    return mod
+
+
+class TestGroupModules(CiTestCase):
+
+    def test_sequential_without_parallel(self):
+        mods = [[_mod(None, ['a']), 'a', None, []],
+                [_mod(None, ['b']), 'b', None, []]]
+        self.assertEqual([[mods[0]], [mods[1]]],
+                         list(stages.group_modules(mods)))
+
+    def test_undeclared_modules_split_groups(self):
+        mods = [[_mod(None, ['a']), 'a', None, []],
+                [_mod(None, ['b']), 'b', None, []],
+                [_mod(None), 'c', None, []],
+                [_mod(None, ['d']), 'd', None, []]]
+        self.assertEqual([mods[0:2], [mods[2]], [mods[3]]],
+                         list(stages.group_modules(mods, parallel=True)))
+
+    def test_fixup_module_defaults_to_undeclared(self):
+        mod = config.fixup_module(mock.Mock(spec=['handle']))
+        self.assertIsNone(mod.resources)
+        self.assertEqual([], mod.depends)
+
+
+class TestRunModules(CiTestCase):
+
+    def setUp(self):
+        super(TestRunModules, self).setUp()
+        init = mock.Mock()
+        init.cloudify.return_value = FakeCloud()
+        self.mods = stages.Modules(init)
+        self.mods._cached_cfg = {'module_workers': 4}
+
+    def test_independent_modules_run_concurrently(self):
+        second_started = threading.Event()
+        seen = []
+
+        def first(*_args):
+            # only returns promptly if 'second' runs alongside
+            seen.append(second_started.wait(5))
+
+        def second(*_args):
+            second_started.set()
+
+        mostly_mods = [[_mod(first, ['a']), 'first', None, []],
+                       [_mod(second, ['b']), 'second', None, []]]
+        which_ran, failures = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['first', 'second'], which_ran)
+        self.assertEqual([], failures)
+        self.assertEqual([True], seen)
+
+    def test_shared_resources_and_depends_keep_order(self):
+        order = []
+        lock = threading.Lock()
+
+        def recorder(name):
+            def handle(*_args):
+                with lock:
+                    order.append(name + '-start')
+                threading.Event().wait(0.05)
+                with lock:
+                    order.append(name + '-end')
+            return handle
+
+        mostly_mods = [
+            [_mod(recorder('a'), ['pkgs']), 'a', None, []],
+            [_mod(recorder('b'), ['pkgs']), 'b', None, []],
+            [_mod(recorder('c'), ['c']), 'c', None, []],
+            [_mod(recorder('d'), ['d'], depends=['c']), 'd', None, []]]
+        which_ran, failures = self.mods._run_modules(mostly_mods)
+        self.assertEqual([], failures)
+        self.assertLess(order.index('a-end'), order.index('b-start'))
+        self.assertLess(order.index('c-end'), order.index('d-start'))
+
+    def test_failures_are_collected_in_order(self):
+        def fail(*_args):
+            raise ValueError("broken")
+
+        mostly_mods = [[_mod(fail, ['a']), 'a', None, []],
+                       [_mod(lambda *_a: None, ['b']), 'b', None, []],
+                       [_mod(fail), 'c', None, []]]
+        which_ran, failures = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['a', 'b', 'c'], which_ran)
+        self.assertEqual(['a', 'c'], [name for (name, _e) in failures])
+
+# vi: ts=4 expandtab
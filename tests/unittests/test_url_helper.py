@@ -0,0 +1,132 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import httpretty as hp
+import mock
+import threading
+
+from . import helpers
+
+from cloudinit import url_helper
+
+
+class TestSessionPool(helpers.HttprettyTestCase):
+
+    def test_same_endpoint_shares_session(self):
+        """Urls with the same scheme, host and port share a session."""
+        self.assertIs(
+            url_helper.get_session('http://169.254.169.254/latest/'),
+            url_helper.get_session('http://169.254.169.254:80/other'))
+
+    def test_different_endpoints_get_own_session(self):
+        """Host, port, scheme and ssl details all select the session."""
+        base = url_helper.get_session('https://example.com/a')
+        self.assertIsNot(
+            base, url_helper.get_session('http://example.com/a'))
+        self.assertIsNot(
+            base, url_helper.get_session('https://example.com:8443/a'))
+        self.assertIsNot(
+            base, url_helper.get_session('https://example.org/a'))
+        self.assertIsNot(
+            base, url_helper.get_session('https://example.com/a',
+                                         {'cert_file': '/cert.pem'}))
+        self.assertIs(
+            url_helper.get_session('https://example.com/b',
+                                   {'cert_file': '/cert.pem'}),
+            url_helper.get_session('https://example.com/a',
+                                   {'cert_file': '/cert.pem'}))
+
+    def test_reset_sessions_closes_sessions(self):
+        """reset_sessions closes pooled sessions and forgets them."""
+        session = url_helper.get_session('http://example.com/')
+        with mock.patch.object(session, 'close') as m_close:
+            url_helper.reset_sessions()
+        m_close.assert_called_once_with()
+        self.assertIsNot(
+            session, url_helper.get_session('http://example.com/'))
+        self.assertEqual(1, url_helper.session_stats()['sessions'])
+
+    @hp.activate
+    def test_readurl_uses_pooled_session(self):
+        """readurl sends requests through the pooled session."""
+        url = 'http://example.com/data'
+        hp.register_uri(hp.GET, url, body='stuff', status=200)
+        hp.register_uri(hp.GET, url + '/more', body='more', status=200)
+        session = url_helper.get_session(url)
+        with mock.patch.object(session, 'request',
+                               wraps=session.request) as m_request:
+            url_helper.readurl(url)
+            url_helper.readurl(url + '/more')
+        self.assertEqual(2, m_request.call_count)
+        self.assertEqual(2, url_helper.session_stats()['requests'])
+
+
+class TestWaitForUrlRace(helpers.TestCase):
+
+    def setUp(self):
+        super(TestWaitForUrlRace, self).setUp()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def _readurl(self, url, headers=None, timeout=None, check_status=True):
+        if 'firewalled' in url:
+            # Blocks until the test finishes, like a dropped connection.
+            self.release.wait()
+            raise url_helper.UrlError(ValueError('timed out'), url=url)
+        if 'broken' in url:
+            return url_helper.StringResponse(b'', code=500)
+        return url_helper.StringResponse(b'i-1234')
+
+    @mock.patch('cloudinit.url_helper.readurl')
+    def test_race_returns_first_healthy_url(self, m_readurl):
+        """A blocked url does not hold up a healthy url later in the list."""
+        m_readurl.side_effect = self._readurl
+        status_cb = mock.Mock()
+        exception_cb = mock.Mock()
+        url = url_helper.wait_for_url(
+            urls=['http://firewalled/', 'http://broken/', 'http://good/'],
+            max_wait=1, timeout=1, status_cb=status_cb,
+            exception_cb=exception_cb, race=True)
+        self.assertEqual('http://good/', url)
+        self.assertFalse(self.release.is_set())
+
+    @mock.patch('cloudinit.url_helper.readurl')
+    def test_race_reports_failures(self, m_readurl):
+        """status_cb and exception_cb see every url that failed."""
+        m_readurl.side_effect = self._readurl
+        status_cb = mock.Mock()
+        exception_cb = mock.Mock()
+        url = url_helper.wait_for_url(
+            urls=['http://broken/', 'http://broken/two'], max_wait=0,
+            timeout=1, status_cb=status_cb, exception_cb=exception_cb,
+            race=True)
+        self.assertFalse(url)
+        self.assertEqual(2, status_cb.call_count)
+        self.assertEqual(2, exception_cb.call_count)
+        self.assertIn('empty response [500]', status_cb.call_args[0][0])
+        for (_args, kwargs) in exception_cb.call_args_list:
+            self.assertIsInstance(kwargs['exception'], url_helper.UrlError)
+
+    @mock.patch('cloudinit.url_helper.readurl')
+    def test_race_uses_headers_cb(self, m_readurl):
+        """headers_cb provides the headers for every raced url."""
+        m_readurl.return_value = url_helper.StringResponse(b'i-1234')
+        headers_cb = mock.Mock(return_value={'X-Test': 'yes'})
+        url = url_helper.wait_for_url(
+            urls=['http://one/', 'http://two/'], max_wait=0, timeout=1,
+            headers_cb=headers_cb, race=True)
+        self.assertIn(url, ['http://one/', 'http://two/'])
+        for (_args, kwargs) in m_readurl.call_args_list:
+            self.assertEqual({'X-Test': 'yes'}, kwargs['headers'])
+
+    @mock.patch('cloudinit.url_helper.readurl')
+    def test_sequential_tries_urls_in_order(self, m_readurl):
+        """Without race, urls are tried one after another in order."""
+        m_readurl.side_effect = self._readurl
+        url = url_helper.wait_for_url(
+            urls=['http://broken/', 'http://good/'], max_wait=0, timeout=1)
+        self.assertEqual('http://good/', url)
+        self.assertEqual(
+            ['http://broken/', 'http://good/'],
+            [args[0] for (args, _kw) in m_readurl.call_args_list])
+
+# vi: ts=4 expandtab
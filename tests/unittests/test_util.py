@@ -2,6 +2,7 @@
 
 from __future__ import print_function
 
+import json
 import logging
 import os
 import shutil
@@ -297,6 +298,124 @@ class TestLoadYaml(helpers.TestCase):
                          myobj)
 
 
+class TestIsExactCopy(helpers.TestCase):
+
+    def test_equal_values_of_the_same_types(self):
+        value = {'a': [1, 'b', None, True, {'c': 1.5}]}
+        self.assertTrue(util.is_exact_copy(
+            value, util.native_strings(json.loads(json.dumps(value)))))
+
+    def test_changed_types_detected(self):
+        self.assertFalse(util.is_exact_copy(('a',), ['a']))
+        self.assertFalse(util.is_exact_copy({1: 'a'}, {'1': 'a'}))
+        self.assertFalse(util.is_exact_copy({'a': [1]}, {'a': [1.0]}))
+        self.assertFalse(util.is_exact_copy({'a': 1}, {'a': 1, 'b': 2}))
+
+
+class TestReadConfWithConfd(helpers.CiTestCase):
+
+    def setUp(self):
+        super(TestReadConfWithConfd, self).setUp()
+        self.cfgfile = os.path.join(self.tmp_dir(), 'cloud.cfg')
+        helpers.populate_dir(os.path.dirname(self.cfgfile), {
+            'cloud.cfg': 'a: 1\nb: [1]\n',
+            'cloud.cfg.d/10_b.cfg': 'b: [2]\n'})
+
+    def test_unchanged_config_read_once(self):
+        with mock.patch.object(util, 'load_yaml',
+                               side_effect=util.load_yaml) as m_load:
+            cfg = util.read_conf_with_confd(self.cfgfile)
+            self.assertEqual({'a': 1, 'b': [2]}, cfg)
+            cfg['b'].append(3)
+            self.assertEqual({'a': 1, 'b': [2]},
+                             util.read_conf_with_confd(self.cfgfile))
+        self.assertEqual(2, m_load.call_count)
+
+    def test_changed_files_are_read_again(self):
+        util.read_conf_with_confd(self.cfgfile)
+        util.write_file(self.cfgfile + '.d/20_c.cfg', 'c: 3\n')
+        self.assertEqual({'a': 1, 'b': [2], 'c': 3},
+                         util.read_conf_with_confd(self.cfgfile))
+        util.write_file(self.cfgfile + '.d/10_b.cfg', 'b: [20]\n')
+        self.assertEqual({'a': 1, 'b': [20], 'c': 3},
+                         util.read_conf_with_confd(self.cfgfile))
+
+    def test_missing_config_not_cached(self):
+        missing = self.cfgfile + '.missing'
+        self.assertEqual({}, util.read_conf_with_confd(missing))
+        util.write_file(missing, 'a: 2\n')
+        self.assertEqual({'a': 2}, util.read_conf_with_confd(missing))
+
+    def test_cache_file_used_by_next_process(self):
+        cache_file = self.tmp_path('cloud.cfg.cache.json')
+        util.read_conf_with_confd(self.cfgfile, cache_file=cache_file)
+        self.assertTrue(os.path.exists(cache_file))
+        util.reset_conf_cache()
+        with mock.patch.object(util, 'load_yaml') as m_load:
+            self.assertEqual(
+                {'a': 1, 'b': [2]},
+                util.read_conf_with_confd(self.cfgfile,
+                                          cache_file=cache_file))
+        self.assertEqual(0, m_load.call_count)
+
+    def test_cache_file_checked_by_content(self):
+        cache_file = self.tmp_path('cloud.cfg.cache.json')
+        util.read_conf_with_confd(self.cfgfile, cache_file=cache_file)
+        util.reset_conf_cache()
+        # rewritten with the same content: stats differ, hash matches
+        os.utime(self.cfgfile, (0, 0))
+        with mock.patch.object(util, 'load_yaml') as m_load:
+            util.read_conf_with_confd(self.cfgfile, cache_file=cache_file)
+        self.assertEqual(0, m_load.call_count)
+
+        util.reset_conf_cache()
+        util.write_file(self.cfgfile, 'a: 5\nb: [1]\n')
+        self.assertEqual(
+            {'a': 5, 'b': [2]},
+            util.read_conf_with_confd(self.cfgfile, cache_file=cache_file))
+
+    def test_bad_cache_file_ignored(self):
+        cache_file = self.tmp_path('cloud.cfg.cache.json')
+        util.write_file(cache_file, '{"cfgfile": ')
+        self.assertEqual(
+            {'a': 1, 'b': [2]},
+            util.read_conf_with_confd(self.cfgfile, cache_file=cache_file))
+        util.reset_conf_cache()
+        self.assertEqual(
+            {'a': 1, 'b': [2]},
+            util.read_conf_with_confd(self.cfgfile, cache_file=cache_file))
+
+    def test_malformed_cache_entries_ignored(self):
+        cache_file = self.tmp_path('cloud.cfg.cache.json')
+        for inputs in [[], [[self.cfgfile, None]], [self.cfgfile],
+                       [[self.cfgfile, 'stat', None]],
+                       [[None, None, None]], {'a': 1}]:
+            util.reset_conf_cache()
+            util.write_file(cache_file, json.dumps(
+                {'cfgfile': self.cfgfile, 'inputs': inputs,
+                 'config': {'a': 'cached'}}))
+            self.assertEqual(
+                {'a': 1, 'b': [2]},
+                util.read_conf_with_confd(self.cfgfile,
+                                          cache_file=cache_file))
+
+    def test_cached_strings_are_native(self):
+        util.write_file(self.cfgfile, "output: {all: '| tee -a log'}\n")
+        cache_file = self.tmp_path('cloud.cfg.cache.json')
+        util.read_conf_with_confd(self.cfgfile, cache_file=cache_file)
+        util.reset_conf_cache()
+        cfg = util.read_conf_with_confd(self.cfgfile, cache_file=cache_file)
+        self.assertIsInstance(cfg['output']['all'], str)
+
+    def test_config_json_can_not_hold_not_cached_to_file(self):
+        util.write_file(self.cfgfile, '1: one\n')
+        cache_file = self.tmp_path('cloud.cfg.cache.json')
+        self.assertEqual({1: 'one', 'b': [2]},
+                         util.read_conf_with_confd(self.cfgfile,
+                                                   cache_file=cache_file))
+        self.assertFalse(os.path.exists(cache_file))
+
+
 class TestMountinfoParsing(helpers.ResourceUsingTestCase):
     def test_invalid_mountinfo(self):
         line = ("20 1 252:1 / / rw,relatime - ext4 /dev/mapper/vg0-root"
@@ -450,6 +569,58 @@ class TestReadDMIData(helpers.FilesystemMockingTestCase):
         self._create_sysfs_file(sysfs_key, dmi_value)
         self.assertEqual(expected, util.read_dmi_data(dmi_key))
 
+    def test_sysfs_values_memoized(self):
+        self._create_sysfs_file('product_name', 'first')
+        self.assertEqual('first', util.read_dmi_data('system-product-name'))
+        self._create_sysfs_file('product_name', 'second')
+        self.assertEqual('first', util.read_dmi_data('system-product-name'))
+        util.reset_dmi_data()
+        self.assertEqual('second', util.read_dmi_data('system-product-name'))
+
+    def test_single_dmidecode_dump_without_sysfs(self):
+        dump = "\n".join([
+            "# dmidecode 3.0",
+            "Handle 0x0001, DMI type 1, 27 bytes",
+            "System Information",
+            "\tManufacturer: Joyent",
+            "\tProduct Name: SmartDC HVM",
+            "\tSerial Number: ...",
+            "",
+            "Handle 0x0002, DMI type 3, 21 bytes",
+            "Chassis Information",
+            "\tManufacturer: Joyent",
+            ""])
+        calls = []
+
+        def fake_subp(cmd):
+            calls.append(cmd)
+            return (dump, '')
+
+        self.patched_funcs.enter_context(
+            mock.patch.object(util, 'which', lambda _: '/sbin/dmidecode'))
+        self.patched_funcs.enter_context(
+            mock.patch.object(util, 'subp', fake_subp))
+        self.patched_funcs.enter_context(
+            mock.patch.object(util, '_dmidecode_supported', lambda: True))
+        self.assertEqual('SmartDC HVM',
+                         util.read_dmi_data('system-product-name'))
+        self.assertEqual('', util.read_dmi_data('system-serial-number'))
+        self.assertEqual('Joyent',
+                         util.read_dmi_data('chassis-manufacturer'))
+        self.assertEqual(1, len(calls))
+
+    def test_snapshot_shared_through_cache_file(self):
+        self.patched_funcs.enter_context(
+            mock.patch.object(util, '_DMI_CACHE_FILE', '/run/dmi.json'))
+        self._create_sysfs_file('product_name', 'from-sysfs')
+        self.assertEqual('from-sysfs',
+                         util.read_dmi_data('system-product-name'))
+        self.assertEqual({'system-product-name': 'from-sysfs'},
+                         util.load_json(util.load_file('/run/dmi.json')))
+        util.write_file('/run/dmi.json', '{"system-product-name": "cached"}')
+        util.reset_dmi_data()
+        self.assertEqual('cached', util.read_dmi_data('system-product-name'))
+
 
 class TestMultiLog(helpers.FilesystemMockingTestCase):
 
@@ -518,6 +689,110 @@ class TestMultiLog(helpers.FilesystemMockingTestCase):
         self.assertEqual((log_level, mock.ANY), log.log.call_args[0])
 
 
+class TestMapThreaded(helpers.TestCase):
+
+    def test_results_are_in_item_order(self):
+        """Results are returned in the order of the given items."""
+        self.assertEqual(
+            [0, 1, 4, 9, 16, 25],
+            util.map_threaded(lambda x: x * x, range(6), max_workers=3))
+
+    def test_empty_items(self):
+        self.assertEqual([], util.map_threaded(lambda x: x, []))
+
+    def test_first_failure_is_raised(self):
+        """The exception of the first failing item is re-raised."""
+        def func(item):
+            if item >= 2:
+                raise ValueError("failed on %s" % item)
+            return item
+
+        with self.assertRaisesRegex(ValueError, "failed on 2"):
+            util.map_threaded(func, [0, 1, 2], max_workers=3)
+
+
+BLKID_EXPORT = """DEVNAME=/dev/sda1
+LABEL=cloudimg-rootfs
+UUID=1234-abcd
+TYPE=ext4
+
+DEVNAME=/dev/sr0
+LABEL=config\\ 2
+TYPE=iso9660
+
+DEVNAME=/dev/vdb
+TYPE=vfat
+"""
+
+
+class TestBlkidDevices(helpers.TestCase):
+
+    def setUp(self):
+        super(TestBlkidDevices, self).setUp()
+        util.invalidate_blkid_devices()
+        self.addCleanup(util.invalidate_blkid_devices)
+        for patcher in [mock.patch.object(util, '_BLKID_INVALIDATED', False),
+                        mock.patch('cloudinit.util.subp',
+                                   return_value=(BLKID_EXPORT, ''))]:
+            self.m_subp = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_export_output_indexed_by_device(self):
+        devices = util.blkid_devices()
+        self.assertEqual(['/dev/sda1', '/dev/sr0', '/dev/vdb'], list(devices))
+        self.assertEqual({'LABEL': 'config 2', 'TYPE': 'iso9660'},
+                         devices['/dev/sr0'])
+
+    def test_queries_share_one_scan(self):
+        self.assertEqual(['/dev/sr0'],
+                         util.find_devs_with("TYPE=iso9660"))
+        self.assertEqual(['/dev/sda1'],
+                         util.find_devs_with("LABEL=cloudimg-rootfs"))
+        self.assertEqual(['/dev/sda1'], util.find_devs_with("UUID=1234-abcd"))
+        self.assertEqual([], util.find_devs_with("LABEL=missing"))
+        self.assertEqual(1, self.m_subp.call_count)
+
+    def test_invalidate_and_no_cache_rescan(self):
+        util.find_devs_with("TYPE=vfat")
+        util.invalidate_blkid_devices()
+        util.find_devs_with("TYPE=vfat")
+        util.find_devs_with("TYPE=vfat", no_cache=True)
+        self.assertEqual(3, self.m_subp.call_count)
+        self.assertIn('/dev/null', self.m_subp.call_args[0][0])
+
+    def test_rescan_after_invalidate_bypasses_blkid_cache(self):
+        util.blkid_devices()
+        self.assertNotIn('/dev/null', self.m_subp.call_args[0][0])
+        util.invalidate_blkid_devices()
+        util.blkid_devices()
+        self.assertEqual(['blkid', '-c', '/dev/null', '-oexport'],
+                         self.m_subp.call_args[0][0])
+
+    def test_blkid_probe_bypasses_cache_and_updates_index(self):
+        util.blkid_devices()
+        self.m_subp.return_value = ("DEVNAME=/dev/vdc\nTYPE=ext4\n", '')
+        self.assertEqual({'TYPE': 'ext4'}, util.blkid_probe('/dev/vdc'))
+        self.assertEqual(['blkid', '-c', '/dev/null', '-oexport', '/dev/vdc'],
+                         self.m_subp.call_args[0][0])
+        self.assertIn('/dev/vdc', util.blkid_devices())
+        self.assertEqual(2, self.m_subp.call_count)
+
+    def test_path_probe_updates_index(self):
+        util.blkid_devices()
+        self.m_subp.return_value = (
+            "DEVNAME=/dev/sr1\nLABEL=cidata\nTYPE=iso9660\n", '')
+        self.assertEqual(['/dev/sr1'], util.find_devs_with(path='/dev/sr1'))
+        self.assertEqual(['/dev/sr1'], util.find_devs_with("LABEL=cidata"))
+        self.assertEqual(2, self.m_subp.call_count)
+
+    def test_other_formats_run_blkid(self):
+        self.m_subp.return_value = ("1234-abcd\n", '')
+        self.assertEqual(['1234-abcd'],
+                         util.find_devs_with(oformat='value', tag='UUID'))
+        self.assertEqual(['blkid', '-sUUID', '-ovalue'],
+                         self.m_subp.call_args[0][0])
+
+
 class TestMessageFromString(helpers.TestCase):
 
     def test_unicode_not_messed_up(self):
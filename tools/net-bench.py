@@ -0,0 +1,331 @@
+#!/usr/bin/python3
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Time network_state parsing and rendering on large network configs.
+
+Synthetic configs with the requested number of physical, vlan, bond and
+bridge entries and routes are generated (or a config is read from a file
+or taken from the fixtures in tests/unittests/test_net.py), then parsed
+and rendered in memory by each renderer.  The best time out of --repeat
+runs and the peak memory allocated are reported for every step.  A
+renderer that can not handle part of a generated config (see UNSUPPORTED)
+is measured on a config generated without that part.  Results can be saved
+and later compared against, e.g.:
+
+    tools/net-bench.py --scale 1,2,4 --save /tmp/before.json
+    tools/net-bench.py --scale 1,2,4 --compare /tmp/before.json
+"""
+
+import argparse
+import collections
+import gc
+import json
+import logging
+import sys
+import timeit
+import yaml
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from cloudinit.net import eni
+from cloudinit.net import netplan
+from cloudinit.net import network_state
+from cloudinit.net import sysconfig
+
+RENDERERS = ('eni', 'sysconfig', 'netplan')
+
+# Parts of the generated configs a renderer can not handle; by default that
+# renderer is measured on a config generated without them.
+#  - sysconfig takes every 'bond' interface for a bond slave and fails on
+#    the bond itself
+#  - routes of v2 configs end up without the 'network' key that eni and
+#    sysconfig read
+#  - v2 ethernets without addresses (the bridge ports) get None for subnets,
+#    which sysconfig does not expect
+UNSUPPORTED = {
+    (1, 'sysconfig'): ('bonds',),
+    (2, 'eni'): ('routes',),
+    (2, 'sysconfig'): ('bridges', 'routes'),
+}
+
+
+def _mac(num):
+    return "52:54:%02x:%02x:%02x:%02x" % (
+        (num >> 24) & 0xff, (num >> 16) & 0xff, (num >> 8) & 0xff, num & 0xff)
+
+
+def _addr(num, prefix=10):
+    return "%d.%d.%d.1" % (prefix, (num >> 8) & 0xff, num & 0xff)
+
+
+def generate_v1(physical, vlans, bonds, bridges, routes):
+    """Return a version 1 network config with the given number of entries.
+
+    Bonds and bridges get physical devices of their own (two slaves per
+    bond, one port per bridge) on top of the 'physical' ones, vlans are
+    spread over the 'physical' devices.
+    """
+    config = []
+    num = 0
+    for i in range(physical):
+        config.append({
+            'type': 'physical', 'name': 'eth%d' % i, 'mac_address': _mac(num),
+            'subnets': [{'type': 'static', 'address': _addr(num) + '/24'}]})
+        num += 1
+    for i in range(vlans):
+        config.append({
+            'type': 'vlan', 'name': 'eth%d.%d' % (i % physical,
+                                                  2 + i // physical),
+            'vlan_link': 'eth%d' % (i % physical),
+            'vlan_id': 2 + i // physical,
+            'subnets': [{'type': 'static',
+                         'address': _addr(num, 11) + '/24'}]})
+        num += 1
+    for i in range(bonds):
+        slaves = []
+        for j in range(2):
+            slaves.append('bs%d' % (2 * i + j))
+            config.append({'type': 'physical', 'name': slaves[-1],
+                           'mac_address': _mac(num), 'subnets': []})
+            num += 1
+        config.append({
+            'type': 'bond', 'name': 'bond%d' % i, 'bond_interfaces': slaves,
+            'params': {'bond-mode': 'active-backup', 'bond-miimon': 100},
+            'subnets': [{'type': 'static',
+                         'address': _addr(num, 12) + '/24'}]})
+    for i in range(bridges):
+        port = 'bp%d' % i
+        config.append({'type': 'physical', 'name': port,
+                       'mac_address': _mac(num), 'subnets': []})
+        num += 1
+        config.append({
+            'type': 'bridge', 'name': 'br%d' % i, 'bridge_interfaces': [port],
+            'params': {'bridge_stp': 'off'},
+            'subnets': [{'type': 'static',
+                         'address': _addr(num, 13) + '/24'}]})
+    for i in range(routes):
+        config.append({'type': 'route', 'destination': _addr(i, 20) + '/32',
+                       'gateway': _addr(0)})
+    return {'version': 1, 'config': config}
+
+
+def generate_v2(physical, vlans, bonds, bridges, routes):
+    """Return the version 2 equivalent of generate_v1.
+
+    There are no bonds: network_state hands v2 bonds to handle_bridge,
+    which rejects them.
+    """
+    ethernets = {}
+    config = {'version': 2, 'ethernets': ethernets}
+    num = 0
+    for i in range(physical):
+        ethernets['eth%d' % i] = {
+            'match': {'macaddress': _mac(num)}, 'set-name': 'eth%d' % i,
+            'addresses': [_addr(num) + '/24']}
+        num += 1
+    if physical and routes:
+        ethernets['eth0']['routes'] = [
+            {'to': _addr(i, 20) + '/32', 'via': _addr(0)}
+            for i in range(routes)]
+    if vlans:
+        config['vlans'] = dict(
+            ('eth%d.%d' % (i % physical, 2 + i // physical),
+             {'id': 2 + i // physical, 'link': 'eth%d' % (i % physical),
+              'addresses': [_addr(num + i, 11) + '/24']})
+            for i in range(vlans))
+        num += vlans
+    if bridges:
+        config['bridges'] = {}
+        for i in range(bridges):
+            port = 'bp%d' % i
+            ethernets[port] = {'match': {'macaddress': _mac(num)},
+                               'set-name': port}
+            num += 1
+            config['bridges']['br%d' % i] = {
+                'interfaces': [port], 'parameters': {'stp': False},
+                'addresses': [_addr(num, 13) + '/24']}
+    return config
+
+
+def load_fixture(name):
+    # the fixtures live with the unit tests, import them from the tree
+    sys.path.insert(0, '.')
+    from tests.unittests.test_net import NETWORK_CONFIGS
+    cfg = yaml.safe_load(NETWORK_CONFIGS[name]['yaml'])
+    return cfg.get('network', cfg)
+
+
+def steps(config, renderers=RENDERERS):
+    """Return the [(name, callable)] to measure for config."""
+    state = {}
+
+    def parse():
+        state['ns'] = network_state.parse_net_config_data(config,
+                                                          skip_broken=False)
+
+    def render_eni():
+        eni.Renderer()._render_interfaces(state['ns'])
+
+    def render_sysconfig():
+        sysconfig.Renderer._render_sysconfig('/etc/sysconfig/', state['ns'])
+
+    def render_netplan():
+        netplan.Renderer()._render_content(state['ns'])
+
+    found = [('parse', parse)]
+    renders = {'eni': render_eni, 'sysconfig': render_sysconfig,
+               'netplan': render_netplan}
+    for name in renderers:
+        found.append(('render-' + name, renders[name]))
+    return found
+
+
+def measure(func, repeat):
+    """Return (best seconds, peak KiB or None) for calling func."""
+    best = None
+    for _i in range(repeat):
+        gc.collect()
+        start = timeit.default_timer()
+        func()
+        took = timeit.default_timer() - start
+        if best is None or took < best:
+            best = took
+    peak = None
+    if tracemalloc is not None:
+        # separate run, tracing allocations slows everything down
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    return (best, peak)
+
+
+def run(config, repeat, renderers=RENDERERS):
+    results = {}
+    for (name, func) in steps(config, renderers):
+        try:
+            (seconds, peak) = measure(func, repeat)
+        except Exception as e:
+            results[name] = {'error': '%s: %s' % (type(e).__name__, e)}
+            if name == 'parse':
+                # nothing to render
+                break
+            continue
+        results[name] = {'seconds': seconds, 'peak_kib': peak}
+    return results
+
+
+def format_results(results, baseline=None):
+    lines = ['%-18s %12s %12s' % ('step', 'seconds', 'peak KiB')]
+    if baseline is not None:
+        lines[0] += ' %10s %10s' % ('time x', 'memory x')
+    for name, _func in steps({}):
+        if name not in results:
+            continue
+        cur = results[name]
+        if 'error' in cur:
+            lines.append('%-18s failed: %s' % (name, cur['error']))
+            continue
+        peak = cur['peak_kib']
+        line = '%-18s %12.4f %12s' % (name, cur['seconds'],
+                                      '-' if peak is None else peak)
+        if baseline is not None and 'seconds' in baseline.get(name, {}):
+            old = baseline[name]
+            line += ' %10s %10s' % (_ratio(cur['seconds'], old['seconds']),
+                                    _ratio(peak, old['peak_kib']))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _ratio(cur, old):
+    if not cur or not old:
+        return '-'
+    return '%.2f' % (float(cur) / old)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark network_state parsing and rendering.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--network-data", "-p", type=open, metavar="PATH",
+                        help="benchmark a yaml network config file")
+    source.add_argument("--fixture", metavar="NAME",
+                        help="benchmark a NETWORK_CONFIGS entry of"
+                             " tests/unittests/test_net.py")
+    parser.add_argument("--version", type=int, choices=[1, 2], default=1,
+                        help="version of the generated config")
+    parser.add_argument("--physical", type=int, default=4)
+    parser.add_argument("--vlans", type=int, default=100)
+    parser.add_argument("--bonds", type=int, default=10)
+    parser.add_argument("--bridges", type=int, default=10)
+    parser.add_argument("--routes", type=int, default=100)
+    parser.add_argument("--scale", default="1", metavar="N[,N...]",
+                        help="run once per factor, multiplying the number"
+                             " of generated vlans, bonds, bridges and routes")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="report the best of this many runs")
+    parser.add_argument("--save", metavar="PATH",
+                        help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="compare with a baseline saved by --save")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.physical < 1:
+        parser.error("--physical must be at least 1")
+
+    configs = []
+    if args.network_data:
+        cfg = yaml.safe_load(args.network_data.read())
+        configs.append(('file', cfg.get('network', cfg), RENDERERS))
+    elif args.fixture:
+        configs.append((args.fixture, load_fixture(args.fixture), RENDERERS))
+    else:
+        generate = generate_v1 if args.version == 1 else generate_v2
+        # renderers that can not handle the same parts share a config
+        shapes = collections.OrderedDict()
+        for name in RENDERERS:
+            skipped = UNSUPPORTED.get((args.version, name), ())
+            shapes.setdefault(skipped, []).append(name)
+        for factor in [int(f) for f in args.scale.split(',')]:
+            counts = {'vlans': args.vlans * factor,
+                      'bonds': args.bonds * factor,
+                      'bridges': args.bridges * factor,
+                      'routes': args.routes * factor}
+            for (skipped, renderers) in shapes.items():
+                label = 'v%d x%d' % (args.version, factor)
+                if skipped:
+                    label += ' without %s' % ', '.join(skipped)
+                shape = dict(counts)
+                shape.update((part, 0) for part in skipped)
+                configs.append((label, generate(args.physical, **shape),
+                                renderers))
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+
+    saved = {}
+    for (label, cfg, renderers) in configs:
+        results = run(cfg, args.repeat, renderers)
+        saved[label] = results
+        print("== %s" % label)
+        print(format_results(results, baseline.get(label)
+                             if args.compare else None))
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(saved, fp, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
+
+# vi: ts=4 expandtab